@@ -0,0 +1,112 @@
+import os
+import sys
+import json
+import hashlib
+import argparse
+
+import indicators
+import stats
+
+
+# ----------------- 分析结果缓存 -----------------
+# 每只股票一个 JSON 文件，键由数据文件指纹（大小 + 修改时间）、检测函数及统计代码、持有期共同决定。
+# 数据和代码都未变化时直接复用上次的逐股结果，总大小超过上限时按最近使用时间淘汰。
+
+
+def analysis_signature(indicator_list, horizons):
+    """检测函数集合、参数（即源码）与持有期的摘要，任一变化都会使缓存失效"""
+    digest = hashlib.sha1()
+    digest.update(json.dumps([name for name, _ in indicator_list], ensure_ascii=False).encode('utf-8'))
+    digest.update(json.dumps(list(horizons)).encode('utf-8'))
+    for module in (indicators, stats):
+        with open(module.__file__, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+class AnalysisCache:
+    def __init__(self, cache_dir, signature='', max_mb=512):
+        self.cache_dir = cache_dir
+        self.signature = signature
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, code):
+        return os.path.join(self.cache_dir, f"{code}.json")
+
+    def _key(self, fingerprint):
+        return hashlib.sha1(f"{self.signature}|{fingerprint}".encode('utf-8')).hexdigest()
+
+    def get(self, code, fingerprint):
+        """命中时返回缓存的结果，并刷新其最近使用时间"""
+        if fingerprint is None:
+            return None
+        path = self._path(code)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get('key') != self._key(fingerprint):
+            return None
+        os.utime(path)
+        return entry['result']
+
+    def put(self, code, fingerprint, result):
+        if fingerprint is None:
+            return
+        path = self._path(code)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'key': self._key(fingerprint), 'result': result}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def invalidate(self, codes=None):
+        """删除指定股票（默认全部）的缓存，返回删除条数"""
+        if codes is None:
+            codes = [name[:-5] for name in os.listdir(self.cache_dir) if name.endswith('.json')]
+        removed = 0
+        for code in codes:
+            try:
+                os.remove(self._path(code))
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def evict(self):
+        """总大小超过上限时，按最近使用时间从旧到新删除，返回删除条数"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.json'):
+                continue
+            st = os.stat(os.path.join(self.cache_dir, name))
+            entries.append((st.st_mtime, st.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.cache_dir, name))
+            total -= size
+            removed += 1
+        return removed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="分析结果缓存管理")
+    parser.add_argument('command', choices=['invalidate', 'evict'])
+    parser.add_argument('codes', nargs='*', help="股票代码，不填表示全部")
+    parser.add_argument('--config', default='config.json')
+    args = parser.parse_args()
+
+    with open(args.config, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    if not config.get('cache_dir'):
+        sys.exit("配置中未启用 cache_dir")
+
+    cache = AnalysisCache(config['cache_dir'], max_mb=config.get('cache_max_mb', 512))
+    if args.command == 'invalidate':
+        print(f"已删除 {cache.invalidate(args.codes or None)} 条缓存")
+    else:
+        print(f"已淘汰 {cache.evict()} 条缓存")
@@ -0,0 +1,326 @@
+import os
+import json
+import math
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from panel import Panel, PANEL_COLUMNS
+from storage import stores_raw
+from symbols import DEFAULT_PATH, resolve_master_path
+from indicators import DETECTORS, FeatureFrame
+from stats import MAIN_HORIZON
+
+
+# ----------------- 组合回测 -----------------
+# 把检测函数在全市场的信号（日期 × 股票 的布尔矩阵）当作买入信号，模拟一个资金有限的组合：
+#   第 t 日收盘出信号，t+1 日开盘买入；持有 hold_days 根 K 线后按收盘价卖出（与统计口径一致）。
+#   持仓数不超过 max_positions，单只不超过 max_weight；等权或按波动率倒数分配资金，整手成交。
+#   买入收佣金，卖出收佣金和印花税；T+1：买入当日不能卖出。
+#   开盘涨停买不进，收盘跌停卖不出（顺延到下一交易日），停牌不能交易。
+# 收益与估值用复权价格；涨跌停价（交易所按不复权价格取整到分）和整手股数用不复权价格。
+# 已复权的旧存储与 CSV 没有不复权价格，涨跌停改为比较涨跌幅与幅度限制，并留出取整误差。
+# 逐日推进组合状态，每日内对全部股票做向量运算，不逐股循环。
+
+DEFAULT_PARAMS = {
+    'indicators': None,        # 参与回测的指标，None 为全部，多个指标的信号取并集
+    'initial_cash': 1_000_000.0,
+    'max_positions': 10,
+    'max_weight': 0.2,
+    'sizing': 'equal',         # equal: 等权；volatility: 波动率倒数加权
+    'vol_window': 20,
+    'hold_days': MAIN_HORIZON,
+    'commission': 0.00025,     # 双边佣金费率
+    'min_commission': 5.0,
+    'stamp_duty': 0.0005,      # 卖出印花税
+    'slippage': 0.0,           # 成交价相对滑点
+    'lot': 100,
+}
+
+LIMIT_TOLERANCE = 0.001  # 只有复权价格时判断涨跌停的涨跌幅容差，约为 5 元股票取整到分的误差
+
+
+def price_limit(code, name):
+    """涨跌停幅度：主板 10%，创业板 / 科创板 20%，北交所 30%，ST 5%"""
+    code = str(code)
+    if 'ST' in str(name).upper():
+        return 0.05
+    if code.startswith(('4', '8', '92')):
+        return 0.30
+    if code.startswith(('300', '301', '688', '689')):
+        return 0.20
+    return 0.10
+
+
+def _ffill(arr):
+    """沿日期方向前向填充 NaN"""
+    return pd.DataFrame(arr).ffill().to_numpy()
+
+
+def entry_signals(panel, names=None):
+    """所选指标的信号并集，日期 × 股票 的布尔矩阵"""
+    names = names or list(DETECTORS)
+    # 只整理一次截面、共用一个 FeatureFrame，各检测函数共享滞后、均线、EMA 等派生序列
+    bars, order, lengths = panel.trading_view()
+    features = FeatureFrame(bars)
+    signals = np.zeros((len(bars), len(panel.codes)), dtype=bool)
+    for name in names:
+        signals |= DETECTORS[name].func(features).to_numpy(dtype=bool, na_value=False)
+    signals &= np.arange(len(bars))[:, None] < lengths[None, :]
+    return panel.to_dates(signals, order, lengths)
+
+
+def load_raw_prices(data_dir, panel, start=None, end=None, master_path=DEFAULT_PATH):
+    """
+    与 panel 对齐的不复权开盘、收盘价及各股是否确为不复权价格 (opens, closes, is_raw)。
+    没有任何股票保存不复权价格时返回 None。
+    """
+    is_raw = np.array([stores_raw(data_dir, code) for code in panel.codes], dtype=bool)
+    if not is_raw.any():
+        return None
+    raw = Panel.load(data_dir, panel.codes, ['开盘', '收盘'], start, end, adjust='none', master_path=master_path)
+    return raw.fields['开盘'], raw.fields['收盘'], is_raw
+
+
+def _commission(value, params):
+    return np.where(value > 0, np.maximum(value * params['commission'], params['min_commission']), 0.0)
+
+
+def run_backtest(panel, signals, params=None, raw=None):
+    """
+    raw 为 load_raw_prices 的结果，用于涨跌停判断和整手股数，None 时视为只有复权价格。
+    返回 (equity, trades, summary)：
+      equity   每日 现金、持仓市值、总资产、买入额、卖出额、换手率、持仓数
+      trades   已平仓交易明细
+      summary  收益、回撤、夏普、换手、费用等汇总指标
+    """
+    p = {**DEFAULT_PARAMS, **(params or {})}
+    n_dates, n_codes = len(panel.dates), len(panel.codes)
+    opens = panel.fields['开盘'].astype(np.float64)
+    closes = panel.fields['收盘'].astype(np.float64)
+    amounts = panel.fields['成交额'].astype(np.float64)
+    present = panel.present & ~np.isnan(opens) & ~np.isnan(closes)
+
+    if raw is None:
+        raw_opens, raw_closes, is_raw = opens, closes, np.zeros(n_codes, dtype=bool)
+    else:
+        raw_opens, raw_closes, is_raw = raw[0].astype(np.float64), raw[1].astype(np.float64), raw[2]
+
+    mark = _ffill(closes)  # 停牌日按最近收盘价估值
+    prev_close = np.vstack([np.full((1, n_codes), np.nan), mark[:-1]])
+    raw_prev = np.vstack([np.full((1, n_codes), np.nan), _ffill(raw_closes)[:-1]])
+    limits = np.array([price_limit(code, panel.names[code]) for code in panel.codes])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        limit_up_open = np.where(is_raw, raw_opens >= np.round(raw_prev * (1 + limits), 2) - 1e-6,
+                                 opens / prev_close - 1 >= limits - LIMIT_TOLERANCE)
+        limit_down_close = np.where(is_raw, raw_closes <= np.round(raw_prev * (1 - limits), 2) + 1e-6,
+                                    closes / prev_close - 1 <= LIMIT_TOLERANCE - limits)
+
+    if p['sizing'] == 'volatility':
+        returns = pd.DataFrame(mark).pct_change(fill_method=None)
+        vol = returns.rolling(p['vol_window'], min_periods=max(p['vol_window'] // 2, 2)).std().to_numpy()
+    else:
+        vol = None
+
+    cash = float(p['initial_cash'])
+    shares = np.zeros(n_codes)
+    units = np.zeros(n_codes)  # 按复权价格计的持仓份数，除权除息后市值不跳变
+    cost_basis = np.zeros(n_codes)
+    bars_held = np.zeros(n_codes, dtype=np.int64)
+    entry_row = np.full(n_codes, -1)
+    exit_after = max(p['hold_days'], 2)  # T+1：买入当日为第 1 根，最早第 2 根卖出
+    slot_value = 1.0 / p['max_positions']
+
+    records, trades = [], []
+    fees = {'commission': 0.0, 'stamp_duty': 0.0}
+    equity_prev = cash
+    for t in range(n_dates):
+        held = shares > 0
+        bought = sold = 0.0
+
+        # 开盘：执行前一日的信号
+        free = p['max_positions'] - int(held.sum())
+        if t > 0 and free > 0:
+            candidates = np.flatnonzero(signals[t - 1] & present[t] & ~held & ~limit_up_open[t])
+            if len(candidates):
+                # 信号多于空位时优先成交额大的股票
+                candidates = candidates[np.argsort(-np.nan_to_num(amounts[t - 1, candidates]), kind='stable')][:free]
+                if vol is not None:
+                    inv = 1.0 / vol[t - 1, candidates]
+                    inv = np.where(np.isfinite(inv), inv, np.nan)
+                    fallback = np.nanmean(inv) if np.isfinite(inv).any() else 1.0
+                    inv = np.nan_to_num(inv, nan=fallback)
+                    weights = slot_value * len(candidates) * inv / inv.sum()
+                else:
+                    weights = np.full(len(candidates), slot_value)
+                weights = np.minimum(weights, p['max_weight'])
+
+                price = raw_opens[t, candidates] * (1 + p['slippage'])
+                target = np.minimum(weights * equity_prev, cash)
+                lots = np.floor(target / (price * p['lot']))
+                value = lots * p['lot'] * price
+                adjusted = opens[t, candidates] * (1 + p['slippage'])
+                fee = _commission(value, p)
+                # 资金不足时按顺序成交，余下的放弃
+                spend = np.cumsum(value + fee)
+                ok = (lots > 0) & (spend <= cash)
+                idx = candidates[ok]
+                shares[idx] = lots[ok] * p['lot']
+                units[idx] = value[ok] / adjusted[ok]
+                cost_basis[idx] = value[ok] + fee[ok]
+                bars_held[idx] = 0
+                entry_row[idx] = t
+                bought = float(value[ok].sum())
+                cash -= bought + float(fee[ok].sum())
+                fees['commission'] += float(fee[ok].sum())
+
+        held = shares > 0
+        bars_held[held & present[t]] += 1
+
+        # 收盘：持满 hold_days 根且未跌停的持仓卖出
+        exits = np.flatnonzero(held & present[t] & (bars_held >= exit_after) & ~limit_down_close[t])
+        if len(exits):
+            value = units[exits] * closes[t, exits] * (1 - p['slippage'])
+            fee = _commission(value, p)
+            duty = value * p['stamp_duty']
+            proceeds = value - fee - duty
+            cash += float(proceeds.sum())
+            sold = float(value.sum())
+            fees['commission'] += float(fee.sum())
+            fees['stamp_duty'] += float(duty.sum())
+            for j, net in zip(exits, proceeds):
+                trades.append({
+                    'stock_code': panel.codes[j],
+                    'stock_name': panel.names[panel.codes[j]],
+                    '买入日期': panel.dates[entry_row[j]].strftime('%Y-%m-%d'),
+                    '卖出日期': panel.dates[t].strftime('%Y-%m-%d'),
+                    '持有K线数': int(bars_held[j]),
+                    '股数': int(shares[j]),
+                    '买入成本': float(cost_basis[j]),
+                    '卖出净额': float(net),
+                    '收益率': float(net / cost_basis[j] - 1),
+                })
+            shares[exits] = 0.0
+            units[exits] = 0.0
+            cost_basis[exits] = 0.0
+            entry_row[exits] = -1
+
+        market_value = float(np.nansum(units * mark[t]))
+        equity = cash + market_value
+        records.append({
+            '日期': panel.dates[t],
+            '现金': cash,
+            '持仓市值': market_value,
+            '总资产': equity,
+            '买入额': bought,
+            '卖出额': sold,
+            '换手率': (bought + sold) / equity_prev if equity_prev > 0 else 0.0,
+            '持仓数': int((shares > 0).sum()),
+        })
+        equity_prev = equity
+
+    equity_curve = pd.DataFrame(records)
+    trades = pd.DataFrame(trades, columns=['stock_code', 'stock_name', '买入日期', '卖出日期', '持有K线数', '股数',
+                                           '买入成本', '卖出净额', '收益率'])
+    return equity_curve, trades, summarize(equity_curve, trades, fees, p)
+
+
+def summarize(equity_curve, trades, fees, params):
+    if equity_curve.empty:
+        return {}
+    values = equity_curve['总资产'].to_numpy()
+    daily = np.diff(values) / values[:-1] if len(values) > 1 else np.array([])
+    years = max(len(values) / 252, 1 / 252)
+    total = values[-1] / params['initial_cash'] - 1
+    drawdown = values / np.maximum.accumulate(values) - 1
+    std = daily.std() if len(daily) else 0.0
+    return {
+        'start': equity_curve['日期'].iloc[0].strftime('%Y-%m-%d'),
+        'end': equity_curve['日期'].iloc[-1].strftime('%Y-%m-%d'),
+        'final_equity': float(values[-1]),
+        'total_return': float(total),
+        'annual_return': float((1 + total) ** (1 / years) - 1) if total > -1 else -1.0,
+        'max_drawdown': float(drawdown.min()),
+        'sharpe': float(daily.mean() / std * math.sqrt(252)) if std > 0 else 0.0,
+        'trades': len(trades),
+        'win_rate': float((trades['收益率'] > 0).mean()) if len(trades) else None,
+        'avg_trade_return': float(trades['收益率'].mean()) if len(trades) else None,
+        'avg_daily_turnover': float(equity_curve['换手率'].mean()),
+        'annual_turnover': float(equity_curve['换手率'].sum() / years),
+        'avg_positions': float(equity_curve['持仓数'].mean()),
+        'commission': fees['commission'],
+        'stamp_duty': fees['stamp_duty'],
+    }
+
+
+def _fmt_pct(value):
+    return '-' if value is None else f"{value:.2%}"
+
+
+def write_report(summary, params, output_dir):
+    indicators = '、'.join(params['indicators'] or DETECTORS)
+    lines = [
+        "# 组合回测报告\n",
+        f"- 回测区间：{summary['start']} ~ {summary['end']}",
+        f"- 买入信号：{indicators}",
+        f"- 持有 {params['hold_days']} 根 K 线，最多 {params['max_positions']} 只，"
+        f"{'等权' if params['sizing'] == 'equal' else '波动率倒数加权'}，单只上限 {params['max_weight']:.0%}\n",
+        "| 指标 | 数值 |",
+        "|:---:|:---:|",
+        f"| 期末资产 | {summary['final_equity']:,.0f} |",
+        f"| 总收益 | {_fmt_pct(summary['total_return'])} |",
+        f"| 年化收益 | {_fmt_pct(summary['annual_return'])} |",
+        f"| 最大回撤 | {_fmt_pct(summary['max_drawdown'])} |",
+        f"| 夏普比率 | {summary['sharpe']:.2f} |",
+        f"| 交易次数 | {summary['trades']} |",
+        f"| 胜率 | {_fmt_pct(summary['win_rate'])} |",
+        f"| 平均单笔收益 | {_fmt_pct(summary['avg_trade_return'])} |",
+        f"| 日均换手率 | {_fmt_pct(summary['avg_daily_turnover'])} |",
+        f"| 年化换手率 | {summary['annual_turnover']:.1f} 倍 |",
+        f"| 平均持仓数 | {summary['avg_positions']:.1f} |",
+        f"| 佣金 | {summary['commission']:,.0f} |",
+        f"| 印花税 | {summary['stamp_duty']:,.0f} |",
+    ]
+    filepath = os.path.join(output_dir, "组合回测报告.md")
+    with open(filepath, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+    return filepath
+
+
+def main(config_path='config.json'):
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+
+    params = {**DEFAULT_PARAMS, **config.get('backtest', {})}
+    output_dir = config['output_dir']
+    os.makedirs(output_dir, exist_ok=True)
+
+    master_path = resolve_master_path(config, config_path)
+    started = time.perf_counter()
+    panel = Panel.load(config['data_dir'], config['stock_codes'], PANEL_COLUMNS + ['成交额'],
+                       params.get('start'), params.get('end'), adjust=config.get('adjust'), master_path=master_path)
+    raw = load_raw_prices(config['data_dir'], panel, params.get('start'), params.get('end'), master_path)
+    loaded = time.perf_counter()
+    signals = entry_signals(panel, params['indicators'])
+    equity_curve, trades, summary = run_backtest(panel, signals, params, raw)
+    finished = time.perf_counter()
+    if not summary:
+        print("没有可回测的行情数据")
+        return
+
+    equity_curve.assign(日期=equity_curve['日期'].dt.strftime('%Y-%m-%d')).to_csv(
+        os.path.join(output_dir, "回测净值.csv"), index=False, encoding='utf_8_sig')
+    trades.to_csv(os.path.join(output_dir, "回测交易.csv"), index=False, encoding='utf_8_sig')
+    filepath = write_report(summary, params, output_dir)
+    print(f"加载 {loaded - started:.1f} 秒，回测 {finished - loaded:.1f} 秒；"
+          f"总收益 {_fmt_pct(summary.get('total_return'))}，最大回撤 {_fmt_pct(summary.get('max_drawdown'))}")
+    print(f"回测报告已保存至：{filepath}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="组合回测")
+    parser.add_argument('--config', default='config.json')
+    args = parser.parse_args()
+    main(args.config)
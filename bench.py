@@ -0,0 +1,349 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import importlib
+import subprocess
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import storage
+from instrument import max_rss_mb, peak_rss_mb, reset_peak_rss
+from symbols import sanitize_filename
+
+
+# ----------------- 基准测试 -----------------
+# 用 fake_akshare 确定性生成合成行情（README 中的 CSV 格式），依次计时各热点阶段：
+# CSV 读取与日期解析、列式存储写入 / 读取、六个检测函数、指标统计、报告写出、完整分析、
+# 预测的数据准备与训练、以及经离线替身的下载流程。
+# 每个阶段记录耗时、处理量（股票数、K 线数）、吞吐和该阶段内的进程峰值内存，
+# 结果写成 JSON，可用 --compare 与上一次的结果对比。
+# 峰值内存在 Linux 上通过 /proc/self/clear_refs 重置 VmHWM 后读取，几乎没有开销；
+# 其他系统退回 tracemalloc（只统计 Python 与 numpy 分配的增量，且会明显拖慢计时）。
+
+END_DATE = '20241231'  # 固定结束日期，保证同一参数下生成的数据完全相同
+MAX_YEARS = 30         # fake_akshare 从 1995 年起生成价格路径
+MAX_STOCKS = 5000
+REGRESSION_THRESHOLD = 0.10
+
+
+class StageTimer:
+    """逐阶段累计耗时、处理量与峰值内存"""
+
+    def __init__(self, memory=True):
+        # rss: 进程峰值常驻内存；tracemalloc: 阶段内分配的峰值增量；None: 不统计
+        self.memory = None
+        if memory:
+            self.memory = 'rss' if reset_peak_rss() else 'tracemalloc'
+        self.stages = {}
+
+    @contextmanager
+    def measure(self, name, items=1, rows=0):
+        """计时一段代码并计入 name 阶段，可在代码块内修改产出的 counts['rows'] 等计数"""
+        stage = self.stages.setdefault(name, {'seconds': 0.0, 'items': 0, 'rows': 0, 'peak_mb': 0.0})
+        counts = {'items': items, 'rows': rows}
+        if self.memory == 'rss':
+            reset_peak_rss()
+        elif self.memory == 'tracemalloc':
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        try:
+            yield counts
+        finally:
+            stage['seconds'] += time.perf_counter() - started
+            if self.memory == 'rss':
+                stage['peak_mb'] = max(stage['peak_mb'], peak_rss_mb())
+            elif self.memory == 'tracemalloc':
+                stage['peak_mb'] = max(stage['peak_mb'], (tracemalloc.get_traced_memory()[1] - base) / 2 ** 20)
+            stage['items'] += counts['items']
+            stage['rows'] += counts['rows']
+
+    def report(self):
+        result = {}
+        for name, stage in self.stages.items():
+            seconds = stage['seconds']
+            result[name] = {
+                'seconds': round(seconds, 4),
+                'items': stage['items'],
+                'rows': stage['rows'],
+                'items_per_sec': round(stage['items'] / seconds, 2) if seconds else None,
+                'rows_per_sec': round(stage['rows'] / seconds, 1) if seconds and stage['rows'] else None,
+                'peak_mb': round(stage['peak_mb'], 2) if self.memory else None,
+            }
+        return result
+
+
+def stock_codes(n):
+    return [f"{i:06d}" for i in range(1, n + 1)]
+
+
+def start_date(years):
+    return (pd.Timestamp(END_DATE) - pd.DateOffset(years=years) + pd.Timedelta(days=1)).strftime('%Y%m%d')
+
+
+def synthetic_bars(code, years, seed=0):
+    """README 中 CSV 格式的合成日线（stock_code、stock_name、日期、开盘 ... 换手率）"""
+    from fake_akshare import generate_bars
+
+    df = generate_bars(code, start_date(years), END_DATE, seed).drop(columns=['股票代码'])
+    df.insert(0, 'stock_code', code)
+    df.insert(1, 'stock_name', f"模拟股票{code}")
+    return df[storage.CSV_COLUMNS]
+
+
+def generate_universe(csv_dir, n_stocks, years, seed=0, timer=None):
+    """生成 n_stocks 只股票、years 年的 {code}-{name}.csv，返回代码列表"""
+    if not 1 <= n_stocks <= MAX_STOCKS:
+        raise ValueError(f"股票数应在 1~{MAX_STOCKS} 之间")
+    if not 1 <= years <= MAX_YEARS:
+        raise ValueError(f"年数应在 1~{MAX_YEARS} 之间")
+    timer = timer or StageTimer(memory=False)
+    os.makedirs(csv_dir, exist_ok=True)
+    codes = stock_codes(n_stocks)
+    for code in codes:
+        with timer.measure('generate') as counts:
+            df = synthetic_bars(code, years, seed)
+            path = os.path.join(csv_dir, f"{code}-{sanitize_filename(df['stock_name'].iloc[0])}.csv")
+            df.to_csv(path, index=False, encoding='utf_8_sig')
+            counts['rows'] = len(df)
+    return codes
+
+
+def bench_storage(timer, csv_dir, store_dir, codes):
+    """CSV 读取与日期解析、列式存储写入与读取"""
+    for code in codes:
+        path = storage.find_csv(csv_dir, code)
+        with timer.measure('read_csv') as counts:
+            df = storage.read_csv_bars(path)
+            counts['rows'] = len(df)
+        with timer.measure('store_write', rows=len(df)):
+            storage.save_stock(store_dir, code, df['stock_name'].iloc[0], df)
+        with timer.measure('store_read') as counts:
+            counts['rows'] = len(storage.load_stock(store_dir, code))
+
+
+def bench_indicators(timer, store_dir, codes, report_dir):
+    """各检测函数单独计时（各自新建 FeatureFrame），再按分析流程计时共享特征的统计与报告写出"""
+    from indicators import FeatureFrame, get_indicators
+    from stats import HORIZONS, calculate_indicator_stats, indicator_result
+    generate_report = importlib.import_module('tech-analysis').generate_report
+
+    indicators = get_indicators()
+    os.makedirs(report_dir, exist_ok=True)
+    for code in codes:
+        df = storage.load_stock(store_dir, code)
+        n = len(df)
+        for name, func in indicators:
+            with timer.measure(f"detect:{name}", rows=n):
+                func(FeatureFrame(df))
+        with timer.measure('stats', rows=n):
+            features = FeatureFrame(df)
+            results = [indicator_result(name, calculate_indicator_stats(features, func, HORIZONS))
+                       for name, func in indicators]
+        with timer.measure('report'):
+            generate_report(code, df['stock_name'].iloc[0], results, report_dir)
+
+
+def bench_analysis(timer, store_dir, codes, report_dir, workers):
+    """完整的逐股分析流程（加载、检测、统计、写报告），workers 为进程数"""
+    iter_analysis = importlib.import_module('tech-analysis').iter_analysis
+    with timer.measure('analyze', items=len(codes)) as counts:
+        for result in iter_analysis(codes, store_dir, report_dir, workers=workers):
+            if 'error' in result:
+                raise RuntimeError(result['error'])
+            counts['rows'] += int(storage.read_meta(store_dir, result['code'])['rows'])
+
+
+def bench_predict(timer, store_dir, codes, backend):
+    """按 predict_stock_price 的流程计时数据准备与训练 + 测试集预测，首只股票先不计时地运行一次以导入后端依赖"""
+    from predictors import get_predictor
+    from predicate import prepare_data
+
+    warmup = StageTimer(memory=False)
+    for i, code in enumerate(codes[:1] + codes):
+        measure = warmup.measure if i == 0 else timer.measure
+        df = storage.load_stock(store_dir, code)
+        predictor = get_predictor(backend)
+        with measure('predict_prepare', rows=len(df)):
+            values, labels, n_labeled = prepare_data(df, predictor.horizon)
+        rows = np.arange(predictor.n_input - 1, n_labeled)
+        if len(rows) < 2:
+            continue
+        train_size = int(len(rows) * 0.8)
+        with measure('predict_fit', rows=len(rows)):
+            predictor.fit(values[:n_labeled], labels[:n_labeled], rows[:train_size], rows[train_size:])
+            predictor.predict(values[:n_labeled], rows[train_size:])
+
+
+def bench_download(timer, workdir, codes, years, fake_source, workers):
+    """经离线替身的完整下载流程：限速、重试、清洗、写入列式存储"""
+    import download
+
+    save_path = os.path.join(workdir, 'download')
+    master_path = os.path.join(workdir, 'symbols.json')
+    if os.path.exists(master_path):
+        os.remove(master_path)  # 每次从替身重建代码主表，结果不受上次运行残留的主表影响
+    config = {
+        **download.load_config(os.path.join(workdir, 'missing.json')),
+        'stock_codes': codes,
+        'start_date': start_date(years),
+        'end_date': END_DATE,
+        'save_path': save_path,
+        'workers': workers,
+        'rate_limit': 0,
+        'backoff_base': 0.01,
+        'backoff_max': 0.05,
+        'failure_manifest': os.path.join(workdir, 'download_failures.json'),
+        'data_source': 'fake',
+        'fake_source': fake_source,
+        'symbol_master': master_path,
+    }
+    with timer.measure('download', items=len(codes)) as counts:
+        download.download_and_save(config)
+        saved = storage.list_stocks(save_path)
+        counts['rows'] = sum(int(storage.read_meta(save_path, code)['rows']) for code in saved)
+    return len(codes) - len(saved)
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'commit': commit,
+    }
+
+
+def run_benchmark(stocks=50, years=10, seed=0, workdir=None, stages=None, workers=1, predict_stocks=3,
+                  backend='ridge', download_stocks=20, fake_source=None, memory=True):
+    """
+    执行基准测试并返回结果字典。stages 为要运行的阶段组，默认全部：
+    storage、indicators、analyze、predict、download。
+    """
+    stages = set(stages or ('storage', 'indicators', 'analyze', 'predict', 'download'))
+    own_workdir = workdir is None
+    workdir = workdir or tempfile.mkdtemp(prefix='quantrador-bench-')
+    csv_dir, store_dir = os.path.join(workdir, 'csv'), os.path.join(workdir, 'store')
+    timer = StageTimer(memory)
+    if timer.memory == 'tracemalloc':
+        tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        codes = generate_universe(csv_dir, stocks, years, seed, timer)
+        bench_storage(timer, csv_dir, store_dir, codes)  # 后续阶段都从列式存储读取
+        if 'indicators' in stages:
+            bench_indicators(timer, store_dir, codes, os.path.join(workdir, 'report'))
+        if 'analyze' in stages:
+            bench_analysis(timer, store_dir, codes, os.path.join(workdir, 'report'), workers)
+        if 'predict' in stages:
+            bench_predict(timer, store_dir, codes[:predict_stocks], backend)
+        failed = None
+        if 'download' in stages:
+            failed = bench_download(timer, workdir, codes[:download_stocks], years, fake_source or {}, max(workers, 4))
+    finally:
+        if timer.memory == 'tracemalloc':
+            tracemalloc.stop()
+        if own_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    results = timer.report()
+    if 'storage' not in stages:
+        for name in ('read_csv', 'store_write', 'store_read'):
+            results.pop(name, None)
+    return {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'params': {
+            'stocks': stocks, 'years': years, 'seed': seed, 'workers': workers, 'backend': backend,
+            'predict_stocks': min(predict_stocks, stocks), 'download_stocks': min(download_stocks, stocks),
+            'fake_source': fake_source or {}, 'memory': timer.memory,
+        },
+        'environment': environment(),
+        'elapsed': round(time.perf_counter() - started, 3),
+        'max_rss_mb': max_rss_mb(),
+        'download_failures': failed,
+        'stages': results,
+    }
+
+
+def compare_results(old, new, threshold=REGRESSION_THRESHOLD):
+    """逐阶段比较吞吐，返回 [(阶段, 旧吞吐, 新吞吐, 比值, 是否退化)]，比值 < 1 - threshold 记为退化"""
+    rows = []
+    for name, stage in new['stages'].items():
+        before = old.get('stages', {}).get(name)
+        if not before or not before['items_per_sec'] or not stage['items_per_sec']:
+            continue
+        key = 'rows_per_sec' if stage['rows_per_sec'] and before['rows_per_sec'] else 'items_per_sec'
+        ratio = stage[key] / before[key]
+        rows.append((name, before[key], stage[key], ratio, ratio < 1 - threshold))
+    return rows
+
+
+def print_results(result):
+    print(f"{'阶段':<16} {'耗时(s)':>9} {'股票/s':>10} {'K线/s':>12} {'峰值内存(MB)':>12}")
+    for name, stage in result['stages'].items():
+        print(f"{name:<16} {stage['seconds']:>9.3f} {stage['items_per_sec'] or 0:>10.1f} "
+              f"{stage['rows_per_sec'] or 0:>12.0f} {stage['peak_mb'] if stage['peak_mb'] is not None else '-':>12}")
+    print(f"\n总耗时 {result['elapsed']:.1f} 秒，进程峰值内存 {result['max_rss_mb']} MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="基于合成行情的性能基准测试")
+    parser.add_argument('--stocks', type=int, default=50, help=f"股票数（1~{MAX_STOCKS}）")
+    parser.add_argument('--years', type=int, default=10, help=f"每只股票的年数（1~{MAX_YEARS}）")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--stages', nargs='+', choices=['storage', 'indicators', 'analyze', 'predict', 'download'],
+                        help="只运行指定阶段组，默认全部")
+    parser.add_argument('--workers', type=int, default=1, help="完整分析的进程数")
+    parser.add_argument('--backend', default='ridge', help="预测阶段使用的后端")
+    parser.add_argument('--predict-stocks', type=int, default=3)
+    parser.add_argument('--download-stocks', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.0, help="离线替身每次请求的延迟（秒）")
+    parser.add_argument('--latency-jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--empty-rate', type=float, default=0.0)
+    parser.add_argument('--no-memory', action='store_true', help="不统计峰值内存")
+    parser.add_argument('--workdir', help="保留生成数据的目录，默认使用临时目录并在结束后删除")
+    parser.add_argument('--output', default='bench_result.json')
+    parser.add_argument('--compare', help="与之前的结果 JSON 对比吞吐")
+    args = parser.parse_args(argv)
+
+    fake_source = {'latency': args.latency, 'latency_jitter': args.latency_jitter,
+                   'error_rate': args.error_rate, 'empty_rate': args.empty_rate, 'seed': args.seed}
+    result = run_benchmark(args.stocks, args.years, args.seed, args.workdir, args.stages, args.workers,
+                           args.predict_stocks, args.backend, args.download_stocks, fake_source, not args.no_memory)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print_results(result)
+    print(f"结果已保存至：{args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            old = json.load(f)
+        regressed = False
+        if old.get('params') != result['params']:
+            print(f"\n警告：两次运行的参数不同，吞吐不可直接比较：{old.get('params')}")
+        print(f"\n与 {args.compare} 对比（吞吐比值，< {1 - REGRESSION_THRESHOLD:.2f} 视为退化）：")
+        for name, before, after, ratio, slower in compare_results(old, result):
+            regressed |= slower
+            print(f"{'❌' if slower else '✅'} {name:<16} {before:>12.1f} -> {after:>12.1f}  x{ratio:.2f}")
+        sys.exit(1 if regressed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+import sys
+import json
+import argparse
+import importlib
+import subprocess
+
+from shard import parse_shard
+
+
+# ----------------- 统一命令行入口 -----------------
+# python cli.py download | analyze | scan | backtest | sweep | resample | predict | merge | symbols | bench | check-startup
+# akshare、TensorFlow、scikit-learn、matplotlib 只在用到它们的子命令中导入，
+# check-startup 在独立进程中逐个导入各模块，检查启动耗时与重量级依赖是否被提前导入。
+
+HEAVY_MODULES = ('akshare', 'tensorflow', 'sklearn', 'matplotlib')
+STARTUP_MODULES = ('cli', 'download', 'tech-analysis', 'incremental', 'scan', 'backtest', 'sweep', 'resample',
+                   'predicate', 'predict_batch', 'generate_all_code', 'bench', 'shard')
+STARTUP_BUDGET = 3.0  # 单个模块的导入耗时上限（秒）
+
+
+def cmd_download(args):
+    import download
+    download.main(args.config, args.shard)
+
+
+def cmd_analyze(args):
+    if args.incremental:
+        import incremental
+        incremental.main(args.config)
+    else:
+        importlib.import_module('tech-analysis').main(args.config, args.shard)
+
+
+def cmd_scan(args):
+    import scan
+    scan.main(args.config, args.days, args.include_stale)
+
+
+def cmd_backtest(args):
+    import backtest
+    backtest.main(args.config)
+
+
+def cmd_sweep(args):
+    import sweep
+    sweep.main(args.config, args.restart)
+
+
+def cmd_resample(args):
+    import resample
+    resample.main(args.config, args.timeframe)
+
+
+def cmd_predict(args):
+    import predict_batch
+    predict_batch.main(args.args)
+
+
+def cmd_bench(args):
+    import bench
+    bench.main(args.args)
+
+
+def cmd_merge(args):
+    """合并 --shard 分片运行的部分结果，分片不完整时以非零状态退出"""
+    if args.stage == 'download':
+        import download
+        merged = download.merge_shards(download.load_config(args.config or 'download_config.json'))
+    elif args.stage == 'analyze':
+        merged = importlib.import_module('tech-analysis').merge_shards(args.config or 'config.json')
+    else:
+        import predict_batch
+        merged = predict_batch.merge_shards(args.config or 'config.json')
+    sys.exit(0 if merged else 1)
+
+
+def cmd_symbols(args):
+    import generate_all_code
+    from symbols import SymbolMaster
+
+    master = SymbolMaster(args.master, args.ttl_hours, args.offline)
+    if args.refresh:
+        master.refreshed_at = None  # 视为过期，强制刷新
+    generate_all_code.main(args.output, master)
+
+
+_PROBE = """
+import sys, json, time, importlib
+started = time.perf_counter()
+importlib.import_module(sys.argv[1])
+elapsed = time.perf_counter() - started
+print(json.dumps({'elapsed': elapsed, 'heavy': [m for m in json.loads(sys.argv[2]) if m in sys.modules]}))
+"""
+
+
+def check_startup(modules=STARTUP_MODULES, budget=STARTUP_BUDGET):
+    """在全新的解释器中导入各模块，返回 [(模块, 耗时, 提前导入的重量级依赖, 错误)]"""
+    results = []
+    for module in modules:
+        proc = subprocess.run([sys.executable, '-c', _PROBE, module, json.dumps(HEAVY_MODULES)],
+                              capture_output=True, text=True)
+        if proc.returncode != 0:
+            error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"退出码 {proc.returncode}"
+            results.append((module, None, [], error))
+            continue
+        probe = json.loads(proc.stdout.strip().splitlines()[-1])
+        error = f"超过 {budget} 秒" if probe['elapsed'] > budget else None
+        results.append((module, probe['elapsed'], probe['heavy'], error))
+    return results
+
+
+def cmd_check_startup(args):
+    failed = False
+    for module, elapsed, heavy, error in check_startup(budget=args.budget):
+        status = '✅'
+        if error or heavy:
+            failed = True
+            status = '❌'
+        timing = '-' if elapsed is None else f"{elapsed:.2f}s"
+        detail = '，'.join(filter(None, [error, f"提前导入 {', '.join(heavy)}" if heavy else None]))
+        print(f"{status} {module:<18} {timing:>7}  {detail}")
+    sys.exit(1 if failed else 0)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='cli.py', description="Quantrador 命令行")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    p = subparsers.add_parser('download', help="下载历史行情")
+    p.add_argument('--config', default='download_config.json')
+    p.add_argument('--shard', type=parse_shard, help="只处理第 i 个分片（i/N，按代码哈希切分）")
+    p.set_defaults(func=cmd_download)
+
+    p = subparsers.add_parser('analyze', help="技术指标分析")
+    p.add_argument('--config', default='config.json')
+    p.add_argument('--incremental', action='store_true', help="只推进增量状态，输出新增信号")
+    p.add_argument('--shard', type=parse_shard, help="只处理第 i 个分片（i/N，按代码哈希切分）")
+    p.set_defaults(func=cmd_analyze)
+
+    p = subparsers.add_parser('scan', help="每日全市场信号筛选，只读取最近的 K 线")
+    p.add_argument('--config', default='config.json')
+    p.add_argument('--days', type=int, help="筛选最近几根 K 线，默认取配置 scan_days")
+    p.add_argument('--include-stale', action='store_true', help="包含停牌股票")
+    p.set_defaults(func=cmd_scan)
+
+    p = subparsers.add_parser('backtest', help="基于指标信号的组合回测")
+    p.add_argument('--config', default='config.json')
+    p.set_defaults(func=cmd_backtest)
+
+    p = subparsers.add_parser('sweep', help="检测函数参数扫描，可断点续跑")
+    p.add_argument('--config', default='config.json')
+    p.add_argument('--restart', action='store_true', help="忽略上次的进度重新开始")
+    p.set_defaults(func=cmd_sweep)
+
+    p = subparsers.add_parser('resample', help="由本地日线合成周线、月线或 N 日线并缓存")
+    p.add_argument('--config', default='config.json')
+    p.add_argument('--timeframe', action='append', help="daily、weekly、monthly 或 N 日（如 3d），可重复指定")
+    p.set_defaults(func=cmd_resample)
+
+    p = subparsers.add_parser('predict', help="股价预测，其余参数传给 predict_batch.py", add_help=False)
+    p.set_defaults(func=cmd_predict)
+
+    p = subparsers.add_parser('merge', help="合并各分片的部分结果（汇总报告、失败清单、预测运行记录）")
+    p.add_argument('stage', choices=['download', 'analyze', 'predict'])
+    p.add_argument('--config', help="默认 download 阶段为 download_config.json，其余为 config.json")
+    p.set_defaults(func=cmd_merge)
+
+    p = subparsers.add_parser('symbols', help="刷新代码主表并导出全A股代码清单")
+    p.add_argument('--output', default='./allcode.json')
+    p.add_argument('--master', default='./symbols.json', help="代码主表路径")
+    p.add_argument('--ttl-hours', type=float, default=24, help="主表超过该时长才重新拉取")
+    p.add_argument('--offline', action='store_true', help="只使用本地主表")
+    p.add_argument('--refresh', action='store_true', help="忽略 TTL 立即刷新")
+    p.set_defaults(func=cmd_symbols)
+
+    p = subparsers.add_parser('bench', help="基于合成行情的性能基准测试，其余参数传给 bench.py", add_help=False)
+    p.set_defaults(func=cmd_bench)
+
+    p = subparsers.add_parser('check-startup', help="检查各模块的导入耗时与延迟导入")
+    p.add_argument('--budget', type=float, default=STARTUP_BUDGET, help="单个模块的导入耗时上限（秒）")
+    p.set_defaults(func=cmd_check_startup)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args, rest = parser.parse_known_args(argv)
+    if args.command in ('predict', 'bench'):
+        args.args = rest
+    elif rest:
+        parser.error(f"无法识别的参数：{' '.join(rest)}")
+    if getattr(args, 'incremental', False) and args.shard:
+        parser.error("增量分析暂不支持分片运行")
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
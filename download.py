@@ -1,31 +1,42 @@
 import os
 import json
-import re
-import akshare as ak
+import time
+import random
+import inspect
+import threading
+import pandas as pd
 from tqdm import tqdm
 from datetime import datetime
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
+import storage
+from instrument import NULL_TRACE, RunReport, new_trace
+from shard import load_partials, mark_running, read_partial, report_problems, select_shard, shard_label, write_partial
+from symbols import SymbolMaster, exchange_of, resolve_master_path, sanitize_filename
 
-# ----------------- 文件名清洗函数 -----------------
-def sanitize_filename(name):
-    """去除文件名中的非法字符"""
-    # 替换Windows系统非法字符
-    cleaned = re.sub(r'[\\/*?:"<>|]', '', str(name))
-    # 替换空格和特殊空白字符
-    return cleaned.replace(' ', '_').replace('\u3000', '_')
+
+def akshare_source():
+    """akshare 导入耗时较长，只在真正访问行情接口时导入"""
+    import akshare as ak
+    return ak
 
 
 class StockMapper:
-    def __init__(self):
+    def __init__(self, source=None, master=None, data_dir=None):
+        """master 为代码主表，过期时才通过 source 刷新"""
+        self.source = source
+        self.master = master if master is not None else SymbolMaster()
         self.code_name_map = {}
-        self._init_stock_map()
+        self._init_stock_map(data_dir)
 
-    def _init_stock_map(self):
-        try:
-            df = ak.stock_zh_a_spot_em()
-            self.code_name_map = df.set_index('代码')['名称'].apply(sanitize_filename).to_dict()
-        except Exception as e:
-            print(f"股票代码表初始化失败: {str(e)}")
+    def _init_stock_map(self, data_dir=None):
+        if self.master.is_stale() and not self.master.offline:
+            self.source = self.source or akshare_source()
+        self.master.ensure(self.source, data_dir)
+        self.code_name_map = {code: sanitize_filename(item['name']) for code, item in self.master.symbols.items()}
+        if not self.code_name_map:
+            print("股票代码表初始化失败：代码主表为空")
 
     def get_stock_name(self, code):
         """安全获取股票名称"""
@@ -41,35 +52,312 @@ def generate_filename(code, stock_mapper):
     return f"{code}-{name}.csv"
 
 
-def download_and_save(config):
+class RateLimiter:
+    """线程安全的令牌桶限速器，rate 为每秒请求数，rate<=0 表示不限速"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+
+def get_source(config):
+    """返回行情数据源：akshare 或离线替身"""
+    if config['data_source'] == 'fake':
+        from fake_akshare import FakeAkshare
+        return FakeAkshare(**{'codes': config['stock_codes'], **config['fake_source']})
+    return akshare_source()
+
+
+def download_and_save(config, shard=None):
+    """
+    shard 为 (i, N) 时只下载该分片的股票，失败清单写入 shard_dir 的部分结果而不是 failure_manifest；
+    rerun_failures 同样只重跑该分片上次失败的股票。
+    """
     os.makedirs(config['save_path'], exist_ok=True)
-    stock_mapper = StockMapper()
+    report = RunReport('download', config['save_path'], "下载运行报告" + (f"_{shard_label(shard)}" if shard else ""),
+                       config['instrument'])
+    source = get_source(config)
+    with report.span('symbol_master'):
+        stock_mapper = StockMapper(source, load_symbol_master(config), config['save_path'])
+
+    stock_codes = select_shard(config['stock_codes'], shard)
+    shard_codes = stock_codes
+    if config['rerun_failures']:
+        if shard:
+            # 上次未正常结束的分片整片重跑
+            previous = read_partial(config['shard_dir'], 'download', shard)
+            stock_codes = previous['stock_codes'] if previous and previous['status'] == 'done' else stock_codes
+        else:
+            stock_codes = load_failed_codes(config['failure_manifest'])
+    if shard:
+        mark_running(config['shard_dir'], 'download', shard, config['stock_codes'])
 
     # 获取有效代码列表（自动过滤无效代码）
-    valid_codes = [code for code in config['stock_codes'] if code in stock_mapper.code_name_map]
-    if not valid_codes:
+    valid_codes = [code for code in stock_codes if code in stock_mapper.code_name_map]
+    if not valid_codes and not shard:
         print("警告：配置中的股票代码均无效！")
         return
 
-    for code in tqdm(valid_codes, desc="下载进度"):
-        try:
-            # 下载数据
-            df = retry_download(code, config)
-
-            # 清洗数据
+    limiter = RateLimiter(config['rate_limit'], config['rate_burst'])
+    failures = run_downloads(valid_codes, config, stock_mapper, source, limiter, report) if valid_codes else []
+    if shard:
+        manifest = write_partial(config['shard_dir'], 'download', shard, config['stock_codes'],
+                                 {**failure_manifest(valid_codes, failures),
+                                  'total': sum(code in stock_mapper.code_name_map for code in shard_codes)})
+    else:
+        manifest = write_failure_manifest(config['failure_manifest'], valid_codes, failures)
+    if failures:
+        print(f"\n{len(failures)} 只股票下载失败，清单已写入 {manifest}")
+    if config['instrument']:
+        print(f"运行报告已生成：{report.write()}")
+
+
+def store_raw(config):
+    """列式存储且启用 store_raw 时保存不复权价格与复权因子表"""
+    return config['store_raw'] and config['store_format'] != 'csv'
+
+
+def process_code(code, config, stock_mapper, fetch, deadline=None, trace=NULL_TRACE, fetch_factors=None):
+    """
+    下载、清洗并保存单只股票。保存不复权价格时由 fetch_factors 拉取复权因子表：
+    除权除息总在新的交易日生效，因此只在拉取到新 K 线、或上次因子表拉取失败时请求。
+    """
+    if store_raw(config):
+        fetch_factors = fetch_factors or partial(retry_factors, code, config)
+    if config['incremental']:
+        with trace.span('merge'):  # 读取本地数据、清洗与合并，不含其中的请求
+            df = incremental_download(code, config, stock_mapper, fetch)
+        if df is None:
+            if store_raw(config) and storage.factors_stale(config['save_path'], code):
+                factors = try_fetch_factors(code, config, fetch_factors)
+                if factors is not None:
+                    with trace.span('save'):
+                        storage.save_factors(config['save_path'], code, *factors, default=default_adjust(config))
+            return
+    else:
+        # 下载数据
+        df = fetch()
+
+        # 清洗数据
+        with trace.span('clean'):
             df = clean_dataframe(df, code, stock_mapper)
 
-            # 生成安全文件名
-            filename = generate_filename(code, stock_mapper)
-            save_path = os.path.join(config['save_path'], filename)
+    factors = try_fetch_factors(code, config, fetch_factors) if store_raw(config) else None
 
-            # 保存文件（增加编码处理）
-            df.to_csv(save_path, index=False, encoding='utf_8_sig')
+    # 已被主线程判定超时的任务不再写入
+    if deadline is not None and time.monotonic() > deadline:
+        raise TimeoutError(f"{code} 超过单股超时时间")
+    with trace.span('save'):
+        save_stock_data(df, code, stock_mapper, config, factors)
+    trace.count('rows', len(df))
 
-        except Exception as e:
-            error_msg = f"{code} 处理失败: {str(e)}"
-            print(f"\n[ERROR] {error_msg}")
-            log_error(code, error_msg)
+
+def try_fetch_factors(code, config, fetch_factors):
+    """
+    拉取复权因子表。本地已有因子表时拉取失败不影响 K 线写入：告警并返回 None，
+    沿用旧因子表并标记为待刷新；本地没有因子表时无法解释不复权价格，照常抛出异常。
+    """
+    try:
+        return fetch_factors()
+    except Exception as e:
+        if storage.load_factors(config['save_path'], code) is None:
+            raise
+        tqdm.write(f"{code} 复权因子表拉取失败，沿用本地因子表：{e}")
+        return None
+
+
+def run_downloads(codes, config, stock_mapper, source, limiter, report=None):
+    """
+    线程池并发下载，所有线程共享同一个限速器。
+    单只股票超过 code_timeout 秒未完成即记为超时失败，不再等待。
+    report 为 RunReport 时记录每只股票的分阶段耗时与请求、重试次数。
+    返回失败记录列表。
+    """
+    timeout = config['code_timeout']
+    instrument = report is not None and report.enabled
+    started = {}
+    traces = {}
+    failures = []
+
+    def task(code):
+        started[code] = time.monotonic()
+        traces[code] = trace = new_trace(instrument, code)
+        deadline = started[code] + timeout if timeout else None
+        fetch = partial(retry_download, code, config, source=source, limiter=limiter, deadline=deadline, trace=trace)
+        fetch_factors = partial(retry_factors, code, config, source=source, limiter=limiter, deadline=deadline,
+                                trace=trace)
+        process_code(code, config, stock_mapper, trace.wrap('fetch', fetch), deadline, trace,
+                     trace.wrap('fetch', fetch_factors))
+
+    def record(code, error):
+        if instrument:
+            report.add(traces.get(code), type(error).__name__, key=code)
+        elapsed = time.monotonic() - started[code] if code in started else 0.0
+        failures.append({
+            'code': code,
+            'error': type(error).__name__,
+            'message': str(error),
+            'elapsed': round(elapsed, 3),
+        })
+        tqdm.write(f"[ERROR] {code} 处理失败: {str(error)}")
+
+    pool = ThreadPoolExecutor(max_workers=max(1, config['workers']))
+    futures = {pool.submit(task, code): code for code in codes}
+    pending = set(futures)
+    with tqdm(total=len(codes), desc="下载进度") as pbar:
+        while pending:
+            done, pending = wait(pending, timeout=1.0, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    future.result()
+                    if instrument:
+                        report.add(traces[futures[future]].finish())
+                except Exception as e:
+                    record(futures[future], e)
+                pbar.update(1)
+
+            if timeout:
+                now = time.monotonic()
+                for future in list(pending):
+                    code = futures[future]
+                    if code in started and now - started[code] > timeout:
+                        pending.discard(future)
+                        record(code, TimeoutError(f"{code} 超过单股超时时间"))
+                        pbar.update(1)
+    pool.shutdown(wait=False, cancel_futures=True)
+    return sorted(failures, key=lambda item: item['code'])
+
+
+def failure_manifest(codes, failures):
+    return {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'total': len(codes),
+        'failed': len(failures),
+        'stock_codes': [item['code'] for item in failures],
+        'failures': failures,
+    }
+
+
+def write_failure_manifest(path, codes, failures):
+    """写入失败清单（JSON），stock_codes 字段可直接用于重跑，返回路径"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(failure_manifest(codes, failures), f, ensure_ascii=False, indent=2)
+    return path
+
+
+def merge_shards(config):
+    """合并各分片的失败清单写入 failure_manifest；分片不完整时返回 False"""
+    partials, problems = load_partials(config['shard_dir'], 'download', config['stock_codes'])
+    if not report_problems('download', problems, "python cli.py download"):
+        return False
+    failures = sorted((item for partial in partials for item in partial['failures']), key=lambda item: item['code'])
+    manifest = failure_manifest([], failures)
+    manifest['total'] = sum(partial['total'] for partial in partials)
+    with open(config['failure_manifest'], 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    print(f"已合并 {len(partials)} 个分片：共 {manifest['total']} 只，失败 {len(failures)} 只，"
+          f"失败清单：{config['failure_manifest']}")
+    return True
+
+
+def load_failed_codes(path):
+    """读取上次运行的失败清单"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)['stock_codes']
+    except FileNotFoundError:
+        print(f"警告: 失败清单 {path} 不存在")
+        return []
+
+
+def load_existing(code, config):
+    """读取本地已有数据，缺失、校验失败或价格口径（不复权 / 已复权）与配置不符时返回 None"""
+    save_path = config['save_path']
+    try:
+        if storage.has_stock(save_path, code):
+            if not storage.validate_stock(save_path, code):
+                return None
+            if ('adjust' in storage.read_meta(save_path, code)) != store_raw(config):
+                return None
+        df = storage.load_stock(save_path, code, adjust='none' if store_raw(config) else None)
+    except Exception:
+        return None
+    if df is None or df.empty or not df['日期'].is_monotonic_increasing:
+        return None
+    return df
+
+
+def incremental_download(code, config, stock_mapper, fetch=None):
+    """
+    增量下载：从本地最后一个交易日开始请求，追加并按日期去重。
+    本地数据缺失、校验失败，或重叠日的收盘价与本地不一致（复权因子变化）时回退为全量下载。
+    返回 None 表示本地已是最新。
+    """
+    fetch = fetch or partial(retry_download, code, config)
+    existing = load_existing(code, config)
+    if existing is None:
+        return clean_dataframe(fetch(), code, stock_mapper)
+
+    last_date = existing['日期'].iloc[-1]
+    if last_date >= pd.Timestamp(config['end_date']):
+        return None
+
+    new_df = fetch(start_date=last_date.strftime('%Y%m%d'))
+    if new_df is None or new_df.empty:
+        return None
+    new_df = clean_dataframe(new_df, code, stock_mapper)
+    new_df['日期'] = pd.to_datetime(new_df['日期'])
+
+    overlap = new_df.loc[new_df['日期'] == last_date, '收盘']
+    if not overlap.empty and abs(float(overlap.iloc[0]) - float(existing['收盘'].iloc[-1])) > 1e-3:
+        tqdm.write(f"{code} 复权价格已变化，重新全量下载")
+        return clean_dataframe(fetch(), code, stock_mapper)
+    if (new_df['日期'] > last_date).sum() == 0:
+        return None
+
+    merged = pd.concat([existing, new_df[existing.columns.intersection(new_df.columns)]], ignore_index=True)
+    merged = merged.drop_duplicates(subset='日期', keep='last').sort_values('日期').reset_index(drop=True)
+    return merged
+
+
+def save_stock_data(df, code, stock_mapper, config, factors=None):
+    """
+    按配置的存储格式保存，csv_export 为真时额外导出兼容 CSV。
+    store_raw 时 df 为不复权价格，factors 为新拉取的复权因子表，None 表示沿用旧因子表并标记待刷新。
+    """
+    if config['store_format'] == 'csv':
+        save_path = os.path.join(config['save_path'], generate_filename(code, stock_mapper))
+        old_path = storage.find_csv(config['save_path'], code, config['symbol_master'])
+        df.to_csv(save_path, index=False, encoding='utf_8_sig')
+        if old_path and os.path.abspath(old_path) != os.path.abspath(save_path):
+            os.remove(old_path)
+        return
+
+    raw = store_raw(config)
+    storage.save_stock(config['save_path'], code, stock_mapper.get_stock_name(code), df, raw=raw)
+    if factors is not None:
+        storage.save_factors(config['save_path'], code, *factors, default=default_adjust(config))
+    elif raw:
+        storage.mark_factors_stale(config['save_path'], code)
+    if config['csv_export']:
+        storage.export_csv(config['save_path'], code, config['csv_path'] or config['save_path'])
 
 
 def clean_dataframe(df, code, stock_mapper):
@@ -95,56 +383,143 @@ def load_config(config_path='download_config.json'):
         "end_date": datetime.now().strftime("%Y%m%d"),
         "save_path": "./stock_data",
         "adjust_type": "hfq",
-        "period": "daily"
+        "store_raw": True,  # 列式存储保存不复权价格与复权因子表，读取时按 adjust_type 复权
+        "period": "daily",
+        "store_format": "npy",  # npy: 列式内存映射存储；csv: 旧版每股一个 CSV
+        "csv_export": False,
+        "csv_path": None,
+        "incremental": False,  # 只下载本地最后日期之后的数据
+        "workers": 4,  # 并发下载线程数
+        "rate_limit": 5.0,  # 全局每秒请求数上限，<=0 表示不限速
+        "rate_burst": 5,
+        "retries": 3,
+        "backoff_base": 1.0,  # 指数退避基数（秒），实际等待为 [0, base*2^n] 内的随机值
+        "backoff_max": 30.0,
+        "code_timeout": 300,  # 单只股票超时（秒），0 表示不限
+        "failure_manifest": "download_failures.json",
+        "rerun_failures": False,  # 只重跑失败清单中的股票
+        "data_source": "akshare",  # akshare 或 fake（离线替身）
+        "fake_source": {},
+        "symbol_master": "./symbols.json",  # 代码主表
+        "symbol_ttl_hours": 24,  # 主表超过该时长才重新拉取
+        "symbol_offline": False,  # 只使用本地主表，不访问接口
+        "instrument": False,  # 写出分阶段耗时、请求 / 重试计数与峰值内存的运行报告
+        "shard_dir": "./shards"  # 分片运行时部分结果的共享目录
     }
 
     try:
         with open(config_path, 'r', encoding='utf-8') as f:
-            user_config = json.load(f)
-        return {**default_config, **user_config}
+            config = {**default_config, **json.load(f)}
     except FileNotFoundError:
         print(f"警告: 配置文件 {config_path} 不存在，使用默认配置")
-        return default_config
+        config = default_config
     except Exception as e:
         print(f"配置读取失败: {str(e)}")
         exit(1)
+    # 主表相对路径按配置文件所在目录解析，与分析配置中的 symbol_master 指向同一个文件
+    config['symbol_master'] = resolve_master_path(config, config_path)
+    return config
 
 
-def get_all_a_stock():
-    """获取全量A股代码"""
-    try:
-        df = ak.stock_zh_a_spot_em()
-        return df['代码'].tolist()
-    except Exception as e:
-        print(f"获取股票列表失败: {str(e)}")
-        return []
+def load_symbol_master(config):
+    return SymbolMaster(config['symbol_master'], config['symbol_ttl_hours'], config['symbol_offline'])
+
+
+def get_all_a_stock(source=None, master=None):
+    """获取全量A股代码（来自代码主表，过期时刷新）"""
+    master = master if master is not None else SymbolMaster()
+    if master.is_stale() and not master.offline:
+        source = source or akshare_source()
+    return master.ensure(source).codes()
+
+
+def backoff_delay(attempt, base, cap):
+    """带全抖动的指数退避时间"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
 
+def default_adjust(config):
+    """读取时默认的复权方式：adjust_type 为空表示不复权"""
+    return config['adjust_type'] or 'none'
 
-def retry_download(code, config, retries=3):
-    """带重试的数据下载"""
+
+def parse_factors(df):
+    """新浪复权因子表 -> (变化日期, 后复权因子)，按日期升序"""
+    if df is None or df.empty:
+        raise ValueError("复权因子表为空")
+    df = df.assign(date=pd.to_datetime(df['date'])).sort_values('date')
+    return df['date'].to_numpy(dtype='datetime64[ns]'), df['hfq_factor'].astype(float).to_numpy()
+
+
+def retry_factors(code, config, retries=None, source=None, limiter=None, deadline=None, trace=NULL_TRACE):
+    """带重试地拉取后复权因子表（空表视为失败重试），返回 (变化日期, 因子)"""
+    source = source or akshare_source()
+    return retry_request(code, config, lambda timeout: parse_factors(with_timeout(source.stock_zh_a_daily, timeout)(
+        symbol=exchange_of(code).lower() + code,
+        end_date=config['end_date'],
+        adjust='hfq-factor'
+    )), retries, limiter, deadline, trace)
+
+
+def retry_download(code, config, retries=None, start_date=None, source=None, limiter=None, deadline=None,
+                   trace=NULL_TRACE):
+    """
+    带重试的数据下载，start_date 为空时使用配置中的起始日期。
+    保存不复权价格（store_raw）时请求不复权行情，否则按 adjust_type 请求。
+    """
+    source = source or akshare_source()
+    return retry_request(code, config, lambda timeout: with_timeout(source.stock_zh_a_hist, timeout)(
+        symbol=code,
+        period=config['period'],
+        start_date=start_date or config['start_date'],
+        end_date=config['end_date'],
+        adjust='' if store_raw(config) else config['adjust_type']
+    ), retries, limiter, deadline, trace)
+
+
+def with_timeout(func, timeout):
+    """接口支持 timeout 参数（如 ak.stock_zh_a_hist）时传入剩余时间，使单次请求不会越过单股截止时间"""
+    if timeout is None or 'timeout' not in inspect.signature(func).parameters:
+        return func
+    return partial(func, timeout=timeout)
+
+
+def retry_request(code, config, request, retries=None, limiter=None, deadline=None, trace=NULL_TRACE):
+    """
+    带重试地执行一次请求 request(timeout)，timeout 为距 deadline 的剩余秒数（无 deadline 时为 None）。
+    每次请求前从限速器取令牌，失败后按指数退避加抖动等待，超过 deadline 不再重试。
+    trace 记录限速等待、退避等待的耗时与请求、重试次数。
+    """
+    retries = retries or config['retries']
     for i in range(retries):
+        if deadline is not None and time.monotonic() > deadline:
+            raise TimeoutError(f"{code} 超过单股超时时间")
+        if limiter is not None:
+            with trace.span('rate_wait'):
+                limiter.acquire()
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= 0:
+            raise TimeoutError(f"{code} 超过单股超时时间")
+        trace.count('requests')
         try:
-            df = ak.stock_zh_a_hist(
-                symbol=code,
-                period=config['period'],
-                start_date=config['start_date'],
-                end_date=config['end_date'],
-                adjust=config['adjust_type']
-            )
-            return df
+            return request(remaining)
         except Exception as e:
             if i == retries - 1:
                 raise e
-            print(f"第{i + 1}次重试 {code}...")
+            delay = backoff_delay(i, config['backoff_base'], config['backoff_max'])
+            if deadline is not None:
+                delay = min(delay, max(0.0, deadline - time.monotonic()))
+            tqdm.write(f"第{i + 1}次重试 {code}，等待 {delay:.1f} 秒...")
+            trace.count('retries')
+            with trace.span('backoff'):
+                time.sleep(delay)
 
 
-def log_error(code, message):
-    """错误日志记录"""
-    with open("download_errors.log", "a") as f:
-        f.write(f"{datetime.now()} | {code} | {message}\n")
+def main(config_path='download_config.json', shard=None):
+    config = load_config(config_path)
+    print("有效配置参数:", json.dumps(config, indent=2, ensure_ascii=False))
+    download_and_save(config, shard)
 
 
 if __name__ == "__main__":
-    config = load_config()
-    print("有效配置参数:", json.dumps(config, indent=2, ensure_ascii=False))
-    download_and_save(config)
+    main()
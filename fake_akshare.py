@@ -0,0 +1,149 @@
+import time
+import zlib
+import random
+import threading
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+
+# ----------------- 离线 akshare 替身 -----------------
+# 提供与 ak.stock_zh_a_hist / ak.stock_zh_a_spot_em / ak.stock_zh_a_daily（复权因子）相同签名的接口，
+# 行情由股票代码确定性生成，可配置延迟、延迟抖动、失败率和空结果率，用于离线调试下载流程和基准测试。
+# 生成的价格为不复权价格，约每年一次除权除息；adjust 为 qfq / hfq 时按后复权因子换算。
+
+ORIGIN_DATE = '19950101'
+
+
+def _code_seed(code, seed):
+    return (zlib.crc32(str(code).encode('utf-8')) + seed) % (2 ** 32)
+
+
+@lru_cache(maxsize=8)
+def business_days(end_date):
+    """ORIGIN_DATE 至 end_date 的工作日（与 pd.bdate_range 相同），返回 (datetime64[D] 数组, YYYY-MM-DD 字符串数组)"""
+    days = np.arange(np.datetime64(pd.Timestamp(ORIGIN_DATE).date()),
+                     np.datetime64(pd.Timestamp(end_date).date()) + 1, dtype='datetime64[D]')
+    days = days[np.is_busday(days)]
+    return days, np.datetime_as_string(days, unit='D').astype(object)
+
+
+def generate_factors(code, end_date, seed=0):
+    """
+    截至 end_date 的后复权因子表 (变化日期 datetime64[D], 因子)，首行为 ORIGIN_DATE、因子 1.0。
+    除权日与幅度由代码确定性生成，与请求区间无关。
+    """
+    all_dates, _ = business_days(end_date)
+    rng = np.random.default_rng(_code_seed(f"{code}:factor", seed))
+    positions = np.cumsum(rng.integers(200, 300, 200))  # 独立的随机数流，不影响价格路径
+    ratios = 1 + rng.uniform(0.005, 0.06, len(positions))
+    keep = positions < len(all_dates)
+    return (np.r_[all_dates[:1], all_dates[positions[keep]]],
+            np.r_[1.0, np.cumprod(ratios[keep])])
+
+
+def generate_bars(code, start_date, end_date, seed=0, adjust=''):
+    """
+    生成 akshare 格式的日线数据，adjust 为 ''（不复权）、qfq 或 hfq。
+    同一代码的价格路径从 ORIGIN_DATE 开始固定生成后再截取，保证不同区间请求的重叠部分一致。
+    """
+    all_dates, labels = business_days(end_date)
+    n = len(all_dates)
+    rng = np.random.default_rng(_code_seed(code, seed))
+
+    returns = rng.normal(0.0003, 0.02, n)
+    close = 10.0 * np.exp(np.cumsum(returns))
+    prev_close = np.concatenate([[close[0]], close[:-1]])
+    open_ = prev_close * (1 + rng.normal(0, 0.005, n))
+    high = np.maximum(open_, close) * (1 + rng.uniform(0, 0.02, n))
+    low = np.minimum(open_, close) * (1 - rng.uniform(0, 0.02, n))
+    volume = rng.integers(10_000, 500_000, n)
+
+    df = pd.DataFrame({
+        '日期': labels,
+        '股票代码': str(code),
+        '开盘': open_.round(2),
+        '收盘': close.round(2),
+        '最高': high.round(2),
+        '最低': low.round(2),
+        '成交量': volume,
+        '成交额': (volume * close * 100).round(1),
+        '振幅': ((high - low) / prev_close * 100).round(2),
+        '涨跌幅': ((close / prev_close - 1) * 100).round(2),
+        '涨跌额': (close - prev_close).round(2),
+        '换手率': rng.uniform(0.1, 8.0, n).round(2),
+    })
+    if adjust in ('qfq', 'hfq'):
+        factor_dates, factors = generate_factors(code, end_date, seed)
+        scale = factors[np.searchsorted(factor_dates, all_dates, side='right') - 1]
+        if adjust == 'qfq':
+            scale = scale / factors[-1]
+        for col in ('开盘', '收盘', '最高', '最低', '涨跌额'):
+            df[col] = (df[col] * scale).round(2)
+    return df[all_dates >= np.datetime64(pd.Timestamp(start_date).date())].reset_index(drop=True)
+
+
+class FakeAkshare:
+    def __init__(self, codes=None, latency=0.0, error_rate=0.0, seed=0, latency_jitter=0.0, empty_rate=0.0):
+        """
+        codes: 股票池，默认 000001~000100
+        latency: 每次请求的模拟延迟（秒）
+        error_rate: 每次请求随机失败的概率
+        latency_jitter: 在 latency 之上随机附加 [0, latency_jitter] 秒
+        empty_rate: 行情请求返回空表的概率（akshare 被限流时的表现）
+        """
+        self.codes = [str(c) for c in codes] if codes else [f"{i:06d}" for i in range(1, 101)]
+        self.latency = latency
+        self.error_rate = error_rate
+        self.latency_jitter = latency_jitter
+        self.empty_rate = empty_rate
+        self.seed = seed
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _request(self, timeout=None):
+        """模拟一次请求，返回本次是否应返回空表；延迟超过 timeout 时等待 timeout 秒后超时失败"""
+        with self._lock:
+            self.calls += 1
+            failed = self._rng.random() < self.error_rate
+            # 未启用的选项不消耗随机数，同一 seed 下的失败序列与旧版一致
+            empty = bool(self.empty_rate) and self._rng.random() < self.empty_rate
+            delay = self.latency + (self._rng.uniform(0, self.latency_jitter) if self.latency_jitter else 0.0)
+        if timeout is not None and delay > timeout:
+            time.sleep(max(timeout, 0.0))
+            raise TimeoutError("模拟请求超时")
+        if delay:
+            time.sleep(delay)
+        if failed:
+            raise ConnectionError("模拟网络错误")
+        return empty
+
+    def stock_zh_a_spot_em(self):
+        self._request()
+        return pd.DataFrame({
+            '代码': self.codes,
+            '名称': [f"模拟股票{code}" for code in self.codes],
+        })
+
+    def stock_zh_a_hist(self, symbol, period='daily', start_date=ORIGIN_DATE, end_date='20500101', adjust='',
+                        timeout=None):
+        if self._request(timeout) or str(symbol) not in self.codes:
+            return pd.DataFrame()
+        return generate_bars(symbol, start_date, end_date, self.seed, adjust)
+
+    def stock_zh_a_daily(self, symbol, start_date=ORIGIN_DATE, end_date='20500101', adjust=''):
+        """只支持复权因子：adjust 为 hfq-factor 或 qfq-factor，symbol 带交易所前缀（如 sz000001），按日期倒序返回"""
+        if adjust not in ('hfq-factor', 'qfq-factor'):
+            raise ValueError(f"离线替身不支持 adjust={adjust!r}")
+        code = str(symbol)[2:]
+        if self._request() or code not in self.codes:
+            return pd.DataFrame()
+        factor_dates, factors = generate_factors(code, end_date, self.seed)
+        if adjust == 'qfq-factor':
+            factors = factors[-1] / factors
+        return pd.DataFrame({
+            'date': np.datetime_as_string(factor_dates, unit='D'),
+            adjust.replace('-', '_'): factors,
+        }).iloc[::-1].reset_index(drop=True)
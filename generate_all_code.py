@@ -1,20 +1,24 @@
-import akshare as ak
 import json
 from pathlib import Path
 
-def get_all_a_etf_codes():
-    """获取全A股和ETF代码清单"""
+from symbols import SymbolMaster
+
+def get_all_a_etf_codes(master=None):
+    """获取全A股和ETF代码清单（A股来自代码主表，过期时才访问接口）"""
+    master = master if master is not None else SymbolMaster()  # 主表定义了 __len__，空主表也为假
     all_codes = []
 
     # 获取A股代码（含沪深京）
-    try:
-        stock_df = ak.stock_info_a_code_name()
-        a_shares = stock_df['code'].astype(str).tolist()
-        all_codes.extend(a_shares)
-        print(f"获取A股代码成功：{len(a_shares)}条")
-    except Exception as e:
-        print(f"A股代码获取失败：{str(e)}")
+    source = None
+    if master.is_stale() and not master.offline:
+        import akshare as ak
+        source = ak
+    a_shares = master.ensure(source).codes()
+    if not a_shares:
+        print("A股代码获取失败：代码主表为空")
         return None
+    all_codes.extend(a_shares)
+    print(f"获取A股代码成功：{len(a_shares)}条（主表刷新于 {master.refreshed_at:%Y-%m-%d %H:%M}）")
 
     # 获取ETF代码
     # try:
@@ -47,17 +51,20 @@ def save_to_json(codes, filename="./allcode.json"):
         print(f"保存文件失败：{str(e)}")
         return False
 
-if __name__ == '__main__':
+def main(filename="./allcode.json", master=None):
     # 获取代码
-    codes = get_all_a_etf_codes()
+    codes = get_all_a_etf_codes(master)
 
     if codes:
         # 保存结果
-        if save_to_json(codes):
+        if save_to_json(codes, filename):
             # 打印示例
             print("\n示例数据：")
             print(json.dumps(
                 {"stock_codes": codes[:8]},
                 indent=4,
                 ensure_ascii=False
-            ))
\ No newline at end of file
+            ))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,344 @@
+import os
+import json
+import math
+from collections import deque
+
+import pandas as pd
+from tqdm import tqdm
+
+from storage import load_stock, price_basis
+from symbols import DEFAULT_PATH, resolve_master_path
+from indicators import FeatureFrame, get_indicators
+
+
+# ----------------- 增量指标计算 -----------------
+# 每只股票保存 EMA、滚动均值的累加状态和最近几根 K 线，新 K 线到达时只推进状态，
+# 再把状态值预填入 FeatureFrame 的缓存，原样调用已注册的检测函数，只输出新增 K 线上的信号。
+# 日常更新的代价为 O(新增 K 线数)，与历史长度无关。
+#
+# EwmState / RollingMeanState 逐步复现 pandas ewm(adjust=False).mean() 与 rolling(n).mean()
+# 的浮点累加过程，结果与全量重算逐位相同；建立状态时会与 pandas 的全量结果核对，
+# 不一致（例如 pandas 升级改变了算法）时拒绝建立增量状态。
+# 状态记录建立时的价格口径（复权方式与因子表摘要）：新的除权除息会按新因子缩放全部前复权历史，
+# 口径变化时先在新口径的历史上重建状态，再推进新增 K 线。
+
+STATE_VERSION = 1
+STATEFUL = ('ema', 'rolling_mean')
+
+
+class EwmState:
+    """ewm(span=span, adjust=False).mean() 的逐步计算"""
+
+    def __init__(self, span):
+        com = (span - 1) / 2.0
+        self.alpha = 1.0 / (1.0 + com)
+        self.value = math.nan
+        self.old_wt = 1.0
+
+    def update(self, x):
+        x = float(x)
+        if self.value == self.value:
+            self.old_wt *= 1.0 - self.alpha
+            if x == x:
+                if self.value != x:
+                    self.value = (self.old_wt * self.value + self.alpha * x) / (self.old_wt + self.alpha)
+                self.old_wt = 1.0
+        elif x == x:
+            self.value = x
+        return self.value
+
+    def to_dict(self):
+        return {'alpha': self.alpha, 'value': self.value, 'old_wt': self.old_wt}
+
+    @classmethod
+    def from_dict(cls, data):
+        state = cls.__new__(cls)
+        state.__dict__.update(data)
+        return state
+
+
+class RollingMeanState:
+    """rolling(window).mean() 的逐步计算：带补偿的滑动求和，保留窗口内的原始值用于移出"""
+
+    def __init__(self, window):
+        self.window = window
+        self.buffer = deque()
+        self.seen = 0
+        self.nobs = 0
+        self.sum_x = 0.0
+        self.neg_ct = 0
+        self.comp_add = 0.0
+        self.comp_remove = 0.0
+        self.same_count = 0
+        self.prev_value = math.nan
+
+    def _add(self, val):
+        if val == val:
+            self.nobs += 1
+            y = val - self.comp_add
+            t = self.sum_x + y
+            self.comp_add = t - self.sum_x - y
+            self.sum_x = t
+            if math.copysign(1.0, val) < 0:
+                self.neg_ct += 1
+            if val == self.prev_value:
+                self.same_count += 1
+            else:
+                self.same_count = 1
+            self.prev_value = val
+
+    def _remove(self, val):
+        if val == val:
+            self.nobs -= 1
+            y = -val - self.comp_remove
+            t = self.sum_x + y
+            self.comp_remove = t - self.sum_x - y
+            self.sum_x = t
+            if math.copysign(1.0, val) < 0:
+                self.neg_ct -= 1
+
+    def update(self, x):
+        x = float(x)
+        if self.seen == 0 or self.window == 1:
+            self.nobs = self.neg_ct = self.same_count = 0
+            self.sum_x = self.comp_add = self.comp_remove = 0.0
+            self.prev_value = x
+        elif len(self.buffer) == self.window:
+            self._remove(self.buffer[0])
+        if len(self.buffer) == self.window:
+            self.buffer.popleft()
+        self.buffer.append(x)
+        self._add(x)
+        self.seen += 1
+
+        if self.nobs < self.window or self.nobs == 0:
+            return math.nan
+        result = self.sum_x / self.nobs
+        if self.same_count >= self.nobs:
+            result = self.prev_value
+        elif self.neg_ct == 0 and result < 0:
+            result = 0.0
+        elif self.neg_ct == self.nobs and result > 0:
+            result = 0.0
+        return result
+
+    def to_dict(self):
+        data = dict(self.__dict__)
+        data['buffer'] = list(self.buffer)
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        state = cls.__new__(cls)
+        state.__dict__.update(data)
+        state.buffer = deque(data['buffer'])
+        return state
+
+
+def _new_state(spec):
+    return EwmState(spec[2]) if spec[0] == 'ema' else RollingMeanState(spec[2])
+
+
+def _restore_state(spec, data):
+    return EwmState.from_dict(data) if spec[0] == 'ema' else RollingMeanState.from_dict(data)
+
+
+def _encode_spec(spec):
+    return json.dumps(spec, ensure_ascii=False)
+
+
+def _decode_spec(text):
+    def to_tuple(value):
+        return tuple(to_tuple(v) for v in value) if isinstance(value, list) else value
+    return to_tuple(json.loads(text))
+
+
+class IndicatorState:
+    """单只股票的增量状态：有状态特征的累加器、最近 keep 根 K 线及其特征值"""
+
+    def __init__(self, code, indicators=None):
+        self.code = code
+        self.indicators = indicators or get_indicators()
+        self.specs = []       # 有状态特征，按依赖顺序排列
+        self.states = {}
+        self.keep = 2         # 检测函数回看的最大 K 线数
+        self.tail = None      # 最近 keep 根 K 线
+        self.tail_values = {}
+        self.last_date = None
+        self.price_basis = None
+
+    @classmethod
+    def build(cls, code, df, indicators=None):
+        """在完整历史上建立状态，并与 pandas 全量计算结果逐位核对"""
+        state = cls(code, indicators)
+        features = FeatureFrame(df)
+        for _, func in state.indicators:
+            func(features)
+
+        # 缓存按计算完成的顺序插入，依赖项总在前面
+        state.specs = [spec for spec in features._cache if spec[0] in STATEFUL]
+        lags = [spec[2] for spec in features._cache if spec[0] == 'lag']
+        state.keep = max(lags + [1])
+
+        for spec in state.specs:
+            tracker = _new_state(spec)
+            source = features[spec[1]].to_numpy()
+            values = [tracker.update(x) for x in source]
+            expected = features[spec].to_numpy()
+            if not all(a == b or (a != a and b != b) for a, b in zip(values, expected)):
+                raise ValueError(f"{code} 的 {spec} 增量结果与全量计算不一致，请检查 pandas 版本")
+            state.states[spec] = tracker
+            state.tail_values[spec] = values[-state.keep:]
+
+        state.tail = df.iloc[-state.keep:].reset_index(drop=True)
+        state.last_date = df['日期'].iloc[-1] if len(df) else None
+        return state
+
+    def advance(self, new_bars):
+        """推进状态，返回新增 K 线上的信号 [(日期, 指标名称)]"""
+        new_bars = new_bars[new_bars['日期'] > self.last_date] if self.last_date is not None else new_bars
+        if new_bars.empty:
+            return []
+
+        frame = pd.concat([self.tail, new_bars[self.tail.columns]], ignore_index=True)
+        start = len(self.tail)
+        features = FeatureFrame(frame)
+        for spec in self.specs:
+            tracker = self.states[spec]
+            source = features[spec[1]].to_numpy()[start:]
+            values = self.tail_values[spec] + [tracker.update(x) for x in source]
+            features._cache[spec] = pd.Series(values, index=frame.index, dtype='float64')
+            self.tail_values[spec] = values[-self.keep:]
+
+        signals = []
+        dates = frame['日期'].iloc[start:]
+        for name, func in self.indicators:
+            mask = func(features).to_numpy(dtype=bool, na_value=False)[start:]
+            signals.extend((date, name) for date, hit in zip(dates, mask) if hit)
+
+        self.tail = frame.iloc[-self.keep:].reset_index(drop=True)
+        self.last_date = frame['日期'].iloc[-1]
+        return sorted(signals, key=lambda item: item[0])
+
+    def to_dict(self):
+        tail = self.tail.copy()
+        tail['日期'] = tail['日期'].dt.strftime('%Y-%m-%d')
+        return {
+            'version': STATE_VERSION,
+            'pandas': pd.__version__,
+            'code': self.code,
+            'indicators': [name for name, _ in self.indicators],
+            'keep': self.keep,
+            'last_date': self.last_date.strftime('%Y-%m-%d'),
+            'price_basis': self.price_basis,
+            'tail': tail.to_dict(orient='list'),
+            'dtypes': {col: str(dtype) for col, dtype in self.tail.dtypes.items() if col != '日期'},
+            'specs': [
+                {'spec': _encode_spec(spec), 'state': self.states[spec].to_dict(), 'tail': self.tail_values[spec]}
+                for spec in self.specs
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data, indicators=None):
+        state = cls(data['code'], indicators)
+        state.keep = data['keep']
+        state.last_date = pd.Timestamp(data['last_date'])
+        state.price_basis = data.get('price_basis')
+        tail = pd.DataFrame(data['tail']).astype(data['dtypes'])
+        tail['日期'] = pd.to_datetime(tail['日期'])
+        state.tail = tail
+        for item in data['specs']:
+            spec = _decode_spec(item['spec'])
+            state.specs.append(spec)
+            state.states[spec] = _restore_state(spec, item['state'])
+            state.tail_values[spec] = item['tail']
+        return state
+
+
+def _state_path(state_dir, code):
+    return os.path.join(state_dir, f"{code}.json")
+
+
+def load_state(state_dir, code, indicators=None):
+    """读取已保存的状态；不存在、版本或指标集合不符时返回 None"""
+    indicators = indicators or get_indicators()
+    try:
+        with open(_state_path(state_dir, code), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (data.get('version') != STATE_VERSION or data.get('pandas') != pd.__version__
+            or data.get('indicators') != [name for name, _ in indicators]):
+        return None
+    return IndicatorState.from_dict(data, indicators)
+
+
+def save_state(state_dir, state):
+    os.makedirs(state_dir, exist_ok=True)
+    path = _state_path(state_dir, state.code)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(state.to_dict(), f, ensure_ascii=False)
+    os.replace(path + '.tmp', path)
+
+
+def update_signals(data_dir, state_dir, code, indicators=None, adjust=None, master_path=DEFAULT_PATH):
+    """
+    只读取上次状态之后的新 K 线并推进状态，返回新增信号 [(日期, 指标名称)]。
+    没有状态时在完整历史上建立状态，此次不输出信号；
+    价格口径变化（复权因子更新）时在新口径下重建截至上次日期的状态后再推进。
+    """
+    basis = price_basis(data_dir, code, adjust)
+    state = load_state(state_dir, code, indicators)
+    if state is None:
+        df = load_stock(data_dir, code, adjust=adjust, master_path=master_path)
+        if df is None or df.empty:
+            return []
+        state = IndicatorState.build(code, df, indicators)
+        state.price_basis = basis
+        save_state(state_dir, state)
+        return []
+
+    if state.price_basis != basis:
+        history = load_stock(data_dir, code, end=state.last_date, adjust=adjust, master_path=master_path)
+        if history is None or history.empty:
+            return []
+        state = IndicatorState.build(code, history, indicators)
+        state.price_basis = basis
+        save_state(state_dir, state)
+
+    new_bars = load_stock(data_dir, code, start=state.last_date + pd.Timedelta(days=1), adjust=adjust,
+                          master_path=master_path)
+    if new_bars is None or new_bars.empty:
+        return []
+    signals = state.advance(new_bars)
+    save_state(state_dir, state)
+    return signals
+
+
+def main(config_path='config.json'):
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+
+    data_dir = config['data_dir']
+    output_dir = config['output_dir']
+    state_dir = config.get('state_dir', './indicator_state')
+    adjust = config.get('adjust')
+    master_path = resolve_master_path(config, config_path)
+    os.makedirs(output_dir, exist_ok=True)
+
+    rows = []
+    for code in tqdm(config['stock_codes'], desc="增量更新"):
+        try:
+            for date, name in update_signals(data_dir, state_dir, code, adjust=adjust, master_path=master_path):
+                rows.append({'stock_code': code, '日期': date.strftime('%Y-%m-%d'), '指标名称': name})
+        except Exception as e:
+            tqdm.write(f"❌ 更新 {code} 时发生错误：{str(e)}")
+
+    filepath = os.path.join(output_dir, "新增信号.csv")
+    pd.DataFrame(rows, columns=['stock_code', '日期', '指标名称']).to_csv(filepath, index=False, encoding='utf_8_sig')
+    print(f"\n新增信号 {len(rows)} 条，已保存至：{filepath}")
+
+
+if __name__ == '__main__':
+    main()
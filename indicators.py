@@ -0,0 +1,230 @@
+from collections import namedtuple
+
+
+# ----------------- 特征缓存 -----------------
+# 检测函数通过 FeatureFrame 取用滞后、均线、EMA 等派生序列，
+# 同一只股票上每个特征只计算一次，由所有检测函数共享。
+#
+# 特征用元组描述：(类型, 参数...)，参数中的数据源可以是原始列名，也可以是另一个特征元组，
+# 例如 ('lag', '收盘', 1)、('rolling_mean', '成交量', 30)、('lag', ('rolling_mean', '收盘', 30), 1)。
+
+FEATURES = {}
+LOOKBACKS = {}
+
+# EMA 没有固定窗口，取 EMA_WARMUP × span 根 K 线预热，此时被截掉的历史权重约为 e^(-2×EMA_WARMUP)
+EMA_WARMUP = 5
+
+
+def feature(kind, lookback=None):
+    """
+    注册一种特征的计算函数。
+    lookback(lb, *参数) 返回计算最新一根 K 线的特征值时还需要向前多看的 K 线数，lb 用于递归求数据源的回看长度。
+    """
+    def decorator(func):
+        FEATURES[kind] = func
+        LOOKBACKS[kind] = lookback or (lambda lb, *args: 0)
+        return func
+    return decorator
+
+
+@feature('lag', lookback=lambda lb, source, periods: lb(source) + periods)
+def _lag(f, source, periods):
+    return f[source].shift(periods)
+
+
+@feature('rolling_mean', lookback=lambda lb, source, window: lb(source) + window - 1)
+def _rolling_mean(f, source, window):
+    return f[source].rolling(window).mean()
+
+
+@feature('ema', lookback=lambda lb, source, span: lb(source) + EMA_WARMUP * span)
+def _ema(f, source, span):
+    return f[source].ewm(span=span, adjust=False).mean()
+
+
+@feature('body')
+def _body(f):
+    # 实体：收盘 - 开盘，正为阳线
+    return f['收盘'] - f['开盘']
+
+
+@feature('dif', lookback=lambda lb, fast, slow: max(lb(('ema', '收盘', fast)), lb(('ema', '收盘', slow))))
+def _dif(f, fast, slow):
+    return f[('ema', '收盘', fast)] - f[('ema', '收盘', slow)]
+
+
+@feature('dea', lookback=lambda lb, fast, slow, signal: lb(('ema', ('dif', fast, slow), signal)))
+def _dea(f, fast, slow, signal):
+    return f[('ema', ('dif', fast, slow), signal)]
+
+
+def feature_lookback(spec):
+    """计算最新一根 K 线上的特征值所需向前回看的 K 线数；原始列为 0"""
+    if isinstance(spec, str):
+        return 0
+    kind, *args = spec
+    return LOOKBACKS[kind](feature_lookback, *args)
+
+
+class FeatureFrame:
+    """单只股票的特征缓存：字符串键返回原始列，元组键按需计算并缓存派生序列"""
+
+    def __init__(self, df):
+        self.df = df
+        self._cache = {}
+
+    def __len__(self):
+        return len(self.df)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.df[key]
+        if key not in self._cache:
+            kind, *args = key
+            self._cache[key] = FEATURES[kind](self, *args)
+        return self._cache[key]
+
+    def lag(self, source, periods):
+        return self[('lag', source, periods)]
+
+    def rolling_mean(self, source, window):
+        return self[('rolling_mean', source, window)]
+
+    def ema(self, source, span):
+        return self[('ema', source, span)]
+
+    def warm(self, specs):
+        """预先计算一组特征"""
+        for spec in specs:
+            self[spec]
+        return self
+
+
+def as_features(df):
+    return df if isinstance(df, FeatureFrame) else FeatureFrame(df)
+
+
+# ----------------- 检测函数注册表 -----------------
+# 新增检测函数用 register_detector 声明名称和所需特征，即可被分析流程自动调用。
+# 可调参数写成检测函数的关键字参数并在 params 中声明默认值；所需特征随参数变化时，
+# features 可以是接收这些参数的函数。
+
+Detector = namedtuple('Detector', ['name', 'func', 'features', 'params'])
+
+DETECTORS = {}
+
+
+def register_detector(name, features=(), params=None):
+    def decorator(func):
+        DETECTORS[name] = Detector(name, func, features if callable(features) else tuple(features),
+                                   dict(params or {}))
+        return func
+    return decorator
+
+
+def get_indicators():
+    """按注册顺序返回 [(名称, 检测函数)]"""
+    return [(d.name, d.func) for d in DETECTORS.values()]
+
+
+def detector_features(detector, params=None):
+    """检测函数在给定参数（默认参数）下所需的特征"""
+    if not callable(detector.features):
+        return detector.features
+    return tuple(detector.features(**{**detector.params, **(params or {})}))
+
+
+def required_features(names=None):
+    """返回指定检测函数（默认全部）声明的特征集合"""
+    detectors = DETECTORS.values() if names is None else [DETECTORS[n] for n in names]
+    return {spec for d in detectors for spec in detector_features(d)}
+
+
+def detector_lookback(names=None):
+    """指定检测函数（默认全部）在最新一根 K 线上给出结果所需的回看 K 线数"""
+    return max([feature_lookback(spec) for spec in required_features(names)] + [0])
+
+
+def calculate_macd(df, fast=12, slow=26, signal=9):
+    f = as_features(df)
+    return f[('dif', fast, slow)], f[('dea', fast, slow, signal)]
+
+
+LAGS_1_2 = [('lag', col, n) for col in ('收盘', '开盘') for n in (1, 2)]
+
+
+@register_detector('三阳开泰', features=LAGS_1_2)
+def detect_sanyang_kaitai(df):
+    # 三阳开泰：连续三根阳线且收盘价递增
+    f = as_features(df)
+    close, close1, close2 = f['收盘'], f.lag('收盘', 1), f.lag('收盘', 2)
+    cond1 = (close > f['开盘'])
+    cond2 = (close1 > f.lag('开盘', 1)) & (close > close1)
+    cond3 = (close2 > f.lag('开盘', 2)) & (close1 > close2)
+    return cond1 & cond2 & cond3
+
+
+@register_detector('出水芙蓉', features=lambda ma, gain: [
+    ('lag', '收盘', 1),
+    ('lag', ('rolling_mean', '收盘', ma), 1),
+    ('lag', ('rolling_mean', '成交量', ma), 1),
+], params={'ma': 30, 'gain': 0.05})
+def detect_chushui_furong(df, ma=30, gain=0.05):
+    # 出水芙蓉：突破30日均线且涨幅>5%
+    f = as_features(df)
+    ma_close = f.rolling_mean('收盘', ma)
+    cond1 = (f['收盘'] > ma_close) & (f.lag('收盘', 1) <= f.lag(('rolling_mean', '收盘', ma), 1))
+    cond2 = (f['收盘'] / f['开盘'] - 1) >= gain
+    cond3 = f['成交量'] > f.lag(('rolling_mean', '成交量', ma), 1)
+    return cond1 & cond2 & cond3
+
+
+@register_detector('旭日东升', features=[('lag', '收盘', 1), ('lag', '开盘', 1)], params={'drop': 0.03})
+def detect_xuri_dongsheng(df, drop=0.03):
+    # 旭日东升
+    f = as_features(df)
+    day1_close = f.lag('收盘', 1)
+    day1_open = f.lag('开盘', 1)
+    day1_cond = (day1_close < day1_open) & ((day1_open - day1_close) / day1_open > drop)
+    day2_open_cond = f['开盘'] < day1_close
+    day2_close_cond = f['收盘'] > day1_open
+    return day1_cond & day2_open_cond & day2_close_cond
+
+
+@register_detector('多方炮', features=LAGS_1_2, params={'body': 0.03})
+def detect_duofangpao(df, body=0.03):
+    # 多方炮：两阳夹一阴
+    f = as_features(df)
+    close1, open1 = f.lag('收盘', 1), f.lag('开盘', 1)
+    day1 = (f.lag('收盘', 2) > f.lag('开盘', 2))
+    day2_body = (close1 < open1)
+    day2_size = (open1 - close1) / open1 < body
+    day3 = (f['收盘'] > f['开盘']) & (f['收盘'] > f.lag('收盘', 2))
+    return day1 & day2_body & day2_size & day3
+
+
+@register_detector('早晨之星', features=LAGS_1_2 + [('lag', '最高', 1), ('lag', '最低', 1), ('lag', ('body',), 1)],
+                   params={'doji': 0.1})
+def detect_morning_star(df, doji=0.1):
+    f = as_features(df)
+    close2, open2 = f.lag('收盘', 2), f.lag('开盘', 2)
+    # 第一天阴线
+    day1 = (close2 < open2)
+    # 第二天十字星
+    day2_body = abs(f.lag(('body',), 1))
+    day2_range = f.lag('最高', 1) - f.lag('最低', 1)
+    day2_doji = (day2_body / (day2_range + 1e-5)) < doji  # 防止除零
+    # 第三天阳线且收盘超第一天中点
+    day3 = (f['收盘'] > f['开盘']) & (f['收盘'] > (open2 + close2) / 2)
+    return day1 & day2_doji & day3
+
+
+@register_detector('MACD金叉', features=lambda fast, slow, signal: [
+    ('lag', ('dif', fast, slow), 1),
+    ('lag', ('dea', fast, slow, signal), 1),
+], params={'fast': 12, 'slow': 26, 'signal': 9})
+def detect_macd_golden_cross(df, fast=12, slow=26, signal=9):
+    f = as_features(df)
+    dif, dea = calculate_macd(f, fast, slow, signal)
+    golden_cross = (dif > dea) & (f.lag(('dif', fast, slow), 1) <= f.lag(('dea', fast, slow, signal), 1))
+    return golden_cross
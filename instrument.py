@@ -0,0 +1,242 @@
+import os
+import io
+import sys
+import csv
+import json
+import time
+import pstats
+import cProfile
+from contextlib import nullcontext
+from datetime import datetime
+
+
+# ----------------- 运行监测 -----------------
+# 每只股票（或每个任务）一个 Trace：按阶段累计独占耗时（嵌套的子阶段不计入父阶段），并累计计数器。
+# Trace 可序列化为字典，随结果从工作进程 / 线程返回，由主进程的 RunReport 汇总，
+# 写出 JSON 运行报告（各阶段合计、计数器、峰值内存、最慢的若干只股票）和逐股 CSV。
+# 未启用时使用 NULL_TRACE：span 返回同一个空上下文，count 什么也不做，几乎没有开销。
+
+_NULL_SPAN = nullcontext()
+
+
+def reset_peak_rss():
+    """重置进程的峰值常驻内存（Linux VmHWM），不支持时返回 False"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """自上次 reset_peak_rss 以来的峰值常驻内存（MB），不支持时退回进程生命周期内的峰值"""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 2 ** 10
+    except OSError:
+        pass
+    return max_rss_mb()
+
+
+def max_rss_mb(children=False):
+    """进程（children 为真时为已结束的子进程中最大者）生命周期内的峰值常驻内存（MB）"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / 2 ** 20 if sys.platform == 'darwin' else rss / 2 ** 10, 1)  # macOS 为字节，Linux 为 KB
+
+
+class _Span:
+    __slots__ = ('trace', 'name', 'started', 'child')
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.child = 0.0
+        self.trace._stack.append(self)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter() - self.started
+        stack = self.trace._stack
+        stack.pop()
+        if stack:
+            stack[-1].child += duration
+        stages = self.trace.stages
+        stages[self.name] = stages.get(self.name, 0.0) + duration - self.child
+        return False
+
+
+class Trace:
+    enabled = True
+
+    def __init__(self, key=None):
+        self.key = key
+        self.stages = {}
+        self.counters = {}
+        self._stack = []
+        self.started = time.perf_counter()
+        self.elapsed = None
+
+    def span(self, name):
+        return _Span(self, name)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def wrap(self, name, func):
+        """返回在 name 阶段中调用 func 的函数"""
+        def wrapped(*args, **kwargs):
+            with self.span(name):
+                return func(*args, **kwargs)
+        return wrapped
+
+    def finish(self):
+        if self.elapsed is None:
+            self.elapsed = time.perf_counter() - self.started
+        return self
+
+    def to_dict(self):
+        elapsed = self.elapsed if self.elapsed is not None else time.perf_counter() - self.started
+        return {
+            'key': self.key,
+            'elapsed': elapsed,
+            'stages': dict(self.stages),
+            'counters': dict(self.counters),
+        }
+
+
+class _NullTrace:
+    enabled = False
+    key = None
+
+    def span(self, name):
+        return _NULL_SPAN
+
+    def count(self, name, n=1):
+        pass
+
+    def wrap(self, name, func):
+        return func
+
+    def finish(self):
+        return self
+
+    def to_dict(self):
+        return None
+
+
+NULL_TRACE = _NullTrace()
+
+
+def new_trace(enabled, key=None):
+    return Trace(key) if enabled else NULL_TRACE
+
+
+class RunReport:
+    """
+    汇总一次运行的监测数据。主进程中的阶段（如汇总报告写出）通过 span 记录，
+    逐股结果通过 add 并入；write 写出 {name}.json 与 {name}_逐股.csv。
+    """
+
+    def __init__(self, command, output_dir, name, enabled=True, slowest=20):
+        self.command = command
+        self.output_dir = output_dir
+        self.name = name
+        self.enabled = enabled
+        self.slowest = slowest
+        self.main = new_trace(enabled, 'main')
+        self.items = []
+        self.profiles = []
+        self.started_at = datetime.now()
+
+    def span(self, name):
+        return self.main.span(name)
+
+    def count(self, name, n=1):
+        self.main.count(name, n)
+
+    def add(self, trace, error=None, key=None):
+        """并入一只股票的 Trace（对象或 to_dict 的结果），error 为失败原因；尚未开始即失败时只传 key"""
+        if not self.enabled:
+            return
+        if isinstance(trace, (Trace, _NullTrace)):
+            trace = trace.to_dict()
+        if trace is None:
+            if key is None:
+                return
+            trace = {'key': key, 'elapsed': 0.0, 'stages': {}, 'counters': {}}
+        self.items.append({**trace, 'error': error})
+
+    def summary(self):
+        stages, counters = {}, {}
+        for item in self.items + [self.main.to_dict()]:
+            for name, seconds in item['stages'].items():
+                agg = stages.setdefault(name, {'seconds': 0.0, 'items': 0})
+                agg['seconds'] += seconds
+                agg['items'] += 1
+            for name, n in item['counters'].items():
+                counters[name] = counters.get(name, 0) + n
+        elapsed = self.main.to_dict()['elapsed']
+        slowest = sorted(self.items, key=lambda item: item['elapsed'], reverse=True)[:self.slowest]
+        return {
+            'command': self.command,
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'elapsed': round(elapsed, 3),
+            'items': len(self.items),
+            'errors': sum(1 for item in self.items if item['error']),
+            'peak_rss_mb': {'main': max_rss_mb(), 'workers': max_rss_mb(children=True)},
+            'stages': {name: {'seconds': round(agg['seconds'], 4), 'items': agg['items']}
+                       for name, agg in sorted(stages.items(), key=lambda kv: -kv[1]['seconds'])},
+            'counters': counters,
+            'slowest': [{'key': item['key'], 'elapsed': round(item['elapsed'], 4), 'error': item['error'],
+                         'stages': {k: round(v, 4) for k, v in item['stages'].items()}} for item in slowest],
+            'profiles': self.profiles,
+        }
+
+    def profile_slowest(self, n, func, top=30):
+        """在主进程中用 cProfile 重新运行最慢的 n 只股票 func(key)，写出 .prof 与按累计耗时排序的文本"""
+        if not self.enabled or n <= 0:
+            return []
+        profile_dir = os.path.join(self.output_dir, f"{self.name}_profiles")
+        os.makedirs(profile_dir, exist_ok=True)
+        for item in sorted(self.items, key=lambda item: item['elapsed'], reverse=True)[:n]:
+            profiler = cProfile.Profile()
+            profiler.runcall(func, item['key'])
+            path = os.path.join(profile_dir, f"{item['key']}.prof")
+            profiler.dump_stats(path)
+            text = io.StringIO()
+            pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(top)
+            with open(path[:-5] + '.txt', 'w', encoding='utf-8') as f:
+                f.write(text.getvalue())
+            self.profiles.append(path)
+        return self.profiles
+
+    def write(self):
+        """写出运行报告，返回 JSON 路径；未启用时返回 None"""
+        if not self.enabled:
+            return None
+        self.main.finish()
+        os.makedirs(self.output_dir, exist_ok=True)
+        json_path = os.path.join(self.output_dir, f"{self.name}.json")
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+
+        stage_names = sorted({name for item in self.items for name in item['stages']})
+        counter_names = sorted({name for item in self.items for name in item['counters']})
+        with open(os.path.join(self.output_dir, f"{self.name}_逐股.csv"), 'w', encoding='utf_8_sig', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['代码', '耗时', '错误'] + stage_names + counter_names)
+            for item in self.items:
+                writer.writerow([item['key'], round(item['elapsed'], 6), item['error'] or '']
+                                + [round(item['stages'].get(name, 0.0), 6) for name in stage_names]
+                                + [item['counters'].get(name, 0) for name in counter_names])
+        return json_path
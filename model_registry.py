@@ -0,0 +1,86 @@
+import os
+import json
+import shutil
+import hashlib
+from datetime import datetime
+
+
+# ----------------- 预测模型仓库 -----------------
+# 每只股票、每组超参数、每个训练区间一个目录 {models_dir}/{code}/{参数摘要}/{起始日期}_{结束日期}/：
+#   模型文件      由预测后端写出（LSTM 为 model.keras 与 scalers.pkl，其余为 predictor.pkl）
+#   meta.json     后端、超参数、训练数据的起止日期与数据摘要、训练与微调记录
+# 在新的区间上重新训练不会覆盖其他区间的模型；查找时由调用方按数据摘要确认模型与当前数据一致。
+
+
+def params_key(params):
+    """超参数摘要，参数不同的模型互不覆盖"""
+    text = json.dumps(params, sort_keys=True)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:12]
+
+
+class ModelRegistry:
+    def __init__(self, root='./models'):
+        self.root = root
+
+    def path(self, code, predictor, first_date=None, last_date=None):
+        """超参数目录；给出训练区间时为该区间的模型目录"""
+        base = os.path.join(self.root, str(code), params_key({'backend': predictor.name, **predictor.params}))
+        if first_date is None:
+            return base
+        return os.path.join(base, f"{str(first_date)[:10]}_{str(last_date)[:10]}")
+
+    def metas(self, code, predictor):
+        """已保存模型的 (目录, meta)，按训练结束日期从新到旧排列"""
+        base = self.path(code, predictor)
+        found = []
+        for name in os.listdir(base) if os.path.isdir(base) else []:
+            meta_path = os.path.join(base, name, 'meta.json')
+            if name.endswith('.tmp') or not os.path.exists(meta_path):
+                continue
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                found.append((os.path.join(base, name), json.load(f)))
+        return sorted(found, key=lambda item: item[1]['last_date'], reverse=True)
+
+    def exists(self, code, predictor):
+        return bool(self.metas(code, predictor))
+
+    def save(self, code, predictor, first_date, last_date, finetune_count=0, data_key=None):
+        """
+        保存模型和元信息（data_key 为训练数据摘要）；先写临时目录再替换。
+        同一起始日期、更早结束日期的旧模型（微调前的版本）随之删除。
+        """
+        target = self.path(code, predictor, first_date, last_date)
+        tmp = target + '.tmp'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+
+        predictor.save(tmp)
+        meta = {
+            'code': str(code),
+            'backend': predictor.name,
+            'params': predictor.params,
+            'first_date': str(first_date)[:10],
+            'last_date': str(last_date)[:10],
+            'data_key': data_key,
+            'saved_at': datetime.now().isoformat(timespec='seconds'),
+            'finetune_count': finetune_count,
+        }
+        with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(tmp, target)
+        for path, old in self.metas(code, predictor):
+            if old['first_date'] == meta['first_date'] and old['last_date'] < meta['last_date']:
+                shutil.rmtree(path, ignore_errors=True)
+        return target
+
+    def load(self, code, predictor, accept=None):
+        """
+        按 predictor 的后端与超参数载入训练区间最新、且 accept(meta) 为真的模型，
+        返回 (predictor, meta)，没有符合条件的模型时返回 None。
+        """
+        for path, meta in self.metas(code, predictor):
+            if accept is None or accept(meta):
+                return type(predictor).load(path, predictor.params), meta
+        return None
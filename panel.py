@@ -0,0 +1,156 @@
+import numpy as np
+import pandas as pd
+
+from resample import DAILY, load_bars
+from symbols import DEFAULT_PATH
+from indicators import FeatureFrame, get_indicators
+from stats import HORIZONS, column_stats, indicator_result
+
+
+# ----------------- 截面引擎 -----------------
+# 把全市场行情装入 日期 × 股票代码 的二维矩阵，检测函数和持有期收益都按整矩阵计算，
+# 省去逐股调用 pandas 的固定开销。停牌、上市前和退市后的空缺为 NaN。
+#
+# 逐股引擎中 shift(1) 指“该股上一根 K 线”而非“上一个日历交易日”，
+# 因此计算前先把每只股票的有效行依次上移（trading_view），使行号与逐股计算一致，
+# 结果再按原日期散回。检测函数本身原样复用，输出与逐股引擎逐位相同。
+
+PANEL_COLUMNS = ['开盘', '收盘', '最高', '最低', '成交量']
+
+
+class _Bars:
+    """供 FeatureFrame 使用的截面数据：按列名返回 K线序号 × 股票代码 的 DataFrame"""
+
+    def __init__(self, fields, rows):
+        self.fields = fields
+        self.rows = rows
+
+    def __getitem__(self, key):
+        return self.fields[key]
+
+    def __len__(self):
+        return self.rows
+
+
+class Panel:
+    def __init__(self, dates, codes, names, fields, present):
+        self.dates = dates        # DatetimeIndex，全市场交易日并集
+        self.codes = list(codes)
+        self.names = names        # {代码: 名称}
+        self.fields = fields      # {列名: ndarray(日期数, 股票数)}
+        self.present = present    # bool ndarray，该股当日是否有 K 线
+
+    @classmethod
+    def load(cls, data_dir, stock_codes, columns=PANEL_COLUMNS, start=None, end=None, tail=None,
+             timeframe=DAILY, cache_dir=None, adjust=None, master_path=DEFAULT_PATH):
+        """
+        逐只读取股票并按日期对齐，tail 为每只股票只取最后的 tail 根 K 线，找不到数据的代码被跳过。
+        timeframe 非日线时读取 resample 合成的周期 K 线，adjust 为复权方式（None 取存储的默认方式），
+        master_path 为定位 CSV 文件所用的代码主表。
+        """
+        frames, names = {}, {}
+        for code in stock_codes:
+            df = load_bars(data_dir, code, ['stock_name', '日期'] + list(columns), start, end, tail, timeframe, cache_dir,
+                           adjust, master_path)
+            if df is None or df.empty:
+                continue
+            frames[code] = df
+            names[code] = df['stock_name'].iloc[0]
+
+        codes = list(frames)
+        if codes:
+            dates = pd.DatetimeIndex(np.unique(np.concatenate([df['日期'].to_numpy() for df in frames.values()])))
+        else:
+            dates = pd.DatetimeIndex([])
+        rows = {code: dates.get_indexer(df['日期']) for code, df in frames.items()}
+
+        present = np.zeros((len(dates), len(codes)), dtype=bool)
+        for j, code in enumerate(codes):
+            present[rows[code], j] = True
+
+        fields = {}
+        for col in columns:
+            # 保持与逐股加载相同的精度：float32 价格仍为 float32，整数列转为可容纳 NaN 的浮点
+            dtype = np.result_type(np.float32, *[frames[code][col].dtype for code in codes])
+            arr = np.full((len(dates), len(codes)), np.nan, dtype=dtype)
+            for j, code in enumerate(codes):
+                arr[rows[code], j] = frames[code][col].to_numpy()
+            fields[col] = arr
+        return cls(dates, codes, names, fields, present)
+
+    def trading_view(self):
+        """
+        将每只股票的有效 K 线依次上移，返回 (bars, order, lengths)：
+        bars[列名] 为 K线序号 × 股票 的 DataFrame，order[k, j] 为第 j 只股票第 k 根 K 线所在的日期行，
+        lengths[j] 为第 j 只股票的 K 线数。
+        """
+        order = np.argsort(~self.present, axis=0, kind='stable')
+        lengths = self.present.sum(axis=0)
+        n = int(lengths.max()) if len(self.codes) else 0
+        order = order[:n]
+        fields = {
+            col: pd.DataFrame(np.take_along_axis(arr, order, axis=0), columns=self.codes)
+            for col, arr in self.fields.items()
+        }
+        return _Bars(fields, n), order, lengths
+
+    def to_dates(self, values, order, lengths, fill=False):
+        """把 K线序号 × 股票 的矩阵按 order 散回 日期 × 股票"""
+        values = np.asarray(values)
+        out = np.full((len(self.dates), len(self.codes)), fill, dtype=values.dtype)
+        inside = np.arange(len(order))[:, None] < lengths[None, :]
+        cols = np.broadcast_to(np.arange(len(self.codes)), order.shape)
+        out[order[inside], cols[inside]] = values[inside]
+        return out
+
+
+def _shift_up(arr, periods):
+    """第 k 行取第 k+periods 行的值，末尾补 NaN"""
+    out = np.full_like(arr, np.nan)
+    if periods < len(arr):
+        out[:len(arr) - periods] = arr[periods:]
+    return out
+
+
+def signal_matrix(panel, indicator_func):
+    """返回 日期 × 股票代码 的布尔信号 DataFrame"""
+    bars, order, lengths = panel.trading_view()
+    inside = np.arange(len(bars))[:, None] < lengths[None, :]
+    mask = indicator_func(FeatureFrame(bars)).to_numpy(dtype=bool, na_value=False) & inside
+    return pd.DataFrame(panel.to_dates(mask, order, lengths), index=panel.dates, columns=panel.codes)
+
+
+def analyze_panel(panel, indicators=None, horizons=HORIZONS):
+    """
+    在整张截面矩阵上计算全部指标及各持有期收益。
+    返回与逐股引擎 analyze_stock 相同结构的结果列表 [{'code', 'name', 'results'}]。
+    """
+    indicators = indicators or get_indicators()
+    bars, order, lengths = panel.trading_view()
+    features = FeatureFrame(bars)
+    row = np.arange(len(bars))[:, None]
+    inside = row < lengths[None, :]
+
+    # 各持有期收益矩阵：第 k 根 K 线发出信号，第 k+1 根开盘买入，第 k+h 根收盘卖出
+    opens = bars['开盘'].to_numpy()
+    closes = bars['收盘'].to_numpy()
+    buy = _shift_up(opens, 1)
+    horizon_profits = []
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for h in horizons:
+            profits = ((_shift_up(closes, h) - buy) / buy).astype(np.float64)
+            horizon_profits.append((h, profits, row + h < lengths[None, :]))
+
+    results = [[] for _ in panel.codes]
+    for name, func in indicators:
+        mask = func(features).to_numpy(dtype=bool, na_value=False) & inside
+        # 每个持有期对全部股票列一次算出统计，不再逐股循环
+        per_horizon = [column_stats([h] * len(panel.codes), profits, mask & in_range)
+                       for h, profits, in_range in horizon_profits]
+        for j, stats in enumerate(zip(*per_horizon)):
+            results[j].append(indicator_result(name, list(stats)))
+
+    return [
+        {'code': code, 'name': panel.names[code], 'results': results[j]}
+        for j, code in enumerate(panel.codes)
+    ]
@@ -1,108 +1,257 @@
 import pandas as pd
 import numpy as np
 import os
-import matplotlib.pyplot as plt
-from sklearn.preprocessing import MinMaxScaler
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import LSTM, Dense
+import time
+import hashlib
+
+from storage import load_stock
+from symbols import DEFAULT_PATH
+from model_registry import ModelRegistry
+from predictors import FEATURE_COLUMNS, PREDICTORS, get_predictor
+
+MODELS_DIR = './models'
+OUTPUT_DIR = './predicated'
+BACKEND = 'lstm'
+FINETUNE_EPOCHS = 5
+
+
+def prepare_data(original_data, horizon):
+    """原始特征矩阵与标签（horizon 日后的收盘价），以及有标签的行数"""
+    values = original_data[FEATURE_COLUMNS].to_numpy(dtype=np.float64)
+    labels = original_data['收盘'].shift(-horizon).to_numpy(dtype=np.float64)
+    return values, labels, len(original_data) - horizon
+
+
+def training_key(original_data, values, last_date):
+    """截至 last_date 的特征数据摘要：历史被改写（如复权口径变化）或数据截断后不再匹配"""
+    rows = np.searchsorted(original_data['日期'].values, np.datetime64(str(last_date)[:10]), side='right')
+    return hashlib.sha1(np.ascontiguousarray(values[:rows]).tobytes()).hexdigest()[:16]
+
+
+def predict_latest(predictor, original_data, values):
+    """
+    对最新的样本打分（包括尚无标签的最后 horizon 根 K 线），不重新拟合。
+    返回 (样本结束日期, 预测的 horizon 日后收盘价) 表。
+    """
+    horizon = predictor.horizon
+    rows = np.arange(max(len(values) - horizon, predictor.n_input - 1), len(values))
+    return pd.DataFrame({
+        '日期': original_data['日期'].values[rows],
+        f'预测{horizon}日后收盘价': predictor.predict(values, rows),
+    })
+
+
+def _output_name(original_data):
+    return f"{original_data['stock_code'].iloc[0]}-{original_data['stock_name'].iloc[0]}"
+
+
+def save_latest(original_data, latest):
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    output_csv = os.path.join(OUTPUT_DIR, f"{_output_name(original_data)}_最新预测.csv")
+    latest.to_csv(output_csv, index=False)
+    return output_csv
+
+
+def plot_results(output_png, stock_code, stock_name, predicted_dates, y_test, y_pred):
+    # matplotlib 只在需要输出图片时导入
+    import matplotlib.pyplot as plt
+
+    plt.rcParams['font.sans-serif'] = ['SimHei']  # Windows系统字体
+    plt.rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
+    plt.figure(figsize=(12, 6))
+    plt.plot(predicted_dates, y_test, label='实际收盘价')
+    plt.plot(predicted_dates, y_pred, ':', label='预测收盘价')
+    plt.title(f'{stock_name} ({stock_code}) 收盘价预测')
+    plt.xlabel('日期')
+    plt.ylabel('收盘价')
+    plt.legend()
+    plt.xticks(rotation=45)
+    plt.tight_layout()
+
+    plt.savefig(output_png, dpi=300)
+    plt.close()
+
+
+def predict_stock_price(stock_code, data_dir='../stock_data', mode='train', models_dir=MODELS_DIR, params=None,
+                        finetune_epochs=FINETUNE_EPOCHS, backend=BACKEND, plot=True, master_path=DEFAULT_PATH):
+    """
+    backend 为预测后端（lstm / ridge / gbt），params 覆盖后端的默认超参数，plot 为假时不输出图片，
+    master_path 为定位 CSV 文件所用的代码主表。
+    mode:
+      train     完整训练并评估，保存模型
+      predict   载入已保存的模型，只对最新样本打分
+      finetune  载入已保存的模型，用上次训练之后的新 K 线继续训练，再对最新样本打分
+    找不到已保存的模型时 predict / finetune 退回完整训练。
+    """
+    predictor = get_predictor(backend, params)
+    n_input = predictor.n_input
+    horizon = predictor.horizon
+    registry = ModelRegistry(models_dir)
 
-def predict_stock_price(input_file):
     # 读取并预处理数据
-    original_data = pd.read_csv(input_file)
-    original_data['日期'] = pd.to_datetime(original_data['日期'])
-    original_data = original_data.sort_values('日期').reset_index(drop=True)
+    original_data = load_stock(data_dir, stock_code, master_path=master_path)
+    if original_data is None:
+        print(f"未找到股票 {stock_code} 的数据")
+        return
+    values, labels, n_labeled = prepare_data(original_data, horizon)
 
-    # 准备数据集
-    data = original_data.copy()
-    data['label'] = data['收盘'].shift(-5)
-    data = data.dropna(subset=['label']).reset_index(drop=True)
-    data['original_index'] = data.index  # 记录原始索引
+    saved = None
+    if mode in ('predict', 'finetune'):
+        # 只复用在当前数据的同一段历史上训练的模型
+        first_date = str(original_data['日期'].iloc[0])[:10]
+        saved = registry.load(stock_code, predictor, lambda meta: (
+            meta['first_date'] == first_date
+            and meta.get('data_key') == training_key(original_data, values, meta['last_date'])))
+        if saved is None:
+            print(f"未找到 {stock_code} 与当前数据一致的已保存模型，改为完整训练")
+            mode = 'train'
 
-    # 检查数据是否足够
-    if len(data) < 30:
-        print(f"数据不足({len(data)}行)，至少需要30行有效数据")
+    if saved is not None and len(original_data) < n_input:
+        print(f"数据不足({len(original_data)}行)，至少需要{n_input}行数据")
         return
 
-    # 特征和标签
-    features = data[['开盘', '收盘', '最高', '最低', '成交量', '成交额', '振幅', '涨跌幅', '换手率']]
-    labels = data['label'].values.reshape(-1, 1)
+    if mode == 'predict':
+        predictor, meta = saved
+        return save_latest(original_data, predict_latest(predictor, original_data, values))
 
-    # 归一化处理
-    scaler_features = MinMaxScaler()
-    scaler_labels = MinMaxScaler()
-    scaled_features = scaler_features.fit_transform(features)
-    scaled_labels = scaler_labels.fit_transform(labels)
+    if mode == 'finetune':
+        predictor, meta = saved
+        # 只取标签日期晚于上次训练范围的样本
+        all_rows = np.arange(n_input - 1, n_labeled)
+        new_rows = all_rows[original_data['日期'].values[all_rows] > np.datetime64(meta['last_date'])]
+        if len(new_rows) == 0:
+            print(f"{stock_code} 没有新的训练样本，直接预测")
+        else:
+            predictor.finetune(values[:n_labeled], labels[:n_labeled], new_rows, all_rows, finetune_epochs)
+            last_date = original_data['日期'].iloc[n_labeled - 1]
+            registry.save(stock_code, predictor, meta['first_date'], last_date, meta.get('finetune_count', 0) + 1,
+                          training_key(original_data, values, last_date))
+        return save_latest(original_data, predict_latest(predictor, original_data, values))
 
-    # 创建时间序列数据集
-    n_input = 300
-    X, y = [], []
-    for i in range(len(scaled_features) - n_input + 1):
-        X.append(scaled_features[i:i+n_input])
-        y.append(scaled_labels[i + n_input - 1])
+    # 检查数据是否足够
+    if n_labeled < 30:
+        print(f"数据不足({max(n_labeled, 0)}行)，至少需要30行有效数据")
+        return
 
-    X = np.array(X)
-    y = np.array(y)
+    # 第 t 行的样本为 [t - n_input + 1, t] 的 K 线，标签为 t + horizon 日的收盘价
+    n_samples = n_labeled - n_input + 1
+    if n_samples < 2:
+        print(f"数据不足({n_labeled}行)，至少需要{n_input + 1}行有效数据")
+        return
+    rows = np.arange(n_input - 1, n_labeled)
 
     # 划分训练集和测试集
-    train_size = int(len(X) * 0.8)
-    X_train, X_test = X[:train_size], X[train_size:]
-    y_train, y_test = y[:train_size], y[train_size:]
+    train_size = int(n_samples * 0.8)
+    train_rows, test_rows = rows[:train_size], rows[train_size:]
 
-    # 构建LSTM模型
-    model = Sequential()
-    model.add(LSTM(64, activation='relu', input_shape=(n_input, X.shape[2])))
-    model.add(Dense(1))
-    model.compile(optimizer='adam', loss='mse')
-
-    # 训练模型
-    model.fit(X_train, y_train, epochs=100, validation_data=(X_test, y_test), verbose=0, batch_size=32)
+    # 训练模型并保存，训练范围记到最后一个有标签的日期
+    predictor.fit(values[:n_labeled], labels[:n_labeled], train_rows, test_rows)
+    last_date = original_data['日期'].iloc[n_labeled - 1]
+    registry.save(stock_code, predictor, original_data['日期'].iloc[0], last_date,
+                  data_key=training_key(original_data, values, last_date))
 
     # 预测
-    y_pred = model.predict(X_test)
-    y_pred = scaler_labels.inverse_transform(y_pred)
-    y_test = scaler_labels.inverse_transform(y_test.reshape(-1, 1))
+    y_pred = predictor.predict(values[:n_labeled], test_rows)
+    y_test = labels[test_rows]
 
     # 获取预测日期
-    test_window_indices = [i + n_input - 1 for i in range(train_size, len(X))]
-    test_indices = data.loc[test_window_indices, 'original_index'].values
-    predicted_dates = original_data.loc[test_indices + 5, '日期'].values
+    predicted_dates = original_data['日期'].values[test_rows + horizon]
 
     # 创建结果DataFrame
     results = pd.DataFrame({
         '日期': predicted_dates,
-        '预测收盘价': y_pred.flatten(),
-        '实际收盘价': y_test.flatten()
+        '预测收盘价': y_pred,
+        '实际收盘价': y_test
     })
 
     # 确保输出目录存在
-    output_dir = './predicated'
+    output_dir = OUTPUT_DIR
     os.makedirs(output_dir, exist_ok=True)
 
     # 获取股票代码和名称
-    stock_code = data['stock_code'].iloc[0]
-    stock_name = data['stock_name'].iloc[0]
+    stock_code = original_data['stock_code'].iloc[0]
+    stock_name = original_data['stock_name'].iloc[0]
 
     # 保存结果
     output_csv = os.path.join(output_dir, f"{stock_code}-{stock_name}.csv")
     results.to_csv(output_csv, index=False)
 
     # 可视化结果
-    plt.rcParams['font.sans-serif'] = ['SimHei']  # Windows系统字体
-    plt.rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
-    plt.figure(figsize=(12, 6))
-    plt.plot(predicted_dates, y_test, label='实际收盘价')
-    plt.plot(predicted_dates, y_pred, ':', label='预测收盘价')
-    plt.title(f'{stock_name} ({stock_code}) 收盘价预测')
-    plt.xlabel('日期')
-    plt.ylabel('收盘价')
-    plt.legend()
-    plt.xticks(rotation=45)
-    plt.tight_layout()
+    if plot:
+        output_png = os.path.join(output_dir, f"{stock_code}-{stock_name}.png")
+        plot_results(output_png, stock_code, stock_name, predicted_dates, y_test, y_pred)
+    return output_csv
 
-    output_png = os.path.join(output_dir, f"{stock_code}-{stock_name}.png")
-    plt.savefig(output_png, dpi=300)
-    plt.close()
+
+def compare_backends(stock_code, data_dir='../stock_data', backends=None, params=None, master_path=DEFAULT_PATH):
+    """
+    在同一测试区间上比较各后端的训练耗时、单样本预测延迟和误差，不保存模型。
+    测试区间按最长的回看窗口划分，保证所有后端在相同的日期上评估。
+    params 为 {后端: 超参数} 的覆盖项。
+    """
+    original_data = load_stock(data_dir, stock_code, master_path=master_path)
+    if original_data is None:
+        print(f"未找到股票 {stock_code} 的数据")
+        return
+    params = params or {}
+    predictors = [get_predictor(name, params.get(name)) for name in (backends or PREDICTORS)]
+    horizon = predictors[0].horizon
+    if any(p.horizon != horizon for p in predictors):
+        raise ValueError("参与比较的后端必须使用相同的 horizon")
+
+    values, labels, n_labeled = prepare_data(original_data, horizon)
+    longest = max(p.n_input for p in predictors)
+    n_samples = n_labeled - longest + 1
+    if n_samples < 2:
+        print(f"数据不足({max(n_labeled, 0)}行)，至少需要{longest + 1}行有效数据")
+        return
+    test_rows = np.arange(longest - 1 + int(n_samples * 0.8), n_labeled)
+    y_test = labels[test_rows]
+
+    rows = []
+    for predictor in predictors:
+        train_rows = np.arange(predictor.n_input - 1, test_rows[0])
+        started = time.perf_counter()
+        predictor.fit(values[:n_labeled], labels[:n_labeled], train_rows, test_rows)
+        fit_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        y_pred = predictor.predict(values[:n_labeled], test_rows)
+        latency = (time.perf_counter() - started) / len(test_rows)
+
+        error = y_pred - y_test
+        rows.append({
+            '后端': predictor.name,
+            '训练耗时(秒)': round(fit_time, 3),
+            '单样本预测延迟(毫秒)': round(latency * 1000, 4),
+            'MAE': float(np.abs(error).mean()),
+            'RMSE': float(np.sqrt((error ** 2).mean())),
+            'MAPE(%)': float(np.abs(error / y_test).mean() * 100),
+        })
+
+    report = pd.DataFrame(rows)
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    output_csv = os.path.join(OUTPUT_DIR, f"{_output_name(original_data)}_模型对比.csv")
+    report.to_csv(output_csv, index=False)
+    print(report.to_string(index=False))
+    return report
 
 if __name__ == "__main__":
-    input_file = '../stock_data/002023-海特高新.csv'
-    predict_stock_price(input_file)
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="收盘价预测")
+    parser.add_argument('codes', nargs='*', default=['002023'])
+    parser.add_argument('--mode', choices=['train', 'predict', 'finetune'], default='train')
+    parser.add_argument('--backend', choices=list(PREDICTORS), default=BACKEND)
+    parser.add_argument('--compare', action='store_true', help="比较全部后端的耗时与误差")
+    parser.add_argument('--no-plot', action='store_true', help="不输出图片")
+    parser.add_argument('--data-dir', default='../stock_data')
+    parser.add_argument('--models-dir', default=MODELS_DIR)
+    args = parser.parse_args()
+
+    for code in args.codes:
+        if args.compare:
+            compare_backends(code, args.data_dir)
+        else:
+            predict_stock_price(code, args.data_dir, mode=args.mode, models_dir=args.models_dir,
+                                backend=args.backend, plot=not args.no_plot)
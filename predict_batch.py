@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import argparse
+import multiprocessing
+from contextlib import nullcontext
+from fnmatch import fnmatch
+from datetime import datetime
+
+from tqdm import tqdm
+
+from shard import (DEFAULT_SHARD_DIR, load_partials, mark_running, parse_shard, report_problems, select_shard,
+                   write_partial)
+from storage import list_codes
+from symbols import DEFAULT_PATH, resolve_master_path
+
+
+# ----------------- 批量预测 -----------------
+# 一个进程池处理全部股票，每个工作进程只导入一次 TensorFlow，
+# 并把 intra/inter-op 线程数限制为 核心数 / 工作进程数，避免多个进程争抢核心。
+# 工作进程用 spawn 启动，父进程不导入 TensorFlow。
+
+
+def resolve_codes(patterns, data_dir):
+    """股票代码列表，支持通配符（如 0000*、6*），按数据目录中已有的股票展开"""
+    codes = []
+    available = None
+    for pattern in patterns:
+        if any(ch in pattern for ch in '*?['):
+            if available is None:
+                available = list_codes(data_dir)
+            codes.extend(code for code in available if fnmatch(code, pattern))
+        else:
+            codes.append(pattern)
+    return list(dict.fromkeys(codes))  # 去重并保持顺序
+
+
+def threads_per_worker(workers):
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def _init_worker(threads, backend):
+    # 必须在导入 TensorFlow / scikit-learn 之前设置
+    os.environ['TF_NUM_INTRAOP_THREADS'] = str(threads)
+    os.environ['TF_NUM_INTEROP_THREADS'] = '1'
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+    if backend != 'lstm':
+        return
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def _predict_one(code, data_dir, mode, models_dir, backend, plot, master_path=DEFAULT_PATH):
+    from predicate import predict_stock_price
+
+    started = time.perf_counter()
+    entry = {'code': code}
+    try:
+        output = predict_stock_price(code, data_dir, mode=mode, models_dir=models_dir, backend=backend, plot=plot,
+                                     master_path=master_path)
+        entry['status'] = 'ok' if output else 'skipped'  # 数据缺失或不足时不输出结果
+        entry['output'] = output
+    except Exception as e:
+        entry['status'] = 'error'
+        entry['error'] = f"{type(e).__name__}: {e}"
+    entry['elapsed'] = round(time.perf_counter() - started, 3)
+    return entry
+
+
+def _predict_star(args):
+    return _predict_one(*args)
+
+
+def run_batch(codes, data_dir, mode='train', models_dir='./models', workers=0, backend='lstm', plot=True,
+              master_path=DEFAULT_PATH):
+    """逐股调用 predict_stock_price，返回按完成顺序排列的运行记录；只有一个进程时在当前进程内执行"""
+    workers = min(workers or os.cpu_count() or 1, max(len(codes), 1))
+    threads = threads_per_worker(workers)
+    tasks = [(code, data_dir, mode, models_dir, backend, plot, master_path) for code in codes]
+
+    entries = []
+    if workers > 1:
+        pool = multiprocessing.get_context('spawn').Pool(workers, initializer=_init_worker, initargs=(threads, backend))
+    else:
+        pool = nullcontext()
+    with pool, tqdm(total=len(tasks), desc="🔮 预测进度") as pbar:
+        results = pool.imap_unordered(_predict_star, tasks) if workers > 1 else map(_predict_star, tasks)
+        for entry in results:
+            if entry['status'] == 'error':
+                tqdm.write(f"❌ {entry['code']} 预测失败：{entry['error']}")
+            entries.append(entry)
+            pbar.update(1)
+    return entries, workers, threads
+
+
+def run_manifest(mode, backend, workers, threads, entries, elapsed):
+    return {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'mode': mode,
+        'backend': backend,
+        'workers': workers,
+        'threads_per_worker': threads,
+        'total': len(entries),
+        'ok': sum(entry['status'] == 'ok' for entry in entries),
+        'failed': sum(entry['status'] == 'error' for entry in entries),
+        'elapsed': round(elapsed, 3),
+        'stocks': sorted(entries, key=lambda entry: entry['code']),
+    }
+
+
+def write_run_manifest(path, mode, backend, workers, threads, entries, elapsed):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    manifest = run_manifest(mode, backend, workers, threads, entries, elapsed)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量股价预测")
+    parser.add_argument('codes', nargs='*', help="股票代码或通配符，不填时使用 config.json 的 stock_codes")
+    parser.add_argument('--config', default='config.json')
+    parser.add_argument('--mode', choices=['train', 'predict', 'finetune'])
+    parser.add_argument('--backend')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--no-plot', action='store_true', help="不输出图片")
+    parser.add_argument('--compare', action='store_true', help="逐股比较全部后端的耗时与误差，不保存模型")
+    parser.add_argument('--shard', type=parse_shard, help="只处理第 i 个分片（i/N，按代码哈希切分）")
+    args = parser.parse_args(argv)
+
+    with open(args.config, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+
+    data_dir = config['data_dir']
+    master_path = resolve_master_path(config, args.config)
+    mode = args.mode or config.get('predict_mode', 'train')
+    backend = args.backend or config.get('predict_backend', 'lstm')
+    workers = args.workers if args.workers is not None else config.get('predict_workers', 0)
+    universe = resolve_codes(args.codes or config['stock_codes'], data_dir)
+    codes = select_shard(universe, args.shard)
+    if not universe:
+        print("没有匹配的股票代码")
+        return
+
+    if args.compare:
+        from predicate import compare_backends
+        for code in codes:
+            compare_backends(code, data_dir, master_path=master_path)
+        return
+
+    plot = config.get('predict_plot', True) and not args.no_plot
+    shard_dir = config.get('shard_dir') or DEFAULT_SHARD_DIR
+    if args.shard:
+        mark_running(shard_dir, 'predict', args.shard, universe, f"{mode}:{backend}")
+    started = time.perf_counter()
+    entries, workers, threads = run_batch(codes, data_dir, mode, config.get('models_dir', './models'), workers,
+                                          backend, plot, master_path) if codes else ([], 0, 0)
+    if args.shard:
+        manifest = run_manifest(mode, backend, workers, threads, entries, time.perf_counter() - started)
+        manifest_path = write_partial(shard_dir, 'predict', args.shard, universe, manifest, signature=f"{mode}:{backend}")
+    else:
+        manifest_path = config.get('predict_manifest', './predicated/预测运行记录.json')
+        manifest = write_run_manifest(manifest_path, mode, backend, workers, threads, entries,
+                                      time.perf_counter() - started)
+
+    print(f"\n完成 {manifest['ok']}/{manifest['total']}，失败 {manifest['failed']}，"
+          f"用时 {manifest['elapsed']:.1f} 秒；运行记录：{manifest_path}")
+
+
+def merge_shards(config_path='config.json'):
+    """合并各分片的运行记录写入 predict_manifest；分片不完整或模式、后端不一致时返回 False"""
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+
+    partials, problems = load_partials(config.get('shard_dir'), 'predict')
+    if not problems and len({(partial['signature'], partial['universe']) for partial in partials}) > 1:
+        problems = ["各分片的代码清单、预测模式或后端不一致，请用相同参数重跑"]
+    if not report_problems('predict', problems, f"python cli.py predict --config {config_path}"):
+        return False
+
+    entries = [entry for partial in partials for entry in partial['stocks']]
+    manifest_path = config.get('predict_manifest', './predicated/预测运行记录.json')
+    os.makedirs(os.path.dirname(manifest_path) or '.', exist_ok=True)
+    manifest = run_manifest(partials[0]['mode'], partials[0]['backend'], sum(p['workers'] for p in partials),
+                            max(p['threads_per_worker'] for p in partials), entries,
+                            max(p['elapsed'] for p in partials))  # 各分片并行运行，用时取最慢的分片
+    manifest['shards'] = len(partials)
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    print(f"已合并 {len(partials)} 个分片：完成 {manifest['ok']}/{manifest['total']}，失败 {manifest['failed']}；"
+          f"运行记录：{manifest_path}")
+    return True
+
+
+if __name__ == '__main__':
+    main()
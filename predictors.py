@@ -0,0 +1,229 @@
+import os
+import pickle
+from abc import ABC, abstractmethod
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+# ----------------- 预测模型后端 -----------------
+# 所有后端使用同一份特征（FEATURE_COLUMNS）和同一个标签（horizon 日后的收盘价）。
+# 第 t 行的样本由 [t - n_input + 1, t] 的 K 线构成，标签为 t + horizon 日的收盘价；
+# 后端只需实现 fit / predict（抽象方法，缺少时创建后端即报错）并按需覆盖 save / load，
+# 训练、预测与结果输出由 predicate.py 统一处理。
+# TensorFlow 与 scikit-learn 只在用到对应后端时才导入。
+
+FEATURE_COLUMNS = ['开盘', '收盘', '最高', '最低', '成交量', '成交额', '振幅', '涨跌幅', '换手率']
+CLOSE = FEATURE_COLUMNS.index('收盘')
+PRICES = [FEATURE_COLUMNS.index(col) for col in ('开盘', '收盘', '最高', '最低')]
+VOLUMES = [FEATURE_COLUMNS.index(col) for col in ('成交量', '成交额')]
+
+PREDICTORS = {}
+
+
+def register_predictor(name):
+    """注册预测后端，名称用于配置和命令行的 backend 参数"""
+    def decorator(cls):
+        cls.name = name
+        PREDICTORS[name] = cls
+        return cls
+    return decorator
+
+
+def get_predictor(name, params=None):
+    if name not in PREDICTORS:
+        raise ValueError(f"未知的预测后端：{name}，可选：{', '.join(PREDICTORS)}")
+    return PREDICTORS[name](params)
+
+
+def make_windows(values, n_input):
+    """返回 (样本数, n_input, 特征数) 的滑动窗口只读视图，不复制数据"""
+    return sliding_window_view(values, n_input, axis=0).transpose(0, 2, 1)
+
+
+def make_dataset(windows, labels, indices, batch_size=32, shuffle=False, seed=None):
+    """
+    按批从窗口视图中取样的 tf.data 数据集，每次只物化一个批次。
+    shuffle 为真时每个 epoch 重新打乱样本顺序（与 model.fit 传入数组时的默认行为一致）。
+    labels 为 None 时只产出特征，用于预测。
+    """
+    import tensorflow as tf
+
+    rng = np.random.default_rng(seed)
+    indices = np.asarray(indices)
+
+    def generator():
+        order = rng.permutation(indices) if shuffle else indices
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            if labels is None:
+                yield windows[batch]
+            else:
+                yield windows[batch], labels[batch]
+
+    feature_spec = tf.TensorSpec(shape=(None,) + windows.shape[1:], dtype=tf.float32)
+    if labels is None:
+        signature = feature_spec
+    else:
+        signature = (feature_spec, tf.TensorSpec(shape=(None,) + labels.shape[1:], dtype=tf.float32))
+    return tf.data.Dataset.from_generator(generator, output_signature=signature).prefetch(tf.data.AUTOTUNE)
+
+
+class Predictor(ABC):
+    name = None
+    DEFAULT_PARAMS = {}
+
+    def __init__(self, params=None):
+        self.params = {**self.DEFAULT_PARAMS, **(params or {})}
+
+    @property
+    def n_input(self):
+        return self.params['n_input']
+
+    @property
+    def horizon(self):
+        return self.params['horizon']
+
+    @abstractmethod
+    def fit(self, values, labels, rows, validation_rows=None):
+        """values 为 (行数, 特征数) 的原始特征，labels 为对应的标签，rows 为参与训练的样本结束行"""
+
+    @abstractmethod
+    def predict(self, values, rows):
+        """返回 rows 各样本的预测收盘价"""
+
+    def finetune(self, values, labels, new_rows, all_rows, epochs):
+        """在新样本上继续训练；默认在全部样本上重新训练（轻量后端只需几秒）"""
+        self.fit(values, labels, all_rows)
+
+    def save(self, path):
+        with open(os.path.join(path, 'predictor.pkl'), 'wb') as f:
+            pickle.dump(self.model, f)
+
+    @classmethod
+    def load(cls, path, params):
+        predictor = cls(params)
+        with open(os.path.join(path, 'predictor.pkl'), 'rb') as f:
+            predictor.model = pickle.load(f)
+        return predictor
+
+
+@register_predictor('lstm')
+class LSTMPredictor(Predictor):
+    """300 日窗口的 LSTM，特征与标签分别 MinMax 归一化"""
+
+    DEFAULT_PARAMS = {'n_input': 300, 'horizon': 5, 'units': 64, 'epochs': 100, 'batch_size': 32}
+
+    def _windows(self, values):
+        scaled = self.scaler_features.transform(values).astype(np.float32)
+        return make_windows(scaled, self.n_input)
+
+    def _labels(self, labels):
+        return self.scaler_labels.transform(labels.reshape(-1, 1)).astype(np.float32)
+
+    def fit(self, values, labels, rows, validation_rows=None):
+        from sklearn.preprocessing import MinMaxScaler
+        from tensorflow.keras.models import Sequential
+        from tensorflow.keras.layers import LSTM, Dense
+
+        self.scaler_features = MinMaxScaler().fit(values)
+        self.scaler_labels = MinMaxScaler().fit(labels[~np.isnan(labels)].reshape(-1, 1))
+
+        self.model = Sequential()
+        self.model.add(LSTM(self.params['units'], activation='relu', input_shape=(self.n_input, values.shape[1])))
+        self.model.add(Dense(1))
+        self.model.compile(optimizer='adam', loss='mse')
+
+        # 按批从窗口视图取样，不物化完整的窗口张量；窗口 i 对应结束行 i + n_input - 1
+        X, y = self._windows(values), self._labels(labels)[self.n_input - 1:]
+        offset = self.n_input - 1
+        validation = None
+        if validation_rows is not None and len(validation_rows):
+            validation = make_dataset(X, y, validation_rows - offset, self.params['batch_size'])
+        self.model.fit(make_dataset(X, y, rows - offset, self.params['batch_size'], shuffle=True),
+                       validation_data=validation, epochs=self.params['epochs'], verbose=0)
+
+    def finetune(self, values, labels, new_rows, all_rows, epochs):
+        # 沿用已有的归一化器，只在新样本上训练几轮
+        X, y = self._windows(values), self._labels(labels)[self.n_input - 1:]
+        dataset = make_dataset(X, y, new_rows - (self.n_input - 1), self.params['batch_size'], shuffle=True)
+        self.model.fit(dataset, epochs=epochs, verbose=0)
+
+    def predict(self, values, rows):
+        X = self._windows(values)
+        y_pred = self.model.predict(make_dataset(X, None, rows - (self.n_input - 1), self.params['batch_size']),
+                                    verbose=0)
+        return self.scaler_labels.inverse_transform(y_pred).flatten()
+
+    def save(self, path):
+        self.model.save(os.path.join(path, 'model.keras'))
+        with open(os.path.join(path, 'scalers.pkl'), 'wb') as f:
+            pickle.dump((self.scaler_features, self.scaler_labels), f)
+
+    @classmethod
+    def load(cls, path, params):
+        from tensorflow.keras.models import load_model
+
+        predictor = cls(params)
+        predictor.model = load_model(os.path.join(path, 'model.keras'))
+        with open(os.path.join(path, 'scalers.pkl'), 'rb') as f:
+            predictor.scaler_features, predictor.scaler_labels = pickle.load(f)
+        return predictor
+
+
+def lag_features(values, rows, n_input):
+    """
+    最近 n_input 日特征展平成一行：价格除以当日收盘价、成交量与成交额除以窗口均值，
+    其余特征保持原值，使不同价位、不同时期的样本可比。
+    """
+    windows = sliding_window_view(values, n_input, axis=0)[rows - (n_input - 1)].copy()  # (样本, 特征, n_input)
+    close = windows[:, CLOSE, -1:]
+    windows[:, PRICES, :] /= close[:, None, :]
+    volume_mean = windows[:, VOLUMES, :].mean(axis=2, keepdims=True)
+    windows[:, VOLUMES, :] /= np.where(volume_mean > 0, volume_mean, 1.0)
+    return windows.reshape(len(rows), -1)
+
+
+class LagPredictor(Predictor):
+    """在滞后特征上拟合 horizon 日收益率，预测时换算回收盘价"""
+
+    @abstractmethod
+    def _estimator(self):
+        """返回未拟合的 scikit-learn 估计器"""
+
+    def fit(self, values, labels, rows, validation_rows=None):
+        X = lag_features(values, rows, self.n_input)
+        y = labels[rows] / values[rows, CLOSE] - 1
+        self.model = self._estimator().fit(X, y)
+
+    def predict(self, values, rows):
+        X = lag_features(values, rows, self.n_input)
+        return values[rows, CLOSE] * (1 + self.model.predict(X))
+
+
+@register_predictor('ridge')
+class RidgePredictor(LagPredictor):
+    """标准化后的岭回归"""
+
+    DEFAULT_PARAMS = {'n_input': 20, 'horizon': 5, 'alpha': 1.0}
+
+    def _estimator(self):
+        from sklearn.pipeline import make_pipeline
+        from sklearn.preprocessing import StandardScaler
+        from sklearn.linear_model import Ridge
+        return make_pipeline(StandardScaler(), Ridge(alpha=self.params['alpha']))
+
+
+@register_predictor('gbt')
+class GradientBoostingPredictor(LagPredictor):
+    """直方图梯度提升树"""
+
+    DEFAULT_PARAMS = {'n_input': 20, 'horizon': 5, 'max_iter': 200, 'learning_rate': 0.05,
+                      'max_leaf_nodes': 31, 'random_state': 0}
+
+    def _estimator(self):
+        from sklearn.ensemble import HistGradientBoostingRegressor
+        return HistGradientBoostingRegressor(max_iter=self.params['max_iter'],
+                                             learning_rate=self.params['learning_rate'],
+                                             max_leaf_nodes=self.params['max_leaf_nodes'],
+                                             random_state=self.params['random_state'])
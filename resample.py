@@ -0,0 +1,192 @@
+import os
+import re
+import json
+import argparse
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+import storage
+from symbols import DEFAULT_PATH, resolve_master_path
+
+
+# ----------------- 周期重采样 -----------------
+# 周线、月线和 N 日线由本地日线合成，不再按周期重新下载。
+# 开盘取首日、收盘取末日、最高/最低取极值，成交量、成交额、换手率求和，日期取周期内最后一个交易日；
+# 涨跌额、涨跌幅、振幅按上一周期的收盘价重新计算。
+# 合成结果以列式存储缓存在 {cache_dir}/{周期}/{code}/，meta.json 记录所用日线的行数与首尾收盘价：
+# 日线只追加了新 K 线时只重算最后一个（可能未走完的）周期；日线被改写（如复权价格变化）时整体重建。
+# 复权在日线上完成后再合成；指定 adjust 时缓存在 {cache_dir}/{周期}_{adjust}/，与默认复权方式的缓存互不影响。
+
+DAILY = 'daily'
+SUM_COLUMNS = ('成交量', '成交额', '换手率')
+
+
+def parse_timeframe(timeframe):
+    """daily、weekly、monthly 或 N 日（如 3d），返回规范名称"""
+    tf = str(timeframe or DAILY).strip().lower()
+    match = re.fullmatch(r'(\d+)d', tf)
+    if match and int(match.group(1)) >= 1:
+        n = int(match.group(1))
+        return DAILY if n == 1 else f"{n}d"
+    if tf in (DAILY, 'weekly', 'monthly'):
+        return tf
+    raise ValueError(f"不支持的周期：{timeframe}（可选 daily、weekly、monthly 或 N 日，如 3d）")
+
+
+def default_cache_dir(data_dir):
+    return os.path.join(data_dir, '_resampled')
+
+
+def cache_store(data_dir, timeframe, cache_dir=None, adjust=None):
+    return os.path.join(cache_dir or default_cache_dir(data_dir), timeframe if adjust is None else f"{timeframe}_{adjust}")
+
+
+def group_keys(dates, rows, timeframe):
+    """每根日线所属周期的编号；rows 为日线在全量历史中的行号，N 日线按行号分组"""
+    if timeframe == 'weekly':
+        days = dates.astype('datetime64[D]').astype(np.int64)
+        return (days + 3) // 7  # 1970-01-01 为周四，偏移 3 天后按周一分界
+    if timeframe == 'monthly':
+        return dates.astype('datetime64[M]').astype(np.int64)
+    return rows // int(timeframe[:-1])
+
+
+def resample_bars(df, timeframe, offset=0, prev_close=None):
+    """
+    将按日期排序的日线合成为 timeframe 周期 K 线，只输出 df 中已有的行情列。
+    offset 为 df 首行在全量日线中的行号，prev_close 为 df 之前一根日线的收盘价（None 时由首日涨跌额推算）。
+    返回 (周期 K 线, 最后一个周期首日在全量日线中的行号)。
+    """
+    if df.empty:
+        return df.iloc[:0], None
+    dates = df['日期'].to_numpy(dtype='datetime64[ns]')
+    keys = group_keys(dates, np.arange(offset, offset + len(df)), timeframe)
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(df)] - 1
+
+    bars = {'日期': dates[ends]}
+    close = df['收盘'].to_numpy(dtype=np.float64)
+    if prev_close is None:
+        prev_close = close[0] - float(df['涨跌额'].iloc[0]) if '涨跌额' in df else np.nan
+    prev = np.r_[prev_close, close[ends][:-1]]
+    for col in df.columns:
+        if col == '开盘':
+            bars[col] = df[col].to_numpy()[starts]
+        elif col == '收盘':
+            bars[col] = close[ends]
+        elif col == '最高':
+            bars[col] = np.maximum.reduceat(df[col].to_numpy(), starts)
+        elif col == '最低':
+            bars[col] = np.minimum.reduceat(df[col].to_numpy(), starts)
+        elif col in SUM_COLUMNS:
+            values = df[col].to_numpy()
+            bars[col] = np.add.reduceat(values if values.dtype.kind == 'i' else values.astype(np.float64), starts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if '涨跌额' in df:
+            bars['涨跌额'] = close[ends] - prev
+        if '涨跌幅' in df:
+            bars['涨跌幅'] = (close[ends] - prev) / prev * 100
+        if '振幅' in df and '最高' in bars and '最低' in bars:
+            bars['振幅'] = (bars['最高'].astype(np.float64) - bars['最低']) / prev * 100
+
+    columns = [col for col in df.columns if col in bars]
+    return pd.DataFrame(bars)[columns], offset + int(starts[-1])
+
+
+def _source_matches(source, dates, closes):
+    """缓存所用的日线是否仍是当前日线的前缀（行数、末日日期、首尾收盘价均一致）"""
+    rows = source['rows']
+    if rows < 1 or rows > len(dates):
+        return False
+    return (pd.Timestamp(dates[rows - 1]).strftime('%Y-%m-%d') == source['last_date']
+            and float(closes[rows - 1]) == source['last_close']
+            and float(closes[0]) == source['first_close'])
+
+
+def update_resampled(data_dir, code, timeframe, cache_dir=None, adjust=None, master_path=DEFAULT_PATH):
+    """
+    使缓存的周期 K 线与（按 adjust 复权的）日线同步，返回重新合成所用的日线根数（0 表示已是最新），
+    日线不存在时返回 None。
+    """
+    timeframe = parse_timeframe(timeframe)
+    store = cache_store(data_dir, timeframe, cache_dir, adjust)
+    index = storage.load_stock(data_dir, code, ['日期', '收盘'], adjust=adjust, master_path=master_path)
+    if index is None or index.empty:
+        return None
+    dates = index['日期'].to_numpy(dtype='datetime64[ns]')
+    closes = index['收盘'].to_numpy()
+
+    source = storage.read_meta(store, code).get('source') if storage.has_stock(store, code) else None
+    start = 0
+    if source and _source_matches(source, dates, closes):
+        if source['rows'] == len(dates):
+            return 0
+        start = source['last_group_start']
+
+    daily = storage.load_stock(data_dir, code, start=dates[start], adjust=adjust, master_path=master_path)
+    name = daily['stock_name'].iloc[0] if 'stock_name' in daily else None
+    daily = daily.drop(columns=storage.META_COLUMNS, errors='ignore')
+    bars, last_group_start = resample_bars(daily, timeframe, start, float(closes[start - 1]) if start else None)
+    if start:
+        cached = storage.load_stock(store, code, list(bars.columns))
+        bars = pd.concat([cached.iloc[:-1], bars], ignore_index=True)
+
+    storage.save_stock(store, code, name, bars, {
+        'timeframe': timeframe,
+        'source': {
+            'rows': len(dates),
+            'last_date': pd.Timestamp(dates[-1]).strftime('%Y-%m-%d'),
+            'first_close': float(closes[0]),
+            'last_close': float(closes[-1]),
+            'last_group_start': last_group_start,
+        },
+    })
+    return len(dates) - start
+
+
+def load_bars(data_dir, code, columns=None, start=None, end=None, tail=None, timeframe=DAILY, cache_dir=None,
+              adjust=None, master_path=DEFAULT_PATH):
+    """
+    按周期加载行情，参数与 storage.load_stock 相同；非日线周期先同步缓存再从缓存读取。
+    数据不存在时返回 None。
+    """
+    timeframe = parse_timeframe(timeframe)
+    if timeframe == DAILY:
+        return storage.load_stock(data_dir, code, columns, start, end, tail, adjust, master_path)
+    if update_resampled(data_dir, code, timeframe, cache_dir, adjust, master_path) is None:
+        return None
+    return storage.load_stock(cache_store(data_dir, timeframe, cache_dir, adjust), code, columns, start, end, tail)
+
+
+def main(config_path='config.json', timeframes=None):
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+
+    timeframes = [parse_timeframe(tf) for tf in (timeframes or [config.get('timeframe', DAILY)])]
+    timeframes = [tf for tf in timeframes if tf != DAILY]
+    if not timeframes:
+        print("日线无需重采样，请通过 --timeframe 或配置 timeframe 指定周期")
+        return
+    cache_dir = config.get('resample_dir')
+    adjust = config.get('adjust')
+    master_path = resolve_master_path(config, config_path)
+    for timeframe in timeframes:
+        updated = missing = 0
+        for code in tqdm(config['stock_codes'], desc=f"🔄 合成{timeframe}"):
+            n = update_resampled(config['data_dir'], code, timeframe, cache_dir, adjust, master_path)
+            if n is None:
+                missing += 1
+            elif n:
+                updated += 1
+        print(f"{timeframe}：更新 {updated} 只，已是最新 {len(config['stock_codes']) - updated - missing} 只，"
+              f"缺少日线 {missing} 只")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="由本地日线合成周线、月线或 N 日线并缓存")
+    parser.add_argument('--config', default='config.json')
+    parser.add_argument('--timeframe', action='append', help="daily、weekly、monthly 或 N 日（如 3d），可重复指定")
+    args = parser.parse_args()
+    main(args.config, args.timeframe)
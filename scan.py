@@ -0,0 +1,98 @@
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from panel import Panel, PANEL_COLUMNS
+from symbols import DEFAULT_PATH, resolve_master_path
+from indicators import FeatureFrame, get_indicators, detector_lookback
+
+
+# ----------------- 每日全市场筛选 -----------------
+# 只读取每只股票最后 回看长度 + days 根 K 线（列式存储按行切片，不读全量历史），
+# 装入截面矩阵后一次性跑完全部检测函数，输出最近 days 根 K 线上触发的信号。
+# 回看长度由各检测函数声明的特征推出：出水芙蓉需要 30 根，MACD 的 EMA 按 EMA_WARMUP × span 预热。
+# EMA 预热截断会带来极小的数值差异，恰好落在金叉临界点附近的信号可能与全量计算不同。
+
+SCAN_COLUMNS = PANEL_COLUMNS + ['成交额', '涨跌幅']
+
+
+def scan_market(data_dir, stock_codes, indicators=None, days=1, include_stale=False, adjust=None,
+                master_path=DEFAULT_PATH):
+    """
+    返回按 信号数、成交额 降序排列的信号表，每行为一只股票在一根 K 线上触发的全部指标。
+    include_stale 为假时剔除最新 K 线早于全市场最新交易日的股票（停牌）；adjust 为复权方式，
+    master_path 为定位 CSV 文件所用的代码主表。
+    """
+    indicators = indicators or get_indicators()
+    lookback = detector_lookback([name for name, _ in indicators])
+    panel = Panel.load(data_dir, stock_codes, SCAN_COLUMNS, tail=lookback + days, adjust=adjust,
+                       master_path=master_path)
+    if not panel.codes:
+        return pd.DataFrame()
+
+    bars, order, lengths = panel.trading_view()
+    features = FeatureFrame(bars)
+    masks = [(name, func(features).to_numpy(dtype=bool, na_value=False)) for name, func in indicators]
+
+    latest = panel.dates[-1]
+    rows = []
+    for j, code in enumerate(panel.codes):
+        last = lengths[j] - 1
+        if not include_stale and panel.dates[order[last, j]] != latest:
+            continue
+        for k in range(max(last - days + 1, 0), last + 1):
+            hits = [name for name, mask in masks if mask[k, j]]
+            if not hits:
+                continue
+            rows.append({
+                'stock_code': code,
+                'stock_name': panel.names[code],
+                '日期': panel.dates[order[k, j]].strftime('%Y-%m-%d'),
+                '信号数': len(hits),
+                '指标': '、'.join(hits),
+                # 价格与涨跌幅以 float32 存储，按源数据的两位小数输出，避免 25.629999 之类的显示
+                '收盘': round(float(bars['收盘'].iat[k, j]), 2),
+                '涨跌幅': round(float(bars['涨跌幅'].iat[k, j]), 2),
+                '成交额': float(bars['成交额'].iat[k, j]),
+            })
+
+    result = pd.DataFrame(rows, columns=['stock_code', 'stock_name', '日期', '信号数', '指标', '收盘', '涨跌幅', '成交额'])
+    result = result.sort_values(['日期', '信号数', '成交额'], ascending=[False, False, False]).reset_index(drop=True)
+    result.insert(0, '排名', np.arange(1, len(result) + 1))
+    return result
+
+
+def main(config_path='config.json', days=None, include_stale=False, top=20):
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+
+    output_dir = config['output_dir']
+    days = days or config.get('scan_days', 1)
+    os.makedirs(output_dir, exist_ok=True)
+
+    started = time.perf_counter()
+    result = scan_market(config['data_dir'], config['stock_codes'], days=days, include_stale=include_stale,
+                         adjust=config.get('adjust'), master_path=resolve_master_path(config, config_path))
+    elapsed = time.perf_counter() - started
+    if result.empty:
+        print(f"未发现信号（用时 {elapsed:.1f} 秒）")
+        return result
+
+    filepath = os.path.join(output_dir, f"每日筛选_{result['日期'].iloc[0]}.csv")
+    result.to_csv(filepath, index=False, encoding='utf_8_sig')
+    print(result.head(top).to_string(index=False))
+    print(f"\n共 {len(result)} 条信号，用时 {elapsed:.1f} 秒，已保存至：{filepath}")
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="每日全市场信号筛选")
+    parser.add_argument('--config', default='config.json')
+    parser.add_argument('--days', type=int, help="筛选最近几根 K 线，默认取配置 scan_days")
+    parser.add_argument('--include-stale', action='store_true', help="包含最新 K 线早于全市场最新交易日的股票")
+    args = parser.parse_args()
+    main(args.config, args.days, args.include_stale)
@@ -0,0 +1,133 @@
+import os
+import re
+import json
+import zlib
+import hashlib
+from datetime import datetime
+
+
+# ----------------- 分片执行 -----------------
+# 多台机器分摊全市场任务：--shard i/N（0 <= i < N）按代码的 CRC32 对 N 取模确定分片，
+# 与机器、进程和 Python 哈希种子无关，同一份代码清单在任何节点上切分结果都相同。
+# 各分片把部分结果写入共享目录 {shard_dir}/{阶段}/shard-{i}-of-{N}.json：开始时状态为 running，
+# 正常结束后改写为 done。merge 读取全部 N 个分片合并为单机运行的输出；
+# 缺失或未完成的分片只需用相同的 --shard 参数单独重跑。
+
+DEFAULT_SHARD_DIR = './shards'
+_FILE_PATTERN = re.compile(r'shard-(\d+)-of-(\d+)\.json')
+
+
+def parse_shard(text):
+    """'i/N' -> (i, N)，None 或空串表示不分片"""
+    if not text:
+        return None
+    match = re.fullmatch(r'\s*(\d+)\s*/\s*(\d+)\s*', str(text))
+    if not match or not 0 <= int(match.group(1)) < int(match.group(2)):
+        raise ValueError(f"无效的分片：{text}（格式为 i/N，0 <= i < N）")
+    return int(match.group(1)), int(match.group(2))
+
+
+def shard_of(code, count):
+    return zlib.crc32(str(code).encode('utf-8')) % count
+
+
+def select_shard(codes, shard):
+    """保持原顺序取出属于 shard 的代码，shard 为 None 时返回全部"""
+    if shard is None:
+        return list(codes)
+    index, count = shard
+    return [code for code in codes if shard_of(code, count) == index]
+
+
+def shard_label(shard):
+    return f"shard-{shard[0]}-of-{shard[1]}"
+
+
+def universe_hash(codes):
+    """代码清单的摘要，用于确认各分片切分的是同一份清单"""
+    return hashlib.sha1(json.dumps(sorted(map(str, codes))).encode('utf-8')).hexdigest()[:16]
+
+
+def partial_path(shard_dir, stage, shard):
+    return os.path.join(shard_dir or DEFAULT_SHARD_DIR, stage, shard_label(shard) + '.json')
+
+
+def write_partial(shard_dir, stage, shard, universe, payload=None, status='done', signature=None):
+    """原子写入分片的部分结果，返回文件路径"""
+    path = partial_path(shard_dir, stage, shard)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    record = {
+        'stage': stage,
+        'shard': f"{shard[0]}/{shard[1]}",
+        'status': status,
+        'universe': universe_hash(universe),
+        'signature': signature,
+        'updated_at': datetime.now().isoformat(timespec='seconds'),
+        **(payload or {}),
+    }
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(record, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+    return path
+
+
+def mark_running(shard_dir, stage, shard, universe, signature=None):
+    """分片开始时写入 running 状态，进程中途退出时 merge 能识别出未完成的分片"""
+    return write_partial(shard_dir, stage, shard, universe, status='running', signature=signature)
+
+
+def read_partial(shard_dir, stage, shard):
+    try:
+        with open(partial_path(shard_dir, stage, shard), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def load_partials(shard_dir, stage, universe=None, signature=None):
+    """
+    读取某阶段全部分片的部分结果，返回 (各分片结果列表, 问题列表)。
+    分片数由目录中的文件确定；缺失、未完成、代码清单或配置签名不一致的分片记入问题列表。
+    """
+    base = os.path.join(shard_dir or DEFAULT_SHARD_DIR, stage)
+    counts = set()
+    if os.path.isdir(base):
+        for name in os.listdir(base):
+            match = _FILE_PATTERN.fullmatch(name)
+            if match:
+                counts.add(int(match.group(2)))
+    if not counts:
+        return [], [f"{base} 中没有分片结果"]
+    if len(counts) > 1:
+        return [], [f"{base} 中混有不同分片数 {sorted(counts)} 的结果，请删除旧结果后重跑"]
+
+    count = counts.pop()
+    partials, problems = [], []
+    for index in range(count):
+        shard = (index, count)
+        record = read_partial(shard_dir, stage, shard)
+        if record is None:
+            problems.append(f"{shard_label(shard)}：缺失")
+        elif record['status'] != 'done':
+            problems.append(f"{shard_label(shard)}：未完成（{record['status']}，{record['updated_at']}）")
+        elif universe is not None and record['universe'] != universe_hash(universe):
+            problems.append(f"{shard_label(shard)}：代码清单与当前配置不一致")
+        elif signature is not None and record['signature'] != signature:
+            problems.append(f"{shard_label(shard)}：配置签名与当前配置不一致")
+        else:
+            partials.append(record)
+    return partials, problems
+
+
+def report_problems(stage, problems, command):
+    """打印无法合并的分片及其重跑命令，返回是否可以合并"""
+    if not problems:
+        return True
+    print(f"⚠️ {stage} 分片结果不完整，未合并：")
+    for problem in problems:
+        print(f"  - {problem}")
+        match = re.match(r'shard-(\d+)-of-(\d+)', problem)
+        if match:
+            print(f"    重跑：{command} --shard {match.group(1)}/{match.group(2)}")
+    return False
@@ -0,0 +1,193 @@
+import math
+
+import numpy as np
+
+
+# ----------------- 信号收益统计 -----------------
+# 次日开盘买入、第 h 日收盘卖出。逐股引擎、截面引擎和参数扫描共用 column_stats，
+# 按列批量统计（逐股时一列一个持有期，截面时一列一只股票），保证各处输出完全一致。
+
+HORIZONS = (1, 3, 5, 10, 20)
+MAIN_HORIZON = 5  # 主表沿用的 5 日持有期
+PERCENTILES = (10, 25, 50, 75, 90)
+
+
+def empty_stats(days):
+    stats = {'days': int(days), 'count': 0, 'wins': 0, 'sum': 0.0, 'sum_sq': 0.0,
+             'win_rate': 0.0, 'avg_return': 0.0, 'median': 0.0}
+    stats.update({f"p{q}": 0.0 for q in PERCENTILES if q != 50})
+    return stats
+
+
+def _column_percentiles(values, columns, starts, counts):
+    """
+    各列有效收益的分位数 (分位数个数, 列数)，与对每列单独调用 np.percentile（线性插值）逐位相同。
+    values 为按列分组排列的有效收益，starts/counts 为各列在其中的起点与个数。
+    """
+    # 组内升序，NaN 排在组末；末尾补一项，末尾空列的起点不越界
+    ordered = np.append(values[np.lexsort((values, columns))], np.nan)
+    last = np.maximum(counts - 1, 0)
+    virtual = last[None, :] * (np.asarray(PERCENTILES) / 100)[:, None]
+    lower = np.floor(virtual)
+    gamma = virtual - lower
+    lower = np.minimum(lower.astype(np.intp), last)
+    a = ordered[starts + lower]
+    b = ordered[starts + np.minimum(lower + 1, last)]
+    diff = b - a
+    result = np.where(gamma >= 0.5, b - diff * (1 - gamma), a + diff * gamma)
+    # 与 np.percentile 一致：有效收益中含 NaN 时结果为 NaN
+    return np.where(np.isnan(ordered[starts + last]), np.nan, result)
+
+
+def column_stats(days, profits, valid):
+    """
+    按列计算单个持有期的收益统计：profits 为 行 × 列 的收益矩阵（行按信号时间排序），
+    valid 为参与统计的行，days 为各列的持有期。返回每列一个统计字典。
+    只取出有效收益按列分组后归约，每列的结果与列数和其他列无关，逐股与截面逐位相同。
+    """
+    columns, rows = np.nonzero(valid.T)  # 按列分组，组内保持时间顺序
+    values = profits[rows, columns].astype(np.float64)
+    size = valid.shape[1]
+    counts = np.bincount(columns, minlength=size)
+    # bincount 按出现顺序逐项累加到各列，与其他列无关
+    wins = np.bincount(columns[values > 0], minlength=size)
+    totals = np.bincount(columns, weights=values, minlength=size)
+    squares = np.bincount(columns, weights=values * values, minlength=size)
+    percentiles = _column_percentiles(values, columns, np.cumsum(counts) - counts, counts)
+
+    stats = []
+    for j, h in enumerate(days):
+        count = int(counts[j])
+        if count == 0:
+            stats.append(empty_stats(h))
+            continue
+        item = {
+            'days': int(h),
+            'count': count,
+            'wins': int(wins[j]),
+            'sum': float(totals[j]),
+            'sum_sq': float(squares[j]),
+            'win_rate': int(wins[j]) / count,
+            'avg_return': float(totals[j]) / count,
+        }
+        for q, value in zip(PERCENTILES, percentiles[:, j]):
+            item['median' if q == 50 else f"p{q}"] = float(value)
+        stats.append(item)
+    return stats
+
+
+def forward_profits(df, horizons=HORIZONS):
+    """
+    每根 K 线出信号时各持有期的收益矩阵 (K线数, 持有期数) 及其是否有效（卖出日未越界）。
+    与信号无关，可由同一只股票上的多个检测函数或多组参数共用。
+    """
+    opens = df['开盘'].to_numpy()
+    closes = df['收盘'].to_numpy()
+    n = len(df)
+    rows = np.arange(n)
+    sell_idx = rows[:, None] + np.asarray(horizons)[None, :]
+    valid = sell_idx < n
+    buy = opens[np.minimum(rows + 1, n - 1)][:, None]
+    sell = closes[np.minimum(sell_idx, n - 1)]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        profits = np.where(valid, (sell - buy) / buy, np.nan).astype(np.float64)
+    return profits, valid
+
+
+def signal_stats(mask, profits, valid, horizons=HORIZONS):
+    """从 forward_profits 的结果中取出信号所在行，计算各持有期统计"""
+    return column_stats(horizons, profits, valid & mask[:, None])
+
+
+def calculate_indicator_stats(df, indicator_func, horizons=HORIZONS, forward=None):
+    """
+    一次性计算全部信号在各持有期下的收益，forward 为预先算好的 forward_profits(df, horizons)。
+    返回列表，每项为 {days, count, wins, sum, sum_sq, win_rate, avg_return, median, p10, p25, p75, p90}。
+    """
+    try:
+        mask = indicator_func(df).to_numpy(dtype=bool, na_value=False)
+    except KeyError as e:
+        print(f"数据列缺失错误: {str(e)}")
+        return [empty_stats(h) for h in horizons]
+
+    profits, valid = forward if forward is not None else forward_profits(df, horizons)
+    return signal_stats(mask, profits, valid, horizons)
+
+
+def indicator_result(name, stats):
+    """组装单个指标的结果：主表字段取 5 日持有期，horizons 保留全部持有期"""
+    main = next(h for h in stats if h['days'] == MAIN_HORIZON)
+    return {
+        'name': name,
+        'count': main['count'],
+        'wins': main['wins'],
+        'win_rate': main['win_rate'],
+        'avg_return': main['avg_return'],
+        'horizons': stats
+    }
+
+
+class SummaryAggregator:
+    """
+    全市场汇总的流式累加器：逐股结果到达即并入，只保留每个指标、每个持有期的
+    信号数、盈利次数（精确整数）、收益和与收益平方和，内存占用与股票数无关。
+    不同进程或分片的累加器可以 merge，也可以用 to_dict/from_dict 落盘后再合并。
+    """
+
+    def __init__(self, names=()):
+        self.stocks = 0
+        self.data = {name: {} for name in names}
+
+    def add(self, stock_result):
+        self.stocks += 1
+        for indicator in stock_result['results']:
+            horizons = self.data.setdefault(indicator['name'], {})
+            for h in indicator['horizons']:
+                agg = horizons.setdefault(h['days'], [0, 0, 0.0, 0.0])
+                agg[0] += h['count']
+                agg[1] += h['wins']
+                agg[2] += h['sum']
+                agg[3] += h['sum_sq']
+        return self
+
+    def merge(self, other):
+        self.stocks += other.stocks
+        for name, horizons in other.data.items():
+            mine = self.data.setdefault(name, {})
+            for days, values in horizons.items():
+                agg = mine.setdefault(days, [0, 0, 0.0, 0.0])
+                for i, value in enumerate(values):
+                    agg[i] += value
+        return self
+
+    def get(self, name, days):
+        """返回 {count, wins, win_rate, avg_return, std}，无信号时比率为 None"""
+        count, wins, total, total_sq = self.data.get(name, {}).get(days, [0, 0, 0.0, 0.0])
+        if count == 0:
+            return {'count': 0, 'wins': 0, 'win_rate': None, 'avg_return': None, 'std': None}
+        mean = total / count
+        return {
+            'count': count,
+            'wins': wins,
+            'win_rate': wins / count,
+            'avg_return': mean,
+            'std': math.sqrt(max(total_sq / count - mean * mean, 0.0)),
+        }
+
+    def horizons(self, name):
+        return sorted(self.data.get(name, {}))
+
+    def to_dict(self):
+        return {
+            'stocks': self.stocks,
+            'data': {name: {str(days): values for days, values in horizons.items()}
+                     for name, horizons in self.data.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, payload):
+        agg = cls()
+        agg.stocks = payload['stocks']
+        agg.data = {name: {int(days): list(values) for days, values in horizons.items()}
+                    for name, horizons in payload['data'].items()}
+        return agg
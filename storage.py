@@ -0,0 +1,345 @@
+import os
+import json
+import shutil
+import hashlib
+from glob import glob
+
+import numpy as np
+import pandas as pd
+
+from symbols import DEFAULT_PATH, lookup_filename
+
+
+# ----------------- 本地行情存储 -----------------
+# 每只股票一个目录 {store_path}/{code}/，每列一个 .npy 文件，meta.json 记录元信息。
+# 读取时以 mmap 方式打开，按需投影列、按日期二分切片，不再解析文本。
+#
+# 复权：meta.json 含 adjust 段时，价格列保存的是不复权价格，另存一张后复权因子表（因子变化日与因子），
+# 读取时按 qfq / hfq / none 对价格列做一次向量乘法：hfq = 原价 × F(t)，qfq = 原价 × F(t) / F(最新)。
+# 除权除息只需更新因子表，不改写历史 K 线。没有 adjust 段的旧存储保存的是下载时已复权的价格，原样返回。
+
+STORE_VERSION = 1
+ADJUST_MODES = ('qfq', 'hfq', 'none')
+ADJUSTED_COLUMNS = ('开盘', '收盘', '最高', '最低', '涨跌额')  # 随复权缩放的列；涨跌幅、振幅、换手率为比率，不变
+FACTOR_FILES = ('factor_date.npy', 'factor.npy')
+
+# 列名 -> (文件名, 存储类型)
+COLUMN_SPECS = {
+    '日期': ('date', 'datetime64[ns]'),
+    '开盘': ('open', 'float32'),
+    '收盘': ('close', 'float32'),
+    '最高': ('high', 'float32'),
+    '最低': ('low', 'float32'),
+    '成交量': ('volume', 'int64'),
+    '成交额': ('amount', 'float64'),
+    '振幅': ('amplitude', 'float32'),
+    '涨跌幅': ('pct_change', 'float32'),
+    '涨跌额': ('change', 'float32'),
+    '换手率': ('turnover', 'float32'),
+}
+
+META_COLUMNS = ['stock_code', 'stock_name']
+CSV_COLUMNS = META_COLUMNS + list(COLUMN_SPECS)
+
+
+def stock_dir(store_path, code):
+    return os.path.join(store_path, str(code))
+
+
+def has_stock(store_path, code):
+    return os.path.exists(os.path.join(stock_dir(store_path, code), 'meta.json'))
+
+
+def list_stocks(store_path):
+    """列出存储中已有的股票代码"""
+    if not os.path.isdir(store_path):
+        return []
+    return sorted(name for name in os.listdir(store_path) if has_stock(store_path, name))
+
+
+def list_codes(data_dir):
+    """列出数据目录中所有可加载的股票代码（列式存储与 CSV 文件）"""
+    codes = set(list_stocks(data_dir))
+    for path in glob(os.path.join(data_dir, "*-*.csv")):
+        codes.add(os.path.basename(path).split('-', 1)[0])
+    return sorted(codes)
+
+
+def read_meta(store_path, code):
+    with open(os.path.join(stock_dir(store_path, code), 'meta.json'), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def validate_stock(store_path, code):
+    """检查存储是否完整：元信息可读、各列长度一致、日期严格递增"""
+    try:
+        meta = read_meta(store_path, code)
+        base = stock_dir(store_path, code)
+        for col, spec in meta['columns'].items():
+            arr = np.load(os.path.join(base, spec['file']), mmap_mode='r')
+            if len(arr) != meta['rows']:
+                return False
+        dates = np.load(os.path.join(base, meta['columns']['日期']['file']), mmap_mode='r')
+        if 'adjust' in meta:
+            factor_dates, factors = load_factors(store_path, code)
+            if len(factor_dates) != len(factors) or not np.all(factor_dates[1:] > factor_dates[:-1]):
+                return False
+        return meta['rows'] > 0 and bool(np.all(dates[1:] > dates[:-1]))
+    except (OSError, ValueError, KeyError):
+        return False
+
+
+def load_factors(store_path, code):
+    """后复权因子表 (变化日期 datetime64[ns], 因子 float64)，没有因子表时返回 None"""
+    base = stock_dir(store_path, code)
+    if not os.path.exists(os.path.join(base, FACTOR_FILES[1])):
+        return None
+    return tuple(np.load(os.path.join(base, name)) for name in FACTOR_FILES)
+
+
+def save_factors(store_path, code, factor_dates, factors, default='qfq'):
+    """
+    写入（或更新）已有股票的后复权因子表，default 为读取时默认的复权方式。
+    只替换因子文件和 meta.json，不改写 K 线；因子表和默认方式均未变化时不写入并返回 False。
+    """
+    order = np.argsort(np.asarray(factor_dates, dtype='datetime64[ns]'))
+    factor_dates = np.asarray(factor_dates, dtype='datetime64[ns]')[order]
+    factors = np.asarray(factors, dtype=np.float64)[order]
+    meta = read_meta(store_path, code)
+    old = load_factors(store_path, code)
+    if (old is not None and meta.get('adjust', {}).get('default') == default and not meta['adjust'].get('stale')
+            and np.array_equal(old[0], factor_dates) and np.array_equal(old[1], factors)):
+        return False
+
+    base = stock_dir(store_path, code)
+    for name, values in zip(FACTOR_FILES, (factor_dates, factors)):
+        np.save(os.path.join(base, name + '.tmp.npy'), values, allow_pickle=False)
+        os.replace(os.path.join(base, name + '.tmp.npy'), os.path.join(base, name))
+    meta['adjust'] = {'default': default, 'factors': len(factors)}
+    _write_meta(store_path, code, meta)
+    return True
+
+
+def mark_factors_stale(store_path, code):
+    """因子表拉取失败、沿用旧因子表时标记为待刷新，下次下载即使 K 线已是最新也会重新拉取"""
+    meta = read_meta(store_path, code)
+    meta['adjust']['stale'] = True
+    _write_meta(store_path, code, meta)
+
+
+def factors_stale(store_path, code):
+    return has_stock(store_path, code) and read_meta(store_path, code).get('adjust', {}).get('stale', False)
+
+
+def stores_raw(store_path, code):
+    """列式存储是否保存不复权价格（含复权因子表）；已复权的旧存储与 CSV 返回 False"""
+    return has_stock(store_path, code) and 'adjust' in read_meta(store_path, code)
+
+
+def _write_meta(store_path, code, meta):
+    tmp = os.path.join(stock_dir(store_path, code), 'meta.json.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, os.path.join(stock_dir(store_path, code), 'meta.json'))
+
+
+def price_basis(store_path, code, adjust=None):
+    """
+    价格口径：复权方式与因子表的摘要，因子表变化（新的除权除息）时随之改变。
+    依赖历史价格的增量状态据此判断是否需要重建；已复权的旧存储与 CSV 返回 None。
+    """
+    if not has_stock(store_path, code):
+        return None
+    meta = read_meta(store_path, code)
+    if 'adjust' not in meta:
+        return None
+    factor_dates, factors = load_factors(store_path, code)
+    digest = hashlib.sha1(factor_dates.tobytes() + factors.tobytes()).hexdigest()[:16]
+    return f"{adjust or meta['adjust']['default']}:{digest}"
+
+
+def adjustment(dates, factor_dates, factors, mode):
+    """每根 K 线的价格乘数；mode 为 none 时返回 None"""
+    if mode == 'none':
+        return None
+    idx = np.maximum(np.searchsorted(factor_dates, dates, side='right') - 1, 0)
+    scale = factors[idx]
+    return scale / factors[-1] if mode == 'qfq' else scale
+
+
+def save_stock(store_path, code, name, df, extra_meta=None, raw=False):
+    """
+    将单只股票的日线写入列式存储（先写临时目录再替换，避免半写文件），extra_meta 并入 meta.json。
+    raw 为真表示 df 为不复权价格：已有的复权因子表会被保留，因子表由 save_factors 写入。
+    """
+    df = df.copy()
+    df['日期'] = pd.to_datetime(df['日期'])
+    df = df.sort_values('日期').reset_index(drop=True)
+
+    target = stock_dir(store_path, code)
+    tmp = target + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    adjust = None
+    if raw and has_stock(store_path, code) and 'adjust' in read_meta(store_path, code):
+        adjust = read_meta(store_path, code)['adjust']
+        for fname in FACTOR_FILES:
+            shutil.copyfile(os.path.join(target, fname), os.path.join(tmp, fname))
+
+    columns = {}
+    for col in df.columns:
+        if col in META_COLUMNS:
+            continue
+        if col in COLUMN_SPECS:
+            fname, dtype = COLUMN_SPECS[col]
+        elif pd.api.types.is_numeric_dtype(df[col]):
+            fname, dtype = f"extra_{len(columns)}", 'float64'
+        else:
+            continue
+        values = df[col].to_numpy(dtype=dtype)
+        np.save(os.path.join(tmp, fname + '.npy'), values, allow_pickle=False)
+        columns[col] = {'file': fname + '.npy', 'dtype': dtype}
+
+    meta = {
+        'version': STORE_VERSION,
+        'stock_code': str(code),
+        'stock_name': name,
+        'rows': len(df),
+        'first_date': df['日期'].iloc[0].strftime('%Y-%m-%d') if len(df) else None,
+        'last_date': df['日期'].iloc[-1].strftime('%Y-%m-%d') if len(df) else None,
+        'columns': columns,
+        **({'adjust': adjust} if adjust else {}),
+        **(extra_meta or {}),
+    }
+    with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp, target)
+    return target
+
+
+def _date_slice(dates, start, end):
+    """在已排序的日期列上二分查找 [start, end] 区间"""
+    lo, hi = 0, len(dates)
+    if start is not None:
+        lo = int(np.searchsorted(dates, np.datetime64(pd.Timestamp(start), 'ns'), side='left'))
+    if end is not None:
+        hi = int(np.searchsorted(dates, np.datetime64(pd.Timestamp(end), 'ns'), side='right'))
+    return slice(lo, hi)
+
+
+def _load_from_store(store_path, code, columns, start, end, tail=None, adjust=None):
+    meta = read_meta(store_path, code)
+    base = stock_dir(store_path, code)
+    stored = meta['columns']
+
+    dates = np.load(os.path.join(base, stored['日期']['file']), mmap_mode='r')
+    rows = _date_slice(dates, start, end)
+    if tail is not None:
+        rows = slice(max(rows.start, rows.stop - tail), rows.stop)
+
+    if columns is None:
+        wanted = list(CSV_COLUMNS) + [c for c in stored if c not in COLUMN_SPECS]
+    else:
+        wanted = list(columns)
+
+    data = {}
+    n = rows.stop - rows.start
+    for col in wanted:
+        if col in META_COLUMNS:
+            data[col] = np.full(n, meta[col], dtype=object)
+            continue
+        if col not in stored:
+            if columns is None:
+                continue
+            raise KeyError(col)
+        arr = np.load(os.path.join(base, stored[col]['file']), mmap_mode='r')
+        data[col] = np.array(arr[rows])
+
+    if 'adjust' in meta:
+        mode = adjust or meta['adjust']['default']
+        if mode not in ADJUST_MODES:
+            raise ValueError(f"不支持的复权方式：{mode}，可选：{', '.join(ADJUST_MODES)}")
+        scale = adjustment(dates[rows], *load_factors(store_path, code), mode)
+        for col in ADJUSTED_COLUMNS:
+            if scale is not None and col in data:
+                data[col] = (data[col].astype(np.float64) * scale).astype(data[col].dtype)
+    return pd.DataFrame(data)
+
+
+def fingerprint(data_dir, code, master_path=DEFAULT_PATH):
+    """数据文件指纹（文件名、大小、修改时间），数据不存在时返回 None"""
+    if has_stock(data_dir, code):
+        path = os.path.join(stock_dir(data_dir, code), 'meta.json')
+    else:
+        path = find_csv(data_dir, code, master_path)
+    if path is None:
+        return None
+    st = os.stat(path)
+    return f"{os.path.basename(path)}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def find_csv(data_dir, code, master_path=DEFAULT_PATH):
+    """优先按代码主表（master_path）中的名称直接定位文件，主表缺失或名称已变化时再按 {code}-*.csv 查找"""
+    filename = lookup_filename(code, master_path)
+    if filename is not None:
+        path = os.path.join(data_dir, filename)
+        if os.path.exists(path):
+            return path
+    files = glob(os.path.join(data_dir, f"{code}-*.csv"))
+    return files[0] if files else None
+
+
+def read_csv_bars(filepath, columns=None, start=None, end=None, tail=None):
+    """兼容旧版 CSV 文件的读取"""
+    df = pd.read_csv(filepath, dtype={'stock_code': str})
+    df['日期'] = pd.to_datetime(df['日期'])
+    df = df.sort_values('日期').reset_index(drop=True)
+    if start is not None:
+        df = df[df['日期'] >= pd.Timestamp(start)]
+    if end is not None:
+        df = df[df['日期'] <= pd.Timestamp(end)]
+    if tail is not None:
+        df = df.iloc[-tail:] if tail > 0 else df.iloc[:0]
+    if columns is not None:
+        df = df[list(columns)]
+    return df.reset_index(drop=True)
+
+
+def load_stock(data_dir, code, columns=None, start=None, end=None, tail=None, adjust=None, master_path=DEFAULT_PATH):
+    """
+    统一的行情加载入口：优先读取列式存储，不存在时回退到 {code}-*.csv。
+    columns 为需要的列（None 表示全部），start/end 为闭区间日期，
+    tail 为只取区间内最后的 tail 根 K 线（列式存储只读取这一段）。
+    adjust 为 qfq / hfq / none，None 时取下载时配置的默认方式；已复权的旧存储与 CSV 忽略该参数。
+    master_path 为定位 CSV 文件所用的代码主表。数据不存在时返回 None。
+    """
+    if has_stock(data_dir, code):
+        return _load_from_store(data_dir, code, columns, start, end, tail, adjust).reset_index(drop=True)
+    filepath = find_csv(data_dir, code, master_path)
+    if filepath is None:
+        return None
+    return read_csv_bars(filepath, columns, start, end, tail)
+
+
+def export_csv(store_path, code, output_dir=None):
+    """导出为旧版 CSV 格式（UTF-8-BOM，文件名 {code}-{name}.csv）"""
+    output_dir = output_dir or store_path
+    os.makedirs(output_dir, exist_ok=True)
+    name = read_meta(store_path, code)['stock_name']
+    df = _load_from_store(store_path, code, None, None, None)
+    df['日期'] = df['日期'].dt.strftime('%Y-%m-%d')
+    filepath = os.path.join(output_dir, f"{code}-{name}.csv")
+    df.to_csv(filepath, index=False, encoding='utf_8_sig')
+    return filepath
+
+
+if __name__ == "__main__":
+    # 将存储中的全部股票导出为 CSV
+    with open('download_config.json', 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    store_path = config.get('save_path', './stock_data')
+    for code in list_stocks(store_path):
+        print(export_csv(store_path, code, config.get('csv_path', store_path)))
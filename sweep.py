@@ -0,0 +1,182 @@
+import os
+import json
+import hashlib
+import argparse
+import itertools
+from functools import partial
+from multiprocessing import Pool
+
+import pandas as pd
+from tqdm import tqdm
+
+from resample import DAILY, load_bars, parse_timeframe
+from symbols import DEFAULT_PATH, resolve_master_path
+from analysis_cache import analysis_signature
+from indicators import DETECTORS, FeatureFrame, get_indicators
+from stats import HORIZONS, SummaryAggregator, forward_profits, signal_stats
+
+
+# ----------------- 参数扫描 -----------------
+# 在全市场上一次评估检测函数的参数网格。每只股票只加载一次：
+# 滞后、均线、各 span 的 EMA 由 FeatureFrame 在所有参数组合间共享，
+# 各持有期的逐 K 线收益矩阵（forward_profits）也只算一次，每组参数只需取出信号所在行。
+# 结果按 (指标, 参数) 流式并入 SummaryAggregator，定期把已完成的股票和累加器写入状态文件，
+# 中断后重新运行会跳过已完成的股票。
+
+SWEEP_COLUMNS = ['日期', '开盘', '收盘', '最高', '最低', '成交量']
+
+
+def expand_grid(grid):
+    """{指标: {参数: [取值...]}} -> [(结果键, 指标, 完整参数)]，未列出的参数取默认值"""
+    combos = []
+    for name, values in grid.items():
+        if name not in DETECTORS:
+            raise ValueError(f"未知的指标：{name}")
+        defaults = DETECTORS[name].params
+        unknown = set(values) - set(defaults)
+        if unknown:
+            raise ValueError(f"{name} 没有参数：{', '.join(sorted(unknown))}")
+        keys = sorted(values)
+        for combo in itertools.product(*(values[k] for k in keys)):
+            params = {**defaults, **dict(zip(keys, combo))}
+            combos.append((f"{name}|{json.dumps(params, sort_keys=True)}", name, params))
+    return combos
+
+
+def sweep_signature(combos, horizons, timeframe=DAILY, adjust=None):
+    basis = f":{adjust}" if adjust else ""  # 复权方式不同的进度不能混用
+    digest = hashlib.sha1(f"{analysis_signature(get_indicators(), horizons)}:{timeframe}{basis}".encode('utf-8'))
+    digest.update(json.dumps([key for key, _, _ in combos], ensure_ascii=False).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def sweep_stock(code, data_dir, combos, horizons=HORIZONS, timeframe=DAILY, resample_dir=None, adjust=None,
+                master_path=DEFAULT_PATH):
+    """单只股票上评估全部参数组合，返回可直接并入 SummaryAggregator 的结果"""
+    try:
+        df = load_bars(data_dir, code, SWEEP_COLUMNS, timeframe=timeframe, cache_dir=resample_dir, adjust=adjust,
+                       master_path=master_path)
+        if df is None or df.empty:
+            return {'code': code, 'error': f"未找到股票 {code} 的数据"}
+        features = FeatureFrame(df)
+        profits, valid = forward_profits(features, horizons)
+        results = []
+        for key, name, params in combos:
+            mask = DETECTORS[name].func(features, **params).to_numpy(dtype=bool, na_value=False)
+            results.append({'name': key, 'horizons': signal_stats(mask, profits, valid, horizons)})
+        return {'code': code, 'results': results}
+    except Exception as e:
+        return {'code': code, 'error': f"处理 {code} 时发生错误：{str(e)}"}
+
+
+def load_sweep_state(path, signature):
+    """读取状态文件；网格、持有期或检测代码变化时视为新任务"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return set(), None
+    if state.get('signature') != signature:
+        return set(), None
+    return set(state['done']), SummaryAggregator.from_dict(state['summary'])
+
+
+def save_sweep_state(path, signature, done, summary):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'signature': signature, 'done': sorted(done), 'summary': summary.to_dict()}, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def sweep_table(summary, combos):
+    """每个 (指标, 参数, 持有天数) 一行的统计表"""
+    rows = []
+    for key, name, params in combos:
+        label = ', '.join(f"{k}={v}" for k, v in params.items())
+        for days in summary.horizons(key):
+            s = summary.get(key, days)
+            rows.append({
+                '指标': name,
+                '参数': label,
+                '持有天数': days,
+                '信号数': s['count'],
+                '胜率': s['win_rate'],
+                '平均收益': s['avg_return'],
+                '收益标准差': s['std'],
+            })
+    return pd.DataFrame(rows, columns=['指标', '参数', '持有天数', '信号数', '胜率', '平均收益', '收益标准差'])
+
+
+def run_sweep(stock_codes, data_dir, grid, horizons=HORIZONS, state_path='./sweep_state.json', table_path=None,
+              workers=1, chunksize=16, checkpoint_every=200, restart=False, timeframe=DAILY, resample_dir=None,
+              adjust=None, master_path=DEFAULT_PATH):
+    combos = expand_grid(grid)
+    timeframe = parse_timeframe(timeframe)
+    signature = sweep_signature(combos, horizons, timeframe, adjust)
+    done, summary = (set(), None) if restart else load_sweep_state(state_path, signature)
+    summary = summary or SummaryAggregator([key for key, _, _ in combos])
+    todo = [code for code in stock_codes if code not in done]
+    if done:
+        print(f"从上次中断处继续：已完成 {len(done)} 只，剩余 {len(todo)} 只")
+
+    def checkpoint():
+        save_sweep_state(state_path, signature, done, summary)
+        if table_path:
+            sweep_table(summary, combos).to_csv(table_path, index=False, encoding='utf_8_sig')
+
+    task = partial(sweep_stock, data_dir=data_dir, combos=combos, horizons=horizons,
+                   timeframe=timeframe, resample_dir=resample_dir, adjust=adjust, master_path=master_path)
+    pool = Pool(processes=workers) if workers > 1 else None
+    try:
+        results = pool.imap_unordered(task, todo, chunksize=chunksize) if pool else map(task, todo)
+        for i, result in enumerate(tqdm(results, total=len(todo), desc="🔍 参数扫描"), 1):
+            if 'error' in result:
+                tqdm.write(f"⚠️ {result['error']}")
+            else:
+                summary.add(result)
+            done.add(result['code'])
+            if i % checkpoint_every == 0:
+                checkpoint()
+    finally:
+        if pool:
+            pool.terminate()
+        checkpoint()
+    return sweep_table(summary, combos)
+
+
+def main(config_path='config.json', restart=False):
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+
+    sweep = config.get('sweep', {})
+    if not sweep.get('grid'):
+        print("配置中未设置 sweep.grid")
+        return
+    output_dir = config['output_dir']
+    os.makedirs(output_dir, exist_ok=True)
+    table_path = os.path.join(output_dir, "参数扫描.csv")
+
+    table = run_sweep(
+        config['stock_codes'], config['data_dir'], sweep['grid'],
+        horizons=tuple(sweep.get('horizons', config.get('horizons', HORIZONS))),
+        state_path=sweep.get('state_file', './sweep_state.json'),
+        table_path=table_path,
+        workers=config.get('workers', 1) or os.cpu_count(),
+        chunksize=config.get('chunksize', 16),
+        checkpoint_every=sweep.get('checkpoint_every', 200),
+        restart=restart,
+        timeframe=config.get('timeframe', DAILY),
+        resample_dir=config.get('resample_dir'),
+        adjust=config.get('adjust'),
+        master_path=resolve_master_path(config, config_path),
+    )
+    print(f"\n共 {table[['指标', '参数']].drop_duplicates().shape[0]} 组参数，结果已保存至：{table_path}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="检测函数参数扫描")
+    parser.add_argument('--config', default='config.json')
+    parser.add_argument('--restart', action='store_true', help="忽略上次的进度重新开始")
+    args = parser.parse_args()
+    main(args.config, args.restart)
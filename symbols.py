@@ -0,0 +1,158 @@
+import os
+import re
+import json
+from datetime import datetime, timedelta
+
+
+# ----------------- 股票代码主表 -----------------
+# 全市场股票的代码、名称、交易所、上市日期和刷新时间保存在一个 JSON 文件中，
+# 超过 TTL 才重新拉取行情接口；离线模式下只读本地主表。
+# 下载、代码清单生成和行情加载都通过主表做 O(1) 的代码 -> 名称查询。
+
+DEFAULT_PATH = './symbols.json'
+DEFAULT_TTL_HOURS = 24
+LIST_DATE_COLUMNS = ('上市日期', '上市时间')
+
+
+def sanitize_filename(name):
+    """去除文件名中的非法字符"""
+    # 替换Windows系统非法字符
+    cleaned = re.sub(r'[\\/*?:"<>|]', '', str(name))
+    # 替换空格和特殊空白字符
+    return cleaned.replace(' ', '_').replace('\u3000', '_')
+
+
+def exchange_of(code):
+    """由代码前缀判断交易所：SH 上交所、SZ 深交所、BJ 北交所"""
+    code = str(code)
+    if code.startswith(('4', '8', '92')):
+        return 'BJ'
+    if code.startswith(('6', '9')):
+        return 'SH'
+    return 'SZ'
+
+
+def _first_local_date(data_dir, code):
+    """本地列式存储中最早的 K 线日期，作为缺少上市日期时的近似值"""
+    import storage
+
+    if data_dir is None or not storage.has_stock(data_dir, code):
+        return None
+    return storage.read_meta(data_dir, code).get('first_date')
+
+
+class SymbolMaster:
+    def __init__(self, path=DEFAULT_PATH, ttl_hours=DEFAULT_TTL_HOURS, offline=False):
+        self.path = path
+        self.ttl = timedelta(hours=ttl_hours)
+        self.offline = offline
+        self.refreshed_at = None
+        self.symbols = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.refreshed_at = datetime.fromisoformat(data['refreshed_at'])
+        self.symbols = {item['code']: item for item in data['symbols']}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        data = {
+            'refreshed_at': self.refreshed_at.isoformat(timespec='seconds'),
+            'symbols': [self.symbols[code] for code in sorted(self.symbols)],
+        }
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.path)
+
+    def is_stale(self):
+        return not self.symbols or self.refreshed_at is None or datetime.now() - self.refreshed_at > self.ttl
+
+    def refresh(self, source, data_dir=None):
+        """从行情接口重新拉取全市场代码表；接口未提供上市日期时沿用旧值或取本地最早 K 线日期"""
+        df = source.stock_zh_a_spot_em()
+        list_col = next((col for col in LIST_DATE_COLUMNS if col in df.columns), None)
+        refreshed_at = datetime.now()
+
+        symbols = {}
+        for i, (code, name) in enumerate(zip(df['代码'].astype(str), df['名称'])):
+            code = code.zfill(6)
+            if not code.isdigit():
+                continue
+            list_date = str(df[list_col].iloc[i])[:10] if list_col else None
+            if not list_date or list_date in ('nan', 'NaT', 'None'):
+                old = self.symbols.get(code, {})
+                list_date = old.get('list_date') or _first_local_date(data_dir, code)
+            symbols[code] = {
+                'code': code,
+                'name': str(name),
+                'exchange': exchange_of(code),
+                'list_date': list_date,
+                'refreshed_at': refreshed_at.isoformat(timespec='seconds'),
+            }
+        self.symbols = symbols
+        self.refreshed_at = refreshed_at
+        self.save()
+        return self
+
+    def ensure(self, source, data_dir=None):
+        """主表过期时刷新；离线模式或刷新失败时沿用本地主表"""
+        if self.offline or not self.is_stale():
+            if not self.symbols:
+                print(f"警告：离线模式下未找到代码主表 {self.path}")
+            return self
+        try:
+            self.refresh(source, data_dir)
+        except Exception as e:
+            print(f"代码主表刷新失败，沿用本地主表: {str(e)}")
+        return self
+
+    def __contains__(self, code):
+        return str(code) in self.symbols
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def get(self, code):
+        return self.symbols.get(str(code))
+
+    def name(self, code, default=None):
+        item = self.symbols.get(str(code))
+        return item['name'] if item else default
+
+    def codes(self):
+        return sorted(self.symbols)
+
+
+_loaded = {}
+
+
+def load_master(path=DEFAULT_PATH):
+    """只读方式获取主表，按文件修改时间缓存；主表不存在时返回 None"""
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    cached = _loaded.get(path)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, SymbolMaster(path, offline=True))
+        _loaded[path] = cached
+    return cached[1]
+
+
+def resolve_master_path(config, config_path):
+    """配置中的代码主表路径 symbol_master（默认 ./symbols.json），相对路径按配置文件所在目录解析，与当前目录无关"""
+    path = config.get('symbol_master') or DEFAULT_PATH
+    return os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(config_path)), path))
+
+
+def lookup_filename(code, path=DEFAULT_PATH):
+    """主表中的 {code}-{名称}.csv 文件名，主表不存在或无此代码时返回 None"""
+    master = load_master(path)
+    name = master.name(code) if master is not None else None
+    return f"{code}-{sanitize_filename(name)}.csv" if name is not None else None
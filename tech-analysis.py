@@ -1,70 +1,22 @@
-import pandas as pd
 import os
 import json
+from functools import partial
+from multiprocessing import Pool
 from tqdm import tqdm
-from glob import glob
 
+from storage import fingerprint
+from symbols import DEFAULT_PATH, resolve_master_path
+from resample import DAILY, load_bars, parse_timeframe
+from analysis_cache import AnalysisCache, analysis_signature
+from instrument import NULL_TRACE, RunReport, new_trace
+from shard import DEFAULT_SHARD_DIR, load_partials, mark_running, report_problems, select_shard, shard_label, write_partial
+from indicators import FeatureFrame, get_indicators
+from panel import Panel, analyze_panel
+from stats import HORIZONS, MAIN_HORIZON, calculate_indicator_stats, forward_profits, indicator_result, SummaryAggregator
 
-def calculate_macd(df, fast=12, slow=26, signal=9):
-    ema_fast = df['收盘'].ewm(span=fast, adjust=False).mean()
-    ema_slow = df['收盘'].ewm(span=slow, adjust=False).mean()
-    dif = ema_fast - ema_slow
-    dea = dif.ewm(span=signal, adjust=False).mean()
-    return dif, dea
 
-
-def detect_macd_golden_cross(df):
-    dif, dea = calculate_macd(df)
-    golden_cross = (dif > dea) & (dif.shift(1) <= dea.shift(1))
-    return golden_cross
-
-
-def detect_morning_star(df):
-    # 第一天阴线
-    day1 = (df['收盘'].shift(2) < df['开盘'].shift(2))
-    # 第二天十字星
-    day2_body = abs(df['收盘'].shift(1) - df['开盘'].shift(1))
-    day2_range = df['最高'].shift(1) - df['最低'].shift(1)
-    day2_doji = (day2_body / (day2_range + 1e-5)) < 0.1  # 防止除零
-    # 第三天阳线且收盘超第一天中点
-    day3 = (df['收盘'] > df['开盘']) & (df['收盘'] > (df['开盘'].shift(2) + df['收盘'].shift(2)) / 2)
-    return day1 & day2_doji & day3
-
-
-def detect_sanyang_kaitai(df):
-    # 三阳开泰：连续三根阳线且收盘价递增
-    cond1 = (df['收盘'] > df['开盘'])
-    cond2 = (df['收盘'].shift(1) > df['开盘'].shift(1)) & (df['收盘'] > df['收盘'].shift(1))
-    cond3 = (df['收盘'].shift(2) > df['开盘'].shift(2)) & (df['收盘'].shift(1) > df['收盘'].shift(2))
-    return cond1 & cond2 & cond3
-
-
-def detect_chushui_furong(df):
-    # 出水芙蓉：突破30日均线且涨幅>5%
-    ma30 = df['收盘'].rolling(30).mean()
-    cond1 = (df['收盘'] > ma30) & (df['收盘'].shift(1) <= ma30.shift(1))
-    cond2 = (df['收盘'] / df['开盘'] - 1) >= 0.05
-    cond3 = df['成交量'] > df['成交量'].rolling(30).mean().shift(1)
-    return cond1 & cond2 & cond3
-
-
-def detect_xuri_dongsheng(df):
-    # 旭日东升
-    day1_close = df['收盘'].shift(1)
-    day1_open = df['开盘'].shift(1)
-    day1_cond = (day1_close < day1_open) & ((day1_open - day1_close) / day1_open > 0.03)
-    day2_open_cond = df['开盘'] < day1_close
-    day2_close_cond = df['收盘'] > day1_open
-    return day1_cond & day2_open_cond & day2_close_cond
-
-
-def detect_duofangpao(df):
-    # 多方炮：两阳夹一阴
-    day1 = (df['收盘'].shift(2) > df['开盘'].shift(2))
-    day2_body = (df['收盘'].shift(1) < df['开盘'].shift(1))
-    day2_size = (df['开盘'].shift(1) - df['收盘'].shift(1)) / df['开盘'].shift(1) < 0.03
-    day3 = (df['收盘'] > df['开盘']) & (df['收盘'] > df['收盘'].shift(2))
-    return day1 & day2_body & day2_size & day3
+def _fmt_pct(value, count):
+    return f"{value * 100:.2f}%" if count > 0 else "N/A"
 
 
 def generate_report(stock_code, stock_name, results, output_dir):
@@ -79,202 +31,285 @@ def generate_report(stock_code, stock_name, results, output_dir):
         avg_return = f"{res['avg_return'] * 100:.2f}%" if count > 0 else "N/A"
         table += f"| {name} | {count} | {win_rate} | {avg_return} |\n"
     content += table
+
+    content += "\n## 不同持有期收益分布\n\n"
+    table = "| 指标名称 | 持有天数 | 次数 | 胜率 | 平均收益 | 中位数 | P10 | P25 | P75 | P90 |\n"
+    table += "|----------|----------|------|------|----------|--------|-----|-----|-----|-----|\n"
+    for res in results:
+        for h in res.get('horizons', []):
+            n = h['count']
+            cells = [_fmt_pct(h[key], n) for key in ('win_rate', 'avg_return', 'median', 'p10', 'p25', 'p75', 'p90')]
+            table += f"| {res['name']} | {h['days']} | {n} | " + " | ".join(cells) + " |\n"
+    content += table
+
     filename = f"{stock_code}-{stock_name}.md"
     filepath = os.path.join(output_dir, filename)
     with open(filepath, 'w', encoding='utf-8') as f:
         f.write(content)
 
 
-def calculate_indicator_stats(df, indicator_func):
-    """返回三元组 (出现次数, 胜率, 平均收益)"""
-    try:
-        signals = df.loc[indicator_func(df)].index
-    except KeyError as e:
-        print(f"数据列缺失错误: {str(e)}")
-        return 0, 0.0, 0.0
-
-    profits = []
-    for idx in signals:
-        if idx + 5 >= len(df):
-            continue
-        try:
-            buy_price = df.iloc[idx + 1]['开盘']
-            sell_price = df.iloc[idx + 5]['收盘']
-            profit = (sell_price - buy_price) / buy_price
-            profits.append(profit)
-        except IndexError:
-            continue
-
-    if not profits:
-        return 0, 0.0, 0.0
-
-    wins = sum(1 for p in profits if p > 0)
-    win_rate = wins / len(profits)
-    avg_return = sum(profits) / len(profits)
-    return len(profits), win_rate, avg_return  # 确保返回三元组
-
-
-def generate_summary_report(all_results, output_dir):
-    """修正后的汇总统计逻辑"""
-    summary = {}
-
-    # 初始化指标
-    indicator_names = [name for name, _ in [
-        ('三阳开泰', None),
-        ('出水芙蓉', None),
-        ('旭日东升', None),
-        ('多方炮', None),
-        ('早晨之星', None),
-        ('MACD金叉', None)
-    ]]
-
-    for name in indicator_names:
-        summary[name] = {
-            'total_signals': 0,
-            'total_wins': 0,
-            'total_return': 0.0
-        }
-
-    # 聚合数据
-    for stock_data in all_results:
-        for indicator in stock_data['results']:
-            name = indicator['name']
-            count = indicator['count']
-            win_rate = indicator['win_rate']
-            avg_return = indicator['avg_return']
-
-            summary[name]['total_signals'] += count
-            summary[name]['total_wins'] += int(count * win_rate)
-            summary[name]['total_return'] += avg_return * count
+def generate_summary_report(summary, output_dir):
+    """
+    由 SummaryAggregator 生成全市场汇总报告。
+    也接受逐股结果列表（旧接口），会先折叠为累加器。
+    """
+    if not isinstance(summary, SummaryAggregator):
+        aggregator = SummaryAggregator([name for name, _ in INDICATORS])
+        for stock_data in summary:
+            aggregator.add(stock_data)
+        summary = aggregator
 
     # 生成报告内容
     content = "# 全市场技术指标汇总分析\n\n"
     content += "| 指标名称 | 总出现次数 | 胜率 | 平均5日收益 |\n"
     content += "|----------|------------|------|-------------|\n"
 
-    for name, data in summary.items():
-        total = data['total_signals']
+    for name in summary.data:
+        data = summary.get(name, MAIN_HORIZON)
+        total = data['count']
         if total == 0:
             row = f"| {name} | 0 | N/A | N/A |"
         else:
-            win_rate = data['win_count'] / total
-            avg_return = data['total_return'] / total
-            row = f"| {name} | {total} | {win_rate * 100:.2f}% | {avg_return * 100:.2f}% |"
+            row = f"| {name} | {total} | {data['win_rate'] * 100:.2f}% | {data['avg_return'] * 100:.2f}% |"
         content += row + "\n"
 
+    content += "\n## 不同持有期统计\n\n"
+    content += "| 指标名称 | 持有天数 | 总出现次数 | 胜率 | 平均收益 | 收益标准差 |\n"
+    content += "|----------|----------|------------|------|----------|------------|\n"
+    for name in summary.data:
+        for days in summary.horizons(name):
+            data = summary.get(name, days)
+            total = data['count']
+            if total == 0:
+                row = f"| {name} | {days} | 0 | N/A | N/A | N/A |"
+            else:
+                row = (f"| {name} | {days} | {total} | {data['win_rate'] * 100:.2f}% | "
+                       f"{data['avg_return'] * 100:.2f}% | {data['std'] * 100:.2f}% |")
+            content += row + "\n"
+
     # 保存文件
     filepath = os.path.join(output_dir, "全市场汇总分析.md")
     with open(filepath, 'w', encoding='utf-8') as f:
         f.write(content)
 
 
-def main():
-    with open('config.json', 'r', encoding='utf-8') as f:
+# 检测函数由 indicators.register_detector 注册
+INDICATORS = get_indicators()
+
+
+def analyze_stock(code, data_dir, output_dir, horizons=HORIZONS, timeframe=DAILY, resample_dir=None, instrument=False,
+                  adjust=None, master_path=DEFAULT_PATH):
+    """
+    加载单只股票、计算全部指标统计并写出个股报告。
+    timeframe 非日线时在合成的周期 K 线上检测，持有期按 K 线根数计；adjust 为复权方式（None 取存储的默认方式），
+    master_path 为定位 CSV 文件所用的代码主表。
+    返回精简结果 {'code', 'name', 'results', 'error'} 供主进程汇总，instrument 为真时附带 'trace'。
+    """
+    trace = new_trace(instrument, code)
+    result = _analyze_stock(code, data_dir, output_dir, horizons, timeframe, resample_dir, trace, adjust, master_path)
+    if trace.enabled:
+        result['trace'] = trace.finish().to_dict()
+    return result
+
+
+def _analyze_stock(code, data_dir, output_dir, horizons, timeframe, resample_dir, trace, adjust=None,
+                   master_path=DEFAULT_PATH):
+    try:
+        with trace.span('load'):
+            df = load_bars(data_dir, code, timeframe=timeframe, cache_dir=resample_dir, adjust=adjust,
+                           master_path=master_path)
+        if df is None:
+            return {'code': code, 'error': f"未找到股票 {code} 的数据文件"}
+        if df.empty:
+            return {'code': code, 'error': f"股票 {code} 数据为空"}
+        trace.count('rows', len(df))
+
+        stock_name = df.iloc[0]['stock_name']
+        features = FeatureFrame(df)  # 各指标共享滞后、均线、EMA 等派生序列
+        with trace.span('stats'):
+            forward = forward_profits(features, horizons)  # 各持有期收益矩阵每只股票只算一次
+        results = []
+        for name, func in INDICATORS:
+            # detect 阶段含派生特征的计算，stats 阶段只剩持有期收益统计
+            with trace.span('stats'):
+                stats = calculate_indicator_stats(features, trace.wrap('detect', func), horizons, forward)
+            results.append(indicator_result(name, stats))
+            trace.count('signals', results[-1]['count'])
+
+        with trace.span('report'):
+            generate_report(code, stock_name, results, output_dir)
+        return {'code': code, 'name': stock_name, 'results': results}
+    except Exception as e:
+        return {'code': code, 'error': f"处理 {code} 时发生错误：{str(e)}"}
+
+
+def iter_analysis(stock_codes, data_dir, output_dir, workers=1, chunksize=16, horizons=HORIZONS,
+                  timeframe=DAILY, resample_dir=None, instrument=False, adjust=None, master_path=DEFAULT_PATH):
+    """按配置串行或多进程执行分析，逐个产出结果（多进程时顺序不定）"""
+    task = partial(analyze_stock, data_dir=data_dir, output_dir=output_dir, horizons=horizons,
+                   timeframe=timeframe, resample_dir=resample_dir, instrument=instrument, adjust=adjust,
+                   master_path=master_path)
+    if workers <= 1:
+        yield from map(task, stock_codes)
+        return
+    with Pool(processes=workers) as pool:
+        yield from pool.imap_unordered(task, stock_codes, chunksize=chunksize)
+
+
+def iter_panel_analysis(stock_codes, data_dir, output_dir, horizons=HORIZONS, timeframe=DAILY, resample_dir=None,
+                        adjust=None, master_path=DEFAULT_PATH):
+    """截面引擎：整体加载全市场矩阵计算，再逐股写出报告，产出与 iter_analysis 相同的结果"""
+    panel = Panel.load(data_dir, stock_codes, timeframe=timeframe, cache_dir=resample_dir, adjust=adjust,
+                       master_path=master_path)
+    for result in analyze_panel(panel, INDICATORS, horizons):
+        generate_report(result['code'], result['name'], result['results'], output_dir)
+        yield result
+    loaded = set(panel.codes)
+    for code in stock_codes:
+        if code not in loaded:
+            yield {'code': code, 'error': f"未找到股票 {code} 的数据文件"}
+
+
+def iter_with_cache(stock_codes, data_dir, output_dir, cache, compute, trace=NULL_TRACE, master_path=DEFAULT_PATH):
+    """
+    先产出缓存命中的结果（个股报告缺失时用缓存结果重写），
+    其余股票交给 compute(codes) 计算，成功的结果写入缓存。
+    """
+    with trace.span('fingerprint'):
+        fingerprints = {code: fingerprint(data_dir, code, master_path) for code in stock_codes}
+    misses = []
+    for code in stock_codes:
+        with trace.span('cache_lookup'):
+            result = cache.get(code, fingerprints[code])
+        if result is None:
+            misses.append(code)
+            continue
+        trace.count('cache_hits')
+        if not os.path.exists(os.path.join(output_dir, f"{code}-{result['name']}.md")):
+            generate_report(code, result['name'], result['results'], output_dir)
+        yield result
+
+    for result in compute(misses):
+        if 'error' not in result:
+            cache.put(result['code'], fingerprints[result['code']], {k: v for k, v in result.items() if k != 'trace'})
+        yield result
+    cache.evict()
+
+
+def run_signature(horizons, timeframe=DAILY, adjust=None):
+    """决定分析结果的配置签名：指标集、持有期、周期与复权方式"""
+    signature = analysis_signature(INDICATORS, horizons)
+    if timeframe != DAILY:
+        signature += f":{timeframe}"  # 周期 K 线由日线合成，日线指纹不变时结果也不变
+    if adjust:
+        signature += f":{adjust}"  # 因子表更新会改写 meta.json，日线指纹随之变化
+    return signature
+
+
+def main(config_path='config.json', shard=None):
+    """
+    shard 为 (i, N) 时只分析该分片的股票：个股报告照常写入 output_dir，
+    汇总累加器写入 shard_dir 的部分结果，由 merge_shards 合并为全市场汇总报告。
+    """
+    with open(config_path, 'r', encoding='utf-8') as f:
         config = json.load(f)
 
-    stock_codes = config['stock_codes']
+    universe = config['stock_codes']
+    stock_codes = select_shard(universe, shard)
     data_dir = config['data_dir']
     output_dir = config['output_dir']
+    workers = config.get('workers', 1) or os.cpu_count()  # 0 表示使用全部核心
+    chunksize = config.get('chunksize', 16)
+    horizons = tuple(sorted(set(config.get('horizons', HORIZONS)) | {MAIN_HORIZON}))
+    engine = config.get('engine', 'stock')  # stock: 逐股；panel: 全市场截面矩阵
+    timeframe = parse_timeframe(config.get('timeframe', DAILY))  # daily / weekly / monthly / N 日
+    resample_dir = config.get('resample_dir')
+    adjust = config.get('adjust')  # qfq / hfq / none，null 表示取下载时配置的默认复权方式
+    master_path = resolve_master_path(config, config_path)  # 定位 CSV 文件所用的代码主表
+    instrument = config.get('instrument', False)  # 写出分阶段耗时、计数与峰值内存的运行报告
+    shard_dir = config.get('shard_dir') or DEFAULT_SHARD_DIR
+    signature = run_signature(horizons, timeframe, adjust)
     os.makedirs(output_dir, exist_ok=True)
-
-    indicators = [
-        ('三阳开泰', detect_sanyang_kaitai),
-        ('出水芙蓉', detect_chushui_furong),
-        ('旭日东升', detect_xuri_dongsheng),
-        ('多方炮', detect_duofangpao),
-        ('早晨之星', detect_morning_star),
-        ('MACD金叉', detect_macd_golden_cross),
-    ]
-
-    # 添加总进度条
+    report = RunReport('analyze', output_dir, "分析运行报告" + (f"_{shard_label(shard)}" if shard else ""), instrument)
+    if shard:
+        mark_running(shard_dir, 'analyze', shard, universe, signature)
+        print(f"分片 {shard[0]}/{shard[1]}：{len(stock_codes)}/{len(universe)} 只股票")
+    errors = []
+
+    # 逐股结果到达即并入汇总，不在内存中保留全部结果
+    summary = SummaryAggregator([name for name, _ in INDICATORS])
     with tqdm(total=len(stock_codes),
               desc="🔄 股票分析进度",
               bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}]") as pbar:
-
-        for idx, code in enumerate(stock_codes, 1):
-            pattern = os.path.join(data_dir, f"{code}-*.csv")
-            files = glob(pattern)
-
-            # 更新进度条描述
-            pbar.set_postfix_str(f"当前股票: {code}")
-
-            if not files:
-                tqdm.write(f"\n⚠️ 未找到股票 {code} 的数据文件")
-                pbar.update(1)
-                continue
-
-            filepath = files[0]
-            try:
-                df = pd.read_csv(filepath)
-                df['日期'] = pd.to_datetime(df['日期'])
-                df = df.sort_values('日期').reset_index(drop=True)
-
-                # if df.empty:
-                #     tqdm.write(f"\n⚠️ 股票 {code} 数据为空")
-                #     pbar.update(1)
-                #     continue
-                #
-                # stock_name = df.iloc[0]['stock_name']
-                #
-                # # 分析指标（移除内层进度条）
-                # results = []
-                # for name, func in indicators:
-                #     count, win_rate, avg_ret = calculate_indicator_stats(df, func)
-                #     results.append({
-                #         'name': name,
-                #         'count': count,
-                #         'win_rate': win_rate,
-                #         'avg_return': avg_ret
-                #     })
-                #
-                # generate_report(code, stock_name, results, output_dir)
-                #
-                # # 更新进度信息
-                # pbar.set_postfix_str(f"已完成: {code}-{stock_name[:4]}...")
-
-            except Exception as e:
-                tqdm.write(f"\n❌ 处理 {code} 时发生错误：{str(e)}")
-            finally:
-                pbar.update(1)
+        if engine == 'panel':
+            compute = partial(iter_panel_analysis, data_dir=data_dir, output_dir=output_dir, horizons=horizons,
+                              timeframe=timeframe, resample_dir=resample_dir, adjust=adjust, master_path=master_path)
+        else:
+            compute = partial(iter_analysis, data_dir=data_dir, output_dir=output_dir, workers=workers,
+                              chunksize=chunksize, horizons=horizons, timeframe=timeframe, resample_dir=resample_dir,
+                              instrument=instrument, adjust=adjust, master_path=master_path)
+        if config.get('cache_dir'):
+            cache = AnalysisCache(config['cache_dir'], signature, config.get('cache_max_mb', 512))
+            results = iter_with_cache(stock_codes, data_dir, output_dir, cache, compute, report.main, master_path)
+        else:
+            results = compute(stock_codes)
+        for result in results:
+            if 'trace' in result:
+                report.add(result.pop('trace'), result.get('error'))
+            if 'error' in result:
+                errors.append({'code': result['code'], 'error': result['error']})
+                tqdm.write(f"\n⚠️ {result['error']}")
+            else:
+                summary.add(result)
+                pbar.set_postfix_str(f"已完成: {result['code']}-{result['name'][:4]}...")
+            pbar.update(1)
 
     print(f"\n✅ 分析完成！报告已保存至：{os.path.abspath(output_dir)}")
 
-    all_results = []  # 新增：存储所有股票结果
-
-    with tqdm(total=len(stock_codes), desc="分析进度") as pbar:
-        for code in stock_codes:
-            # ... [保持原有文件加载代码不变]
-
-            stock_name = df.iloc[0]['stock_name']
-            stock_result = {
-                'code': code,
-                'name': stock_name,
-                'results': []
-            }
-
-            for name, func in indicators:
-                profits = calculate_indicator_stats(df, func)  # 修改为获取明细
-                stock_result['results'].append({
-                    'name': name,
-                    'profits': profits
-                })
-
-            generate_report(code, stock_name, [
-                {
-                    'name': res['name'],
-                    'count': len(res['profits']),
-                    'win_rate': sum(1 for p in res['profits'] if p > 0) / len(res['profits']) if res['profits'] else 0,
-                    'avg_return': sum(res['profits']) / len(res['profits']) if res['profits'] else 0
-                }
-                for res in stock_result['results']
-            ], output_dir)
-
-            all_results.append(stock_result)
-            pbar.update(1)
+    if shard:
+        path = write_partial(shard_dir, 'analyze', shard, universe, {
+            'stocks': len(stock_codes),
+            'errors': sorted(errors, key=lambda item: item['code']),
+            'summary': summary.to_dict(),
+        }, signature=signature)
+        print(f"\n分片汇总已写入：{path}，全部分片完成后运行 python cli.py merge analyze 生成全市场汇总报告")
+    else:
+        # 生成汇总报告
+        with report.span('summary_report'):
+            generate_summary_report(summary, output_dir)
+        print(f"\n全市场汇总报告已生成：{os.path.join(output_dir, '全市场汇总分析.md')}")
+
+    if instrument:
+        report.profile_slowest(config.get('profile_slowest', 0), partial(
+            analyze_stock, data_dir=data_dir, output_dir=output_dir, horizons=horizons,
+            timeframe=timeframe, resample_dir=resample_dir, adjust=adjust, master_path=master_path))
+        print(f"运行报告已生成：{report.write()}")
+
+
+def merge_shards(config_path='config.json'):
+    """合并全部分片的汇总累加器，生成与单机运行相同的全市场汇总报告；分片不完整时返回 False"""
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
 
-    # 生成汇总报告
-    generate_summary_report(all_results, output_dir)
-    print(f"\n全市场汇总报告已生成：{os.path.join(output_dir, '全市场汇总分析.md')}")
+    horizons = tuple(sorted(set(config.get('horizons', HORIZONS)) | {MAIN_HORIZON}))
+    signature = run_signature(horizons, parse_timeframe(config.get('timeframe', DAILY)), config.get('adjust'))
+    partials, problems = load_partials(config.get('shard_dir'), 'analyze', config['stock_codes'], signature)
+    if not report_problems('analyze', problems, f"python cli.py analyze --config {config_path}"):
+        return False
+
+    summary = SummaryAggregator([name for name, _ in INDICATORS])
+    errors = []
+    for partial in partials:
+        summary.merge(SummaryAggregator.from_dict(partial['summary']))
+        errors.extend(partial['errors'])
+    for item in sorted(errors, key=lambda item: item['code']):
+        print(f"⚠️ {item['error']}")
+
+    os.makedirs(config['output_dir'], exist_ok=True)
+    generate_summary_report(summary, config['output_dir'])
+    print(f"已合并 {len(partials)} 个分片（{summary.stocks} 只股票），"
+          f"全市场汇总报告：{os.path.join(config['output_dir'], '全市场汇总分析.md')}")
+    return True
 
 
 if __name__ == '__main__':